@@ -1,12 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework import permissions
-from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
-schema_view = get_schema_view(
+from main.media import media_urlpatterns
+from main.openapi import get_cached_schema_view
+
+schema_view = get_cached_schema_view(
     openapi.Info(
         title="BookStore API",
         default_version='v1',
@@ -15,7 +15,7 @@ schema_view = get_schema_view(
         contact=openapi.Contact(email="contact@bookstore.com"),
         license=openapi.License(name="BSD License"),
     ),
-    public=True,
+    name='bookstore-openapi',
     permission_classes=(permissions.AllowAny,),
 )
 
@@ -24,10 +24,9 @@ urlpatterns = [
     path('api/', include('main.urls', namespace='main')),
     
     # Swagger URLs
-    path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
+    path('swagger.<str:format>', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT) 
\ No newline at end of file
+urlpatterns += media_urlpatterns() 
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""
+Compare the DRF (sync) catalog views with the native async ones under
+concurrent load, driving the ASGI application in-process.
+
+    python -m benchmarks.async_reads --books 2000 --requests 400 --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import (
+    Timer,
+    access_token,
+    create_account,
+    populate_catalog,
+    print_table,
+    setup_django,
+    summarize,
+    test_database,
+    unthrottled,
+)
+
+
+async def asgi_get(application, path, query='', token=None):
+    headers = [(b'host', b'testserver')]
+    if token:
+        headers.append((b'authorization', f'Bearer {token}'.encode()))
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'headers': headers,
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    status = None
+    request_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Django listens for a disconnect while the view runs; never send one
+        await disconnected.wait()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await application(scope, receive, send)
+    return status
+
+
+async def run_load(application, path, query, token, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            status = await asgi_get(application, path, query, token)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+
+    with Timer() as timer:
+        await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, timer.elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.asgi import get_asgi_application
+    from django.test.utils import override_settings
+
+    # Measure the views, not the anonymous response cache
+    caches = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'responses': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        'throttle': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    }
+    with override_settings(CACHES=caches), unthrottled(), test_database():
+        account = create_account()
+        books = populate_catalog(account, books=args.books)
+        account.wishlist.books.add(*books[:200])
+        token = access_token(account)
+        application = get_asgi_application()
+
+        endpoints = [
+            ('book list', '/books/', 'page_size=24', None),
+            ('book list search', '/books/', 'search=python&ordering=-price', None),
+            ('book detail', f'/books/{books[0].pk}/', '', None),
+            ('my books', '/books/mine/', 'page_size=24', token),
+            ('wishlist', '/accounts/my-wish-list/', '', token),
+        ]
+        rows = []
+        for name, path, query, endpoint_token in endpoints:
+            for label, prefix in [('sync', ''), ('async', '/async')]:
+                # Warm up (imports, query plans, prepared statements)
+                asyncio.run(run_load(application, prefix + path, query, endpoint_token, 10, 5))
+                latencies, elapsed, errors = asyncio.run(run_load(
+                    application, prefix + path, query, endpoint_token, args.requests, args.concurrency
+                ))
+                rows.append(summarize(f'{name} [{label}]', latencies, elapsed, errors))
+        print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Shared helpers for the benchmark scripts. Every benchmark runs against a
+throwaway test database, never against db.sqlite3.
+
+Run a benchmark from the project root, e.g.::
+
+    python -m benchmarks.async_reads --books 2000 --requests 500
+"""
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    from django.test.utils import (
+        setup_databases,
+        setup_test_environment,
+        teardown_databases,
+        teardown_test_environment,
+    )
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def unthrottled():
+    """Settings override lifting every request throttle (see main.throttling)"""
+    from django.conf import settings
+    from django.test.utils import override_settings
+    rates = dict.fromkeys(settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {}))
+    return override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=rates))
+
+
+def create_account(username='bench', password='benchpassword123'):
+    from main.models import Account, WishList
+    account = Account.objects.create_user(username=username, email=f'{username}@example.com', password=password)
+    WishList.objects.create(account=account)
+    return account
+
+
+def populate_catalog(account, books=1000, images_per_book=2):
+    """Bulk-insert ``books`` books (and their images) owned by ``account``"""
+    from main.models import Book, Image
+    statuses = ['available', 'sold', 'reserved']
+    created = Book.objects.bulk_create([
+        Book(
+            title=f'Benchmark book {i}',
+            details=f'Details for book {i} about python, gardening and history',
+            price=float(i % 500),
+            status=statuses[i % 3],
+            account=account,
+        )
+        for i in range(books)
+    ], batch_size=500)
+    Image.objects.bulk_create([
+        Image(book=book, is_cover=(n == 0))
+        for book in created
+        for n in range(images_per_book)
+    ], batch_size=500)
+    return created
+
+
+def access_token(account):
+    from rest_framework_simplejwt.tokens import RefreshToken
+    return str(RefreshToken.for_user(account).access_token)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name, latencies, elapsed, errors=0):
+    """One result row: requests/s and latency percentiles in milliseconds"""
+    return {
+        'name': name,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def print_table(rows):
+    columns = ['name', 'requests', 'errors', 'rps', 'p50_ms', 'p99_ms']
+    print('  '.join(f'{column:>12}' if column != 'name' else f'{column:<28}' for column in columns))
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row[column]
+            if column == 'name':
+                cells.append(f'{value:<28}')
+            elif isinstance(value, float):
+                cells.append(f'{value:>12.2f}')
+            else:
+                cells.append(f'{value:>12}')
+        print('  '.join(cells))
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
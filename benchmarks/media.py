@@ -0,0 +1,150 @@
+"""
+Serve one media file through the full WSGI stack with the old
+``django.views.static.serve`` path and with ``main.media.serve_media``.
+
+    python -m benchmarks.media --size-kb 2048 --requests 300
+
+The in-process "server" behaves like gunicorn: when a response comes back
+wrapped in ``wsgi.file_wrapper`` it is sent with ``os.sendfile()``, anything
+else is iterated in Python. Bodies go to a local socket drained by a thread.
+Rows marked "no file_wrapper" are a server without sendfile support.
+"""
+import argparse
+import hashlib
+import os
+import socket
+import tempfile
+import threading
+import types
+
+from benchmarks.common import Timer, print_table, setup_django, summarize
+
+
+class SendfileWrapper:
+    def __init__(self, filelike, block_size=8192):
+        self.filelike = filelike
+
+    def close(self):
+        self.filelike.close()
+
+
+def drain(connection):
+    while connection.recv(1 << 20):
+        pass
+
+
+def run_request(application, environ, sink):
+    """One request; returns the status and the number of body bytes sent"""
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured['status'] = status
+        captured['headers'] = dict(headers)
+
+    result = application(environ, start_response)
+    sent = 0
+    try:
+        if isinstance(result, SendfileWrapper):
+            fileno = result.filelike.fileno()
+            offset = os.lseek(fileno, 0, os.SEEK_CUR)
+            remaining = int(captured['headers']['Content-Length'])
+            while remaining:
+                count = os.sendfile(sink.fileno(), fileno, offset + sent, remaining)
+                if not count:
+                    break
+                sent += count
+                remaining -= count
+        else:
+            for chunk in result:
+                sink.sendall(chunk)
+                sent += len(chunk)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return captured['status'], sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-kb', type=int, default=2048)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--range-kb', type=int, default=64, help='size of the byte range requested')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import RequestFactory, override_settings
+    from django.urls import re_path
+    from django.views.static import serve
+
+    from main.media import media_urlpatterns
+    from main.storage import content_name
+
+    media_root = tempfile.mkdtemp()
+    content = os.urandom(args.size_kb * 1024)
+    name = content_name('books/bench.bin', hashlib.sha256(content).hexdigest())
+    os.makedirs(os.path.join(media_root, os.path.dirname(name)))
+    with open(os.path.join(media_root, name), 'wb') as file:
+        file.write(content)
+
+    urlconf = types.ModuleType('media_benchmark_urls')
+    urlconf.urlpatterns = [
+        re_path(r'^legacy/(?P<path>.*)$', serve, {'document_root': media_root}),
+        *media_urlpatterns(),
+    ]
+
+    legacy, media = f'/legacy/{name}', f'/media/{name}'
+    byte_range = {'HTTP_RANGE': f'bytes=0-{args.range_kb * 1024 - 1}'}
+    # label, path, request headers, MEDIA_SERVE_MODE, server has sendfile
+    scenarios = [
+        ('static.serve no file_wrapper', legacy, {}, 'django', False),
+        ('serve_media no file_wrapper', media, {}, 'django', False),
+        ('static.serve full', legacy, {}, 'django', True),
+        ('serve_media full', media, {}, 'django', True),
+        ('static.serve range', legacy, byte_range, 'django', True),
+        ('serve_media range', media, byte_range, 'django', True),
+        ('static.serve revalidate', legacy, {'HTTP_IF_MODIFIED_SINCE': 'Last-Modified'}, 'django', True),
+        ('serve_media revalidate', media, {'HTTP_IF_NONE_MATCH': 'ETag'}, 'django', True),
+        ('serve_media x-accel', media, {}, 'x-accel-redirect', True),
+    ]
+
+    factory = RequestFactory()
+    sink, peer = socket.socketpair()
+    threading.Thread(target=drain, args=(peer,), daemon=True).start()
+
+    def environ_for(path, headers, sendfile):
+        environ = factory.get(path, **headers).environ
+        if sendfile:
+            environ['wsgi.file_wrapper'] = SendfileWrapper
+        return environ
+
+    rows = []
+    with override_settings(ROOT_URLCONF=urlconf, MEDIA_ROOT=media_root):
+        application = WSGIHandler()
+        for label, path, headers, mode, sendfile in scenarios:
+            with override_settings(MEDIA_SERVE_MODE=mode):
+                if 'revalidate' in label:
+                    # Send back the validator of a first, full response
+                    first = {}
+                    application(environ_for(path, {}, False), lambda status, h, exc_info=None: first.update(h)).close()
+                    headers = {key: first[validator] for key, validator in headers.items()}
+                latencies, errors = [], 0
+                with Timer() as total:
+                    for _ in range(args.requests):
+                        environ = environ_for(path, headers, sendfile)
+                        with Timer() as timer:
+                            status, sent = run_request(application, environ, sink)
+                        latencies.append(timer.elapsed)
+                        errors += not status.startswith(('200', '206', '304'))
+                rows.append(dict(summarize(label, latencies, total.elapsed, errors), status=status, sent=sent))
+    sink.close()
+
+    print(f'{args.size_kb} KB file, {args.requests} sequential requests per row')
+    print_table(rows)
+    print()
+    for row in rows:
+        print(f"{row['name']:<28}  {row['status']:<20}  {row['sent']} body bytes")
+
+
+if __name__ == '__main__':
+    main()
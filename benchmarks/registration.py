@@ -0,0 +1,163 @@
+"""
+Registrations and token logins per second, and per CPU core, through the
+ASGI application in-process with the real password hasher.
+
+    python -m benchmarks.registration --requests 200 --concurrency 16
+
+Rows marked "inline" hash on the request's own thread, as before
+``main.passwords``; the others hash on the pool. Sync views all share
+Django's one thread for sync code under ASGI, so only the async views
+spread the hashing over the pool's threads. "per core" is requests per
+second of process CPU time; the loop stall is the longest time the event
+loop was kept from running while the row's requests were in flight.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import Future
+from unittest import mock
+
+from benchmarks.common import Timer, create_account, print_table, setup_django, summarize, test_database, unthrottled
+
+
+async def asgi_post(application, path, payload):
+    body = json.dumps(payload).encode()
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'headers': [
+            (b'host', b'testserver'),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    status = None
+    request_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await disconnected.wait()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await application(scope, receive, send)
+    return status
+
+
+async def run_load(application, path, payloads, concurrency, expected):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(payload):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            status = await asgi_post(application, path, payload)
+            latencies.append(time.perf_counter() - start)
+            errors += status != expected
+
+    async def monitor():
+        """Longest time the event loop could not run a 5 ms timer on schedule"""
+        stall = 0.0
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stall = max(stall, time.perf_counter() - start - 0.005)
+        return stall
+
+    done = asyncio.Event()
+    watcher = asyncio.create_task(monitor())
+    await asyncio.gather(*(one(payload) for payload in payloads))
+    done.set()
+    return latencies, errors, await watcher
+
+
+def inline_submit(function, *args):
+    """passwords.submit hashing on the calling thread"""
+    future = Future()
+    future.set_result(function(*args))
+    return future
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, help='PASSWORD_HASH_WORKERS (default: one per CPU)')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.asgi import get_asgi_application
+
+    from main import passwords
+
+    settings.PASSWORD_HASH_WORKERS = args.workers
+    settings.PASSWORD_HASH_QUEUE_SIZE = max(args.concurrency, 64)
+    names = (f'user{n}' for n in itertools.count())
+
+    def registrations():
+        return [
+            {'username': name, 'email': f'{name}@example.com',
+             'password': 'benchpassword123', 'confirm_password': 'benchpassword123'}
+            for name in itertools.islice(names, args.requests)
+        ]
+
+    def logins():
+        return [{'username': 'bench', 'password': 'benchpassword123'}] * args.requests
+
+    # label, path, payloads, expected status, hash inline
+    scenarios = [
+        ('register [sync, inline]', '/accounts/register/', registrations, 201, True),
+        ('register [sync]', '/accounts/register/', registrations, 201, False),
+        ('register [async]', '/async/accounts/register/', registrations, 201, False),
+        ('token [sync, inline]', '/token/', logins, 200, True),
+        ('token [sync]', '/token/', logins, 200, False),
+        ('token [async]', '/async/token/', logins, 200, False),
+    ]
+
+    with unthrottled(), test_database():
+        create_account()
+        application = get_asgi_application()
+        rows = []
+        for label, path, payloads, expected, inline in scenarios:
+            with mock.patch.object(passwords, 'submit', inline_submit) if inline else nullcontext():
+                # Warm up (imports, the pool's threads)
+                asyncio.run(run_load(application, path, payloads()[:4], 4, expected))
+                batch = payloads()
+                cpu_start = time.process_time()
+                with Timer() as timer:
+                    latencies, errors, stall = asyncio.run(run_load(application, path, batch, args.concurrency, expected))
+                cpu = time.process_time() - cpu_start
+            rows.append(dict(summarize(label, latencies, timer.elapsed, errors), per_core=len(latencies) / cpu, stall=stall))
+
+    print(f'{args.requests} requests per row, concurrency {args.concurrency}, '
+          f'{passwords.get_executor()._max_workers} hashing threads, {os.cpu_count()} CPUs')
+    print_table(rows)
+    print()
+    for row in rows:
+        print(f"{row['name']:<28}  {row['per_core']:>8.2f} per core  {row['stall'] * 1000:>8.1f} ms longest loop stall")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Render the same books with DRF's generic serializer loop and with the
+compiled BookSerializer path, and check both produce identical bytes.
+
+    python -m benchmarks.serializers --books 10000 --rounds 5
+"""
+import argparse
+import statistics
+
+from benchmarks.common import Timer, create_account, populate_catalog, setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--images', type=int, default=2, help='images per book')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework import serializers
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIRequestFactory
+
+    from main.models import Book
+    from main.serializers import BookSerializer
+
+    class GenericBookSerializer(BookSerializer):
+        def to_representation(self, instance):
+            return serializers.Serializer.to_representation(self, instance)
+
+    with test_database():
+        populate_catalog(create_account(), books=args.books, images_per_book=args.images)
+        books = list(Book.objects.select_related('account').prefetch_related('images'))
+        context = {'request': APIRequestFactory().get('/books/')}
+        renderer = JSONRenderer()
+
+        results = {}
+        for name, serializer_class in [('generic', GenericBookSerializer), ('compiled', BookSerializer)]:
+            timings = []
+            for _ in range(args.rounds):
+                with Timer() as timer:
+                    data = serializer_class(books, many=True, context=context).data
+                timings.append(timer.elapsed)
+            results[name] = (statistics.median(timings), renderer.render(data))
+
+        generic, compiled = results['generic'], results['compiled']
+        print(f'{len(books)} books, {args.images} images each, median of {args.rounds} rounds')
+        print(f'{"generic":<10} {generic[0] * 1000:10.1f} ms')
+        print(f'{"compiled":<10} {compiled[0] * 1000:10.1f} ms  ({generic[0] / compiled[0]:.2f}x)')
+        print('output identical:', generic[1] == compiled[1])
+
+
+if __name__ == '__main__':
+    main()
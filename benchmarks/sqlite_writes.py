@@ -0,0 +1,122 @@
+"""
+Concurrent writes against a file-backed SQLite database, once per SQLite
+profile (see BOOKSTORE_SQLITE_PROFILE in core/settings.py). Threads mix
+book creates, mark-sold and wishlist add/remove/replace calls through the
+real views; the table reports "database is locked" failures and latency.
+
+    python -m benchmarks.sqlite_writes --threads 16 --requests 2000
+
+Each profile runs in its own subprocess, since settings are read once.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import BASE_DIR, print_table, setup_django, summarize
+
+PROFILES = ['basic', 'production']
+
+
+def run_profile(args):
+    setup_django()
+    from django.core.management import call_command
+    from django.db import OperationalError, connections
+    from django.test.utils import setup_test_environment
+    from rest_framework.test import APIClient
+
+    from benchmarks.common import create_account, populate_catalog, unthrottled
+    from main.models import Book
+
+    setup_test_environment()
+    unthrottled().enable()
+    call_command('migrate', verbosity=0)
+    accounts = [create_account(f'writer{n}') for n in range(args.threads)]
+    for account in accounts:
+        populate_catalog(account, books=args.books, images_per_book=0)
+    connections.close_all()
+
+    book_ids = {
+        account.pk: list(Book.objects.filter(account=account).values_list('id', flat=True))
+        for account in accounts
+    }
+    connections.close_all()
+
+    def worker(n):
+        account = accounts[n % len(accounts)]
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(user=account)
+        own_books = book_ids[account.pk]
+        rng = random.Random(n)
+        latencies, errors = [], 0
+        for i in range(args.requests // args.threads):
+            book_id = rng.choice(own_books)
+            kind = i % 5
+            start = time.perf_counter()
+            try:
+                if kind == 0:
+                    response = client.post('/books/', {'title': f'New {n}-{i}', 'price': 10.0}, format='json')
+                elif kind == 1:
+                    response = client.patch(f'/books/{book_id}/mark-sold/')
+                elif kind == 2:
+                    response = client.post('/accounts/my-wish-list/add-books/', {'book_ids': own_books[:20]}, format='json')
+                elif kind == 3:
+                    response = client.post('/accounts/my-wish-list/remove-books/', {'book_ids': own_books[:20]}, format='json')
+                else:
+                    wanted = rng.sample(own_books, min(10, len(own_books)))
+                    response = client.post('/accounts/my-wish-list/replace-books/', {'book_ids': wanted}, format='json')
+                failed = response.status_code >= 500
+            except OperationalError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+        connections.close_all()
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        results = list(executor.map(worker, range(args.threads)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for worker_latencies, _ in results for latency in worker_latencies]
+    errors = sum(worker_errors for _, worker_errors in results)
+    print(json.dumps(summarize(os.environ['BOOKSTORE_SQLITE_PROFILE'], latencies, elapsed, errors)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--books', type=int, default=50, help='books per writer')
+    parser.add_argument('--profile', choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.books < 1:
+        parser.error('--books must be at least 1')
+
+    if args.profile:
+        return run_profile(args)
+
+    rows = []
+    for profile in PROFILES:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                BOOKSTORE_SQLITE_PROFILE=profile,
+                BOOKSTORE_SQLITE_PATH=os.path.join(directory, 'bench.sqlite3'),
+            )
+            command = [
+                sys.executable, '-m', 'benchmarks.sqlite_writes', '--profile', profile,
+                '--threads', str(args.threads), '--requests', str(args.requests), '--books', str(args.books),
+            ]
+            output = subprocess.run(command, env=env, cwd=BASE_DIR, check=True, capture_output=True, text=True)
+            rows.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Many buyers reserving the same book at once, and a seller changing the
+status of many books, against a file-backed SQLite database.
+
+    python -m benchmarks.status_contention --threads 16 --rounds 200 --books 500
+
+"read-modify-write" is the old way: load the book, check it is available,
+save the new status. "compare-and-set" is ``Book.transition``, one
+``UPDATE ... WHERE status = 'available'``. Every round resets one book and
+lets all threads go for it together; "granted" counts the reservations
+that callers were told succeeded, "double" the rounds where more than one
+caller was told so. The bulk rows move ``--books`` books between two
+statuses one book at a time and with one ``BookQuerySet.transition``.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import Timer, create_account, populate_catalog, print_table, setup_django, summarize
+
+
+def run(args):
+    setup_django()
+    from django.core.management import call_command
+    from django.db import OperationalError, connections
+
+    from main.db import serialized_writes
+    from main.models import Book, StatusConflict
+
+    call_command('migrate', verbosity=0)
+    account = create_account()
+    book = Book.objects.create(title='Contended', price=1.0, account=account)
+    catalog = [created.pk for created in populate_catalog(account, books=args.books, images_per_book=0)]
+
+    def read_modify_write():
+        current = Book.objects.get(pk=book.pk)
+        if current.status != 'available':
+            return False
+        current.status = 'reserved'
+        with serialized_writes():
+            current.save(update_fields=['status', 'updated_at'])
+        return True
+
+    def compare_and_set():
+        current = Book.objects.get(pk=book.pk)
+        try:
+            with serialized_writes():
+                current.transition('reserved', 'available')
+        except StatusConflict:
+            return False
+        return True
+
+    def contend(reserve):
+        barrier = threading.Barrier(args.threads)
+        latencies, errors, granted, double = [], 0, 0, 0
+
+        def attempt(_):
+            barrier.wait()
+            start = time.perf_counter()
+            try:
+                won, failed = reserve(), False
+            except OperationalError:
+                won, failed = False, True
+            finally:
+                connections.close_all()
+            return time.perf_counter() - start, won, failed
+
+        with Timer() as total, ThreadPoolExecutor(max_workers=args.threads) as executor:
+            for _ in range(args.rounds):
+                Book.objects.filter(pk=book.pk).update(status='available')
+                results = list(executor.map(attempt, range(args.threads)))
+                winners = sum(won for _, won, _ in results)
+                latencies.extend(latency for latency, _, _ in results)
+                errors += sum(failed for _, _, failed in results)
+                granted += winners
+                double += winners > 1
+        return summarize(reserve.__name__.replace('_', '-'), latencies, total.elapsed, errors), granted, double
+
+    def one_by_one(status):
+        for pk in catalog:
+            try:
+                Book.objects.get(pk=pk).transition(status)
+            except StatusConflict:
+                pass
+
+    def bulk(status):
+        Book.objects.filter(pk__in=catalog).transition(status)
+
+    rows, outcomes = [], []
+    for reserve in (read_modify_write, compare_and_set):
+        row, granted, double = contend(reserve)
+        rows.append(row)
+        outcomes.append((row['name'], granted, double))
+    for move in (one_by_one, bulk):
+        latencies = []
+        with Timer() as total:
+            for status in ('reserved', 'available'):
+                with Timer() as timer:
+                    move(status)
+                latencies.append(timer.elapsed)
+        rows.append(summarize(f'{args.books} books {move.__name__.replace("_", "-")}', latencies, total.elapsed))
+
+    print(f'{args.threads} threads per round, {args.rounds} rounds; bulk rows: 2 moves of {args.books} books')
+    print_table(rows)
+    print()
+    for name, granted, double in outcomes:
+        print(f'{name:<28}  {granted:>6} granted for {args.rounds} books  {double:>6} double reservations')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--books', type=int, default=500, help='books moved by the bulk rows')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['BOOKSTORE_SQLITE_PATH'] = os.path.join(directory, 'bench.sqlite3')
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
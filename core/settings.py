@@ -1,3 +1,4 @@
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -33,7 +34,6 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt',
     'drf_yasg',
     'corsheaders',
-    'django_cleanup.apps.CleanupConfig',
     'django_filters'
 ]
 
@@ -49,17 +49,52 @@ SWAGGER_SETTINGS = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'main.authentication.StatelessJWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 12  # Har sahifada nechta element chiqsin
-
+    'PAGE_SIZE': 12,  # Har sahifada nechta element chiqsin
+    # Token buckets, see main/throttling.py
+    'DEFAULT_THROTTLE_CLASSES': (
+        'main.throttling.IPRateThrottle',
+        'main.throttling.AccountRateThrottle',
+        'main.throttling.SearchRateThrottle',
+        'main.throttling.WriteRateThrottle',
+        'main.throttling.ScopedRateThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'ip': '600/min',
+        'account': '600/min',
+        'search': '60/min',
+        'write': '120/min',
+        'register': '10/hour',
+        'token': '30/min',
+    },
+    # Reverse proxies in front of the app. Throttles key anonymous clients
+    # on the address the outermost of them saw; with 0, X-Forwarded-For is
+    # ignored (a client could set it to anything) and REMOTE_ADDR is used.
+    'NUM_PROXIES': int(os.environ.get('BOOKSTORE_NUM_PROXIES', '0')),
 }
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=360),
+    "TOKEN_OBTAIN_SERIALIZER": "main.serializers.AccountTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "main.serializers.AccountTokenRefreshSerializer",
 }
+
+AUTHENTICATION_BACKENDS = ['main.authentication.AccountBackend']
+
+# PBKDF2 runs on a pool of PASSWORD_HASH_WORKERS threads (None: one per CPU)
+# with at most PASSWORD_HASH_QUEUE_SIZE hashes in flight; more get a 503
+PASSWORD_HASH_WORKERS = None
+PASSWORD_HASH_QUEUE_SIZE = 64
+
+# Stateless JWT authentication (main/authentication.py): users built from
+# token claims are kept in a per-process LRU. Token revocations reach other
+# processes within AUTH_USER_CACHE_TTL seconds.
+AUTH_USER_CACHE_SIZE = 1024
+AUTH_USER_CACHE_TTL = 60
+AUTH_TOKEN_VERSION_CACHE_ALIAS = 'default'
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -67,6 +102,7 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # yangi
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -95,13 +131,158 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# BOOKSTORE_SQLITE_PROFILE picks how SQLite runs:
+#   production (default) - WAL journal, tuned pragmas applied on connect,
+#       persistent connections, and write transactions that take the write
+#       lock up front (BEGIN IMMEDIATE) so they wait on busy_timeout instead
+#       of failing with "database is locked" when upgrading from a read.
+#       Hot write endpoints also queue on a per-process lock (main/db.py).
+#   basic - Django's stock SQLite settings.
+# BOOKSTORE_SQLITE_PATH overrides the database file.
+
+SQLITE_PATH = os.environ.get('BOOKSTORE_SQLITE_PATH', BASE_DIR / 'db.sqlite3')
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',        # durable at checkpoints; safe with WAL
+    'busy_timeout': 20000,          # ms
+    'cache_size': -20000,           # KiB, ~20 MB page cache per connection
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+SQLITE_PROFILES = {
+    'basic': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': SQLITE_PATH,
+    },
+    'production': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': SQLITE_PATH,
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+}
+
+SQLITE_PROFILE = os.environ.get('BOOKSTORE_SQLITE_PROFILE', 'production')
+
 DATABASES = {
+    'default': SQLITE_PROFILES[SQLITE_PROFILE],
+}
+
+# Read replicas: BOOKSTORE_DB_REPLICAS=N adds SQLite replicas replica1..N
+# next to the primary file. Locally `manage.py sync_replicas` stands in for
+# replication; under tests every replica mirrors default. Catalog views read
+# from a replica unless the user wrote within REPLICA_STICKINESS_SECONDS.
+DATABASE_REPLICAS = [f'replica{n}' for n in range(1, int(os.environ.get('BOOKSTORE_DB_REPLICAS', 0)) + 1)]
+for alias in DATABASE_REPLICAS:
+    DATABASES[alias] = dict(DATABASES['default'], NAME=f'{SQLITE_PATH}.{alias}', TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+REPLICA_STICKINESS_SECONDS = 5
+
+SERIALIZE_SQLITE_WRITES = SQLITE_PROFILE == 'production'
+SQLITE_WRITE_LOCK_TIMEOUT = SQLITE_PRAGMAS['busy_timeout'] / 1000
+
+# Caches
+# The 'responses' alias backs the anonymous book list/detail response cache.
+# BOOKSTORE_RESPONSE_CACHE picks the backend: locmem (default), file or redis.
+# 'redis' needs the redis package and any Redis-protocol server (redis,
+# valkey, keydb...) listening at BOOKSTORE_REDIS_URL.
+
+RESPONSE_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bookstore-responses',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('BOOKSTORE_RESPONSE_CACHE_DIR', BASE_DIR / '.cache' / 'responses'),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('BOOKSTORE_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+# Throttle buckets: locmem limits each worker process on its own,
+# BOOKSTORE_THROTTLE_CACHE=redis shares them between all workers
+THROTTLE_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bookstore-throttle',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('BOOKSTORE_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+# Users who just wrote read from the primary for REPLICA_STICKINESS_SECONDS.
+# With locmem only the worker that took the write knows that, and the user's
+# next request may land on another worker and read a stale replica; run more
+# than one worker with replicas only with BOOKSTORE_REPLICA_STICKINESS_CACHE=redis
+REPLICA_STICKINESS_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bookstore-replica-stickiness',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('BOOKSTORE_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': RESPONSE_CACHE_BACKENDS[os.environ.get('BOOKSTORE_RESPONSE_CACHE', 'locmem')],
+    'throttle': THROTTLE_CACHE_BACKENDS[os.environ.get('BOOKSTORE_THROTTLE_CACHE', 'locmem')],
+    'replica-stickiness': REPLICA_STICKINESS_CACHE_BACKENDS[
+        os.environ.get('BOOKSTORE_REPLICA_STICKINESS_CACHE', 'locmem')
+    ],
 }
 
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = 300
+THROTTLE_CACHE_ALIAS = 'throttle'
+REPLICA_STICKINESS_CACHE_ALIAS = 'replica-stickiness'
+
+# Price bucket boundaries for the ?facets=price counts on /books/
+BOOK_PRICE_FACET_BUCKETS = [0, 10, 25, 50, 100, 250]
+
+# Resized image variants (thumbnail, medium, webp) are built after upload
+# by a background thread pool of this size
+IMAGE_VARIANT_WORKERS = 2
+IMAGE_VARIANTS_ASYNC = True
+
+# archive_deleted_books moves books soft-deleted this many days ago into the
+# archive table, BOOK_ARCHIVE_BATCH_SIZE per transaction, pausing
+# BOOK_ARCHIVE_PAUSE seconds between batches
+BOOK_ARCHIVE_RETENTION_DAYS = 30
+BOOK_ARCHIVE_BATCH_SIZE = 500
+BOOK_ARCHIVE_PAUSE = 0.05
+
+# Media files of deleted or replaced rows are queued in the same transaction
+# and removed by `manage.py process_file_deletions`, FILE_DELETION_BATCH_SIZE
+# per transaction; a file failing FILE_DELETION_MAX_ATTEMPTS times is left
+# in the queue for inspection
+FILE_DELETION_BATCH_SIZE = 500
+FILE_DELETION_MAX_ATTEMPTS = 5
+
+# The OpenAPI schema is generated once (manage.py generate_openapi_schema, or
+# on the first request when the code changed) and stored here
+OPENAPI_SCHEMA_DIR = BASE_DIR / 'openapi'
+OPENAPI_SCHEMA_MAX_AGE = 60 * 60 * 24
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -143,6 +324,23 @@ else:
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are stored once per content hash and reference counted
+# (see main/storage.py)
+STORAGES = {
+    'default': {'BACKEND': 'main.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# How main.media.serve_media sends files under MEDIA_URL:
+#   django - FileResponse (sendfile() through the WSGI server's file wrapper)
+#   x-sendfile - an X-Sendfile header for Apache/lighttpd
+#   x-accel-redirect - an X-Accel-Redirect to MEDIA_ACCEL_REDIRECT_PREFIX, an
+#       nginx `internal` location aliased to MEDIA_ROOT
+MEDIA_SERVE_MODE = os.environ.get('BOOKSTORE_MEDIA_SERVE_MODE', 'django')
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Browser cache lifetime for media whose names are not content hashes
+MEDIA_CACHE_MAX_AGE = 60 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
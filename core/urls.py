@@ -1,15 +1,22 @@
 from django.contrib import admin
 from django.urls import path
 from rest_framework import permissions
-from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
-from rest_framework_simplejwt.views import token_refresh, token_obtain_pair
-from django.conf.urls.static import static
-from django.conf import settings
+from rest_framework_simplejwt.views import token_refresh
 
+from main.media import media_urlpatterns
+from main.openapi import get_cached_schema_view
 from main.views import *
+from main.async_views import (
+    AsyncBookDetailView,
+    AsyncBookListView,
+    AsyncMyBookListView,
+    AsyncRegisterView,
+    AsyncTokenObtainView,
+    AsyncWishListView,
+)
 
-schema_view = get_schema_view(
+schema_view = get_cached_schema_view(
     openapi.Info(
         title="Book Store API",
         default_version='v1',
@@ -18,17 +25,18 @@ schema_view = get_schema_view(
         contact=openapi.Contact(email="vohobjonovsardorbek2005@gmail.com"),
         license=openapi.License(name="BSD License"),
     ),
-    public=True,
     permission_classes=(permissions.AllowAny,),
 )
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('docs/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('docs/redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('docs/openapi.<str:format>', schema_view.without_ui(cache_timeout=0), name='schema-json'),
 ]
 
 urlpatterns += [
-    path('token/', token_obtain_pair),
+    path('token/', AccountTokenObtainPairView.as_view()),
     path('token/refresh/', token_refresh),
 ]
 
@@ -38,13 +46,31 @@ urlpatterns += [
     path('accounts/my-wish-list/', WishListAPIVIew.as_view()),
     path('accounts/<int:pk>/wishlist-add-book/', WishListAddBookAPIView.as_view()),
     path('accounts/<int:pk>/wishlist-remove-book/', WishListRemoveBookAPIView.as_view()),
+    path('accounts/my-wish-list/add-books/', WishListAddBooksAPIView.as_view()),
+    path('accounts/my-wish-list/remove-books/', WishListRemoveBooksAPIView.as_view()),
+    path('accounts/my-wish-list/replace-books/', WishListReplaceBooksAPIView.as_view()),
 ]
 
 urlpatterns += [
     path('books/', BookListCreateAPIView.as_view()),
+    path('books/bulk/', BookBulkCreateAPIView.as_view()),
+    path('books/export.<str:export_format>', BookExportAPIView.as_view()),
     path('books/<int:pk>/', BookRetrieveUpdateDestroyAPIView.as_view()),
     path('books/mine/', MyBookListAPIView.as_view()),
+    path('books/mine/export.<str:export_format>', MyBookExportAPIView.as_view()),
     path('books/<int:pk>/mark-sold/', BookMarkSoldAPIview.as_view()),
+    path('books/<int:pk>/status/', BookStatusAPIView.as_view()),
+    path('books/mine/status/', BookBulkStatusAPIView.as_view()),
+]
+
+# Native async read path and password endpoints, for ASGI deployments
+urlpatterns += [
+    path('async/books/', AsyncBookListView.as_view()),
+    path('async/books/<int:pk>/', AsyncBookDetailView.as_view()),
+    path('async/books/mine/', AsyncMyBookListView.as_view()),
+    path('async/accounts/my-wish-list/', AsyncWishListView.as_view()),
+    path('async/accounts/register/', AsyncRegisterView.as_view()),
+    path('async/token/', AsyncTokenObtainView.as_view()),
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+urlpatterns += media_urlpatterns()
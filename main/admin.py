@@ -2,6 +2,18 @@ from django.contrib import admin
 from .models import *
 
 admin.site.register(Account)
-admin.site.register(Book)
+
+
+@admin.register(Book)
+class BookAdmin(admin.ModelAdmin):
+    list_display = ['title', 'account', 'price', 'status', 'is_deleted']
+    list_filter = ['status', 'is_deleted']
+
+    def get_queryset(self, request):
+        # Soft-deleted books stay reachable here so they can be restored
+        return Book.all_with_deleted.select_related('account')
+
+
 admin.site.register(Image)
 admin.site.register(WishList)
+admin.site.register(ArchivedBook)
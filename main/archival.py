@@ -0,0 +1,126 @@
+"""
+Archival of soft-deleted books.
+
+``Book.soft_delete()`` only flips a flag, so deleted books, their images,
+wishlist links and media files would otherwise stay forever. Books deleted
+before the retention cutoff are moved into ``ArchivedBook`` in batches:
+each batch is one short write transaction, queued with the process's other
+SQLite writers (see ``serialized_writes``), that copies the rows into the
+archive and deletes the wishlist links, image rows and books.
+
+Media files are queued for deletion (see ``main.file_deletions``) after
+that transaction commits, and the archive row records when they were. An
+interrupted run therefore loses nothing: the next one picks up the books
+still in ``main_book`` and the archived rows whose files are not queued.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import response_cache
+from .db import serialized_writes
+from .file_deletions import queue_file_deletions
+from .models import ArchivedBook, Book, Image, WishList
+
+BOOK_FIELDS = ['id', 'account_id', 'title', 'details', 'price', 'status', 'created_at', 'updated_at', 'deleted_at']
+
+
+def retention_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'BOOK_ARCHIVE_RETENTION_DAYS', 30)
+    return timezone.now() - timedelta(days=days)
+
+
+def archivable_books(cutoff):
+    """Soft-deleted books whose retention period ended before ``cutoff``"""
+    # Rows flagged without soft_delete() have no deleted_at
+    return Book.all_with_deleted.filter(
+        Q(deleted_at__lt=cutoff) | Q(deleted_at__isnull=True, updated_at__lt=cutoff),
+        is_deleted=True,
+    )
+
+
+def image_files(image):
+    """Storage names of an image row's file and its variants"""
+    names = [image['image']] if image['image'] else []
+    names.extend(name for variant, name in image['image_variants'].items() if variant != 'source' and name)
+    return names
+
+
+def archive_batch(book_ids):
+    """Archive the given soft-deleted books in one transaction; returns their ids"""
+    with serialized_writes(), transaction.atomic():
+        # Re-check under the write lock: a book may have been restored since
+        books = list(Book.all_with_deleted.filter(pk__in=book_ids, is_deleted=True).values(*BOOK_FIELDS))
+        archived_ids = [book['id'] for book in books]
+        images = {}
+        for image in Image.objects.filter(book_id__in=archived_ids).values('book_id', 'image', 'image_variants', 'is_cover'):
+            images.setdefault(image['book_id'], []).append(image)
+
+        archive = []
+        for book in books:
+            book_id = book.pop('id')
+            book_images = images.get(book_id, [])
+            archive.append(ArchivedBook(
+                book_id=book_id,
+                images=[{'image': image['image'], 'is_cover': image['is_cover']} for image in book_images],
+                files=[name for image in book_images for name in image_files(image)],
+                **book,
+            ))
+        ArchivedBook.objects.bulk_create(archive, ignore_conflicts=True)
+
+        WishList.books.through.objects.filter(book_id__in=archived_ids).delete()
+        # Plain DELETEs: the per-row delete signals would touch the books being
+        # removed and queue files the archive row already lists. Files and
+        # cached responses are dealt with below instead.
+        Image.objects.filter(book_id__in=archived_ids)._raw_delete(Image.objects.db)
+        Book.all_with_deleted.filter(pk__in=archived_ids)._raw_delete(Book.all_with_deleted.db)
+
+    if archived_ids:
+        response_cache.invalidate_books(archived_ids)
+    return archived_ids
+
+
+def purge_archived_files(batch_size=None):
+    """Queue the deletion of the media still listed by archived books; returns the rows finished"""
+    batch_size = batch_size or getattr(settings, 'BOOK_ARCHIVE_BATCH_SIZE', 500)
+    purged = 0
+    while True:
+        rows = list(
+            ArchivedBook.objects.filter(files_purged_at__isnull=True)
+            .order_by('pk').values_list('pk', 'files')[:batch_size]
+        )
+        if not rows:
+            return purged
+        with transaction.atomic():
+            queue_file_deletions([name for _, files in rows for name in files])
+            ArchivedBook.objects.filter(pk__in=[pk for pk, _ in rows]).update(files_purged_at=timezone.now())
+        purged += len(rows)
+
+
+def archive_deleted_books(cutoff=None, batch_size=None, pause=None, max_batches=None):
+    """
+    Archive every book soft-deleted before ``cutoff`` (default: the
+    retention period ago), ``batch_size`` books per transaction, sleeping
+    ``pause`` seconds between batches so other writers get the database.
+    """
+    cutoff = cutoff or retention_cutoff()
+    batch_size = batch_size or getattr(settings, 'BOOK_ARCHIVE_BATCH_SIZE', 500)
+    pause = getattr(settings, 'BOOK_ARCHIVE_PAUSE', 0) if pause is None else pause
+
+    # Files left behind by an interrupted run come first
+    totals = {'batches': 0, 'archived': 0, 'files_purged': purge_archived_files(batch_size)}
+    while max_batches is None or totals['batches'] < max_batches:
+        book_ids = list(archivable_books(cutoff).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not book_ids:
+            break
+        totals['archived'] += len(archive_batch(book_ids))
+        totals['files_purged'] += purge_archived_files(batch_size)
+        totals['batches'] += 1
+        if pause:
+            time.sleep(pause)
+    return totals
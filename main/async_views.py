@@ -0,0 +1,200 @@
+"""
+Native async versions of the catalog read endpoints.
+
+They reuse the configuration of the DRF views in ``views.py`` (filter
+backends, search, ordering, pagination, query planning) to build the same
+querysets, but run them through Django's async ORM so an ASGI worker never
+has to hop the whole request onto a sync thread. Querysets are only built
+synchronously; every database round trip is awaited.
+
+Registration and ``/token/`` have async versions too: their password
+hashing is awaited on the hashing pool (``main.passwords``) instead of
+holding a worker for the whole PBKDF2 run.
+"""
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .authentication import StatelessJWTAuthentication
+from . import passwords
+from .facets import FacetMixin
+from .models import Book, WishList
+from .routers import ais_sticky, use_replica
+from .views import (
+    AccountTokenObtainPairView,
+    BookListCreateAPIView,
+    BookRetrieveUpdateDestroyAPIView,
+    MyBookListAPIView,
+    RegisterAPIView,
+    WishListAPIVIew,
+)
+
+
+async def aauthenticate(request):
+    """Async equivalent of StatelessJWTAuthentication.authenticate"""
+    authentication = StatelessJWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    validated_token = authentication.get_validated_token(raw_token)
+    return await authentication.aget_user(validated_token)
+
+
+class AsyncReadView(View):
+    """
+    Base class: wraps the Django request in a DRF Request, authenticates it
+    asynchronously and renders the result with DRF's JSONRenderer.
+    """
+    drf_view_class = None
+    requires_authentication = False
+    authenticates = True
+    renderer = JSONRenderer()
+
+    async def get(self, request, *args, **kwargs):
+        return await self.respond(request, kwargs, self.aget_data)
+
+    async def respond(self, request, kwargs, handler, status=200):
+        try:
+            user = await aauthenticate(request) if self.authenticates else None
+            if user is None and self.requires_authentication:
+                raise exceptions.NotAuthenticated()
+            if request.method in SAFE_METHODS and not await ais_sticky(user.pk if user is not None else None):
+                use_replica()
+            parsers = [parser() for parser in self.drf_view_class.parser_classes]
+            self.drf_request = Request(request, parsers=parsers, authenticators=())
+            if user is not None:
+                self.drf_request.user = user
+            self.drf_view = self.make_drf_view(kwargs)
+            # Same token buckets as the sync views (no database involved)
+            self.drf_view.check_throttles(self.drf_request)
+            data = await handler()
+        except Http404 as exc:
+            return self.error_response(exceptions.NotFound(*exc.args))
+        except exceptions.APIException as exc:
+            return self.error_response(exc)
+        return HttpResponse(self.renderer.render(data), content_type='application/json', status=status)
+
+    def make_drf_view(self, kwargs):
+        view = self.drf_view_class()
+        view.request = self.drf_request
+        view.args = ()
+        view.kwargs = kwargs
+        view.format_kwarg = None
+        view.headers = {}
+        return view
+
+    def error_response(self, exc):
+        detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        response = HttpResponse(self.renderer.render(detail), content_type='application/json',
+                                status=exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response.status_code = 401
+            response['WWW-Authenticate'] = StatelessJWTAuthentication().authenticate_header(self.request)
+        if getattr(exc, 'wait', None):
+            response['Retry-After'] = '%d' % math.ceil(exc.wait)
+        return response
+
+    def get_queryset(self):
+        return self.drf_view.filter_queryset(self.drf_view.get_queryset())
+
+    async def aget_data(self):
+        raise NotImplementedError
+
+
+class AsyncListView(AsyncReadView):
+    async def aget_data(self):
+        view = self.drf_view
+        queryset = await self.aget_queryset()
+        paginator = view.paginator
+        names, bounds = view.get_facet_options(self.drf_request) if isinstance(view, FacetMixin) else ((), None)
+        page = await paginator.apaginate_queryset(queryset, self.drf_request, view=view)
+        serializer = view.get_serializer(page, many=True)
+        data = paginator.get_paginated_response(serializer.data).data
+        if names:
+            data['facets'] = await view.aget_facets(names, bounds)
+        return data
+
+    async def aget_queryset(self):
+        return self.get_queryset()
+
+
+class AsyncBookListView(AsyncListView):
+    drf_view_class = BookListCreateAPIView
+
+
+class AsyncMyBookListView(AsyncListView):
+    drf_view_class = MyBookListAPIView
+    requires_authentication = True
+
+
+class AsyncWishListView(AsyncListView):
+    drf_view_class = WishListAPIVIew
+    requires_authentication = True
+
+    async def aget_queryset(self):
+        wishlist_id = await WishList.objects.filter(account=self.drf_request.user).values_list('id', flat=True).afirst()
+        if wishlist_id is None:
+            raise Http404('No WishList matches the given query.')
+        queryset = Book.objects.filter(wishlists=wishlist_id).order_by('title')
+        return self.drf_view.filter_queryset(queryset)
+
+
+class AsyncBookDetailView(AsyncReadView):
+    drf_view_class = BookRetrieveUpdateDestroyAPIView
+
+    async def aget_data(self):
+        view = self.drf_view
+        lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+        try:
+            book = await self.get_queryset().aget(**{view.lookup_field: view.kwargs[lookup_url_kwarg]})
+        except Book.DoesNotExist:
+            raise Http404('No Book matches the given query.')
+        return view.get_serializer(book).data
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncCreateView(AsyncReadView):
+    """POST-only base; like DRF's views it is exempt from CSRF (no cookie auth)"""
+    http_method_names = ['post', 'options']
+    status_code = 201
+
+    async def post(self, request, *args, **kwargs):
+        return await self.respond(request, kwargs, self.apost_data, self.status_code)
+
+    async def apost_data(self):
+        raise NotImplementedError
+
+
+class AsyncRegisterView(AsyncCreateView):
+    drf_view_class = RegisterAPIView
+
+    async def apost_data(self):
+        serializer = self.drf_view.get_serializer(data=self.drf_request.data)
+        # Uniqueness validators query the database
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        encoded_password = await passwords.amake_password(serializer.validated_data['password'])
+        await sync_to_async(serializer.save)(encoded_password=encoded_password)
+        return serializer.data
+
+
+class AsyncTokenObtainView(AsyncCreateView):
+    drf_view_class = AccountTokenObtainPairView
+    authenticates = False
+    status_code = 200
+
+    async def apost_data(self):
+        serializer = self.drf_view.get_serializer(data=self.drf_request.data)
+        # Field checks only: the credentials are checked by avalidate()
+        attrs = serializer.to_internal_value(serializer.initial_data)
+        return await serializer.avalidate(attrs)
@@ -0,0 +1,224 @@
+"""
+Stateless JWT authentication.
+
+Tokens issued by ``/token/`` carry the account's ``username``, ``is_active``
+and ``token_version`` next to the user id. ``StatelessJWTAuthentication``
+trusts those signed claims: it builds ``request.user`` from them (every
+other column is deferred and loads on first access) and keeps the result in
+a small per-process LRU, so an authenticated request normally costs no
+database query at all.
+
+Revocation goes through ``Account.token_version``. ``Account.revoke_tokens``
+bumps it and drops the cached copy from a shared cache; tokens minted with
+an older version are rejected as soon as a process has to look the version
+up again, which is immediately in the revoking process and within
+``AUTH_USER_CACHE_TTL`` seconds everywhere else. Deactivating an account or
+changing its password revokes its tokens too.
+
+Tokens without a ``ver`` claim (minted before this mode, or by
+``RefreshToken.for_user``) fall back to the regular per-request lookup.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import passwords
+from .models import Account
+
+VERSION_CLAIM = 'ver'
+
+# Claims copied onto the user built from a token, besides the user id
+USER_CLAIMS = {'username': 'username', 'is_active': 'is_active', VERSION_CLAIM: 'token_version'}
+
+# Version recorded for deactivated accounts: matches no token
+INACTIVE = -1
+
+
+def add_token_claims(token, user):
+    for claim, field in USER_CLAIMS.items():
+        token[claim] = getattr(user, field)
+    return token
+
+
+class UserCache:
+    """
+    Thread-safe LRU of ``user_id -> user`` whose entries expire after ``ttl``
+    seconds. An entry only serves tokens whose claims it was built from.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, claims):
+        user_id = claims[api_settings.USER_ID_CLAIM]
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires = entry
+            if (expires < time.monotonic() or user.token_version != claims[VERSION_CLAIM]
+                    or user.username != claims['username']):
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        # Each request gets its own copy; views may modify request.user
+        return copy.copy(user)
+
+    def set(self, user):
+        with self._lock:
+            self._entries[user.pk] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return copy.copy(user)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(
+    maxsize=getattr(settings, 'AUTH_USER_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'AUTH_USER_CACHE_TTL', 60),
+)
+
+
+def _version_cache():
+    return caches[getattr(settings, 'AUTH_TOKEN_VERSION_CACHE_ALIAS', 'default')]
+
+
+def _version_key(user_id):
+    return f'auth:token-version:{user_id}'
+
+
+def _current_version(row):
+    if row is None:
+        return None
+    version, is_active = row
+    return version if is_active else INACTIVE
+
+
+def forget_token_version(user_id):
+    """Drop what this process and the shared cache know about ``user_id``"""
+    user_cache.forget(user_id)
+    _version_cache().delete(_version_key(user_id))
+
+
+def get_token_version(user_id):
+    """Current token version of ``user_id``; None if the account is gone"""
+    cache = _version_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        row = Account.objects.filter(pk=user_id).values_list('token_version', 'is_active').first()
+        version = _current_version(row)
+        if version is not None:
+            cache.set(_version_key(user_id), version, user_cache.ttl)
+    return version
+
+
+async def aget_token_version(user_id):
+    cache = _version_cache()
+    version = await cache.aget(_version_key(user_id))
+    if version is None:
+        row = await Account.objects.filter(pk=user_id).values_list('token_version', 'is_active').afirst()
+        version = _current_version(row)
+        if version is not None:
+            await cache.aset(_version_key(user_id), version, user_cache.ttl)
+    return version
+
+
+def check_token_version(claims, current_version):
+    if current_version is None:
+        raise AuthenticationFailed(_('User not found'), code='user_not_found')
+    if current_version == INACTIVE:
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+    if current_version != claims[VERSION_CLAIM]:
+        raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+
+
+def user_from_claims(claims):
+    """An Account instance holding only the token claims; other fields are deferred"""
+    values = {api_settings.USER_ID_FIELD: claims[api_settings.USER_ID_CLAIM]}
+    values.update((field, claims[claim]) for claim, field in USER_CLAIMS.items())
+    fields = [field.attname for field in Account._meta.concrete_fields if field.attname in values]
+    return Account.from_db(DEFAULT_DB_ALIAS, fields, [values[name] for name in fields])
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+
+    def get_claims(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        if any(claim not in validated_token for claim in USER_CLAIMS):
+            return None
+        if not validated_token['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return validated_token
+
+    def get_user(self, validated_token):
+        claims = self.get_claims(validated_token)
+        if claims is None:
+            return super().get_user(validated_token)
+        user_id = claims[api_settings.USER_ID_CLAIM]
+        user = user_cache.get(claims)
+        if user is None:
+            check_token_version(claims, get_token_version(user_id))
+            user = user_cache.set(user_from_claims(claims))
+        return user
+
+    async def aget_user(self, validated_token):
+        """Async twin of get_user for the native async views"""
+        claims = self.get_claims(validated_token)
+        if claims is None:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+            try:
+                user = await Account.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+            except Account.DoesNotExist:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            if not user.is_active:
+                raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+            return user
+        user_id = claims[api_settings.USER_ID_CLAIM]
+        user = user_cache.get(claims)
+        if user is None:
+            check_token_version(claims, await aget_token_version(user_id))
+            user = user_cache.set(user_from_claims(claims))
+        return user
+
+
+class AccountBackend(ModelBackend):
+    """
+    ``ModelBackend`` whose async path never hashes on the event loop: for an
+    unknown username the timing-equalizing hash is awaited on the pool too.
+    """
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(Account.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await Account._default_manager.aget_by_natural_key(username)
+        except Account.DoesNotExist:
+            await passwords.amake_password(password)
+            return None
+        if await user.acheck_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
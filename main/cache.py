@@ -0,0 +1,153 @@
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import parse_http_date_safe
+
+LIST_NAMESPACE = 'books:list'
+
+# Response headers stored alongside the cached body
+CACHED_HEADERS = ('ETag', 'Last-Modified')
+
+
+def detail_namespace(book_id):
+    return f'books:detail:{book_id}'
+
+
+class ResponseCache:
+    """
+    Rendered-response cache for anonymous catalog reads.
+
+    Entries live under a namespace (the whole list, or one book). Each
+    namespace has a random version token stored in the cache; invalidating a
+    namespace replaces its token, which orphans every entry built under the
+    old one without having to know their keys. Entries expire on their own.
+    """
+
+    def __init__(self, alias=None, timeout=None):
+        self.alias = alias or getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+        self.timeout = timeout if timeout is not None else getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _version(self, namespace):
+        key = f'{namespace}:version'
+        token = self.backend.get(key)
+        if token is None:
+            token = uuid.uuid4().hex
+            if not self.backend.add(key, token, None):
+                token = self.backend.get(key, token)
+        return token
+
+    def make_key(self, namespace, request):
+        """Key on host, path, renderer and the normalized query string"""
+        params = sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+            if value != ''
+        )
+        raw = '|'.join([
+            request.build_absolute_uri(request.path),
+            request.accepted_renderer.format,
+            '&'.join(f'{name}={value}' for name, value in params),
+        ])
+        digest = hashlib.sha1(raw.encode()).hexdigest()
+        return f'{namespace}:{self._version(namespace)}:{digest}'
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def set(self, key, response):
+        headers = {header: response[header] for header in CACHED_HEADERS if header in response}
+        entry = (response.rendered_content, response['Content-Type'], headers)
+        self.backend.set(key, entry, self.timeout)
+
+    def invalidate(self, *namespaces):
+        self.backend.set_many(
+            {f'{namespace}:version': uuid.uuid4().hex for namespace in namespaces},
+            None
+        )
+
+    def invalidate_books(self, book_ids=()):
+        """Drop every cached list page plus the detail pages of ``book_ids``"""
+        self.invalidate(LIST_NAMESPACE, *(detail_namespace(book_id) for book_id in book_ids))
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+response_cache = ResponseCache()
+
+
+class CachedResponseMixin:
+    """
+    Serve anonymous ``list``/``retrieve`` calls from ``response_cache``.
+    Authenticated requests are never cached because their rendering may
+    depend on the user.
+    """
+    response_cache = response_cache
+
+    def get_cache_namespace(self):
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if lookup is None:
+            return LIST_NAMESPACE
+        return detail_namespace(lookup)
+
+    def is_cacheable(self, request):
+        return request.method == 'GET' and not request.user.is_authenticated
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        self.cache_key = None
+        self.cache_hit = False
+        if self.is_cacheable(request):
+            self.cache_key = self.response_cache.make_key(self.get_cache_namespace(), request)
+            entry = self.response_cache.get(self.cache_key)
+            if entry is not None:
+                self.cache_hit = True
+                content, content_type, headers = entry
+                response = HttpResponse(content, content_type=content_type, headers=headers)
+                return get_conditional_response(
+                    request,
+                    etag=headers.get('ETag'),
+                    last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+                    response=response,
+                )
+        return handler(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'cache_key', None):
+            if not self.cache_hit and response.status_code == 200:
+                response.render()
+                self.response_cache.set(self.cache_key, response)
+            response['X-Cache'] = 'HIT' if self.cache_hit else 'MISS'
+            patch_vary_headers(response, ['Accept', 'Authorization'])
+        return response
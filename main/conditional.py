@@ -0,0 +1,98 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """Strong ETag over the repr of ``parts``"""
+    raw = '|'.join(repr(part) for part in parts)
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def latest(*timestamps):
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(timestamps) if timestamps else None
+
+
+def not_modified_response(request, etag, last_modified):
+    """Return a 304 if the request's preconditions match, else None"""
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is None:
+        return None
+    set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for ``list`` and ``retrieve``.
+
+    Validators come from one small query over ``updated_at`` columns, so a
+    matching ``If-None-Match`` or ``If-Modified-Since`` returns 304 without
+    loading or serializing any rows. Nested data is covered too: image
+    changes touch ``Book.updated_at`` and the owner's ``Account.updated_at``
+    is part of the validator.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.get_list_validators, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.get_detail_validators, super().retrieve, *args, **kwargs)
+
+    def conditional_response(self, request, get_validators, handler, *args, **kwargs):
+        validators = get_validators()
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        parts, last_modified = validators
+        etag = make_etag(
+            request.get_full_path(),
+            request.accepted_renderer.format,
+            request.user.pk,
+            *parts
+        )
+        response = not_modified_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_validators(response, etag, last_modified)
+        return response
+
+    def get_list_validators(self):
+        """Aggregate validator for the filtered set: max(updated_at) and count"""
+        queryset = self.filter_queryset(self.get_queryset())
+        aggregate = queryset.order_by().aggregate(
+            count=Count('id'),
+            updated_at=Max('updated_at'),
+            account_updated_at=Max('account__updated_at'),
+        )
+        last_modified = latest(aggregate['updated_at'], aggregate['account_updated_at'])
+        return (aggregate['count'], aggregate['updated_at'], aggregate['account_updated_at']), last_modified
+
+    def get_detail_validators(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = (
+            self.get_queryset()
+            .filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            .order_by()
+            .values_list('id', 'updated_at', 'account__updated_at')
+            .first()
+        )
+        if row is None:
+            return None
+        return row, latest(*row[1:])
@@ -0,0 +1,44 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+# SQLite allows one writer at a time. Queuing this process's writers on a
+# lock hands the database over in order, instead of every thread polling
+# in SQLite's busy handler (whose sleeps grow up to 100 ms per attempt).
+# Reentrant, so serialized code may call other serialized code.
+_write_lock = threading.RLock()
+
+
+def should_serialize_writes(using=DEFAULT_DB_ALIAS):
+    return getattr(settings, 'SERIALIZE_SQLITE_WRITES', False) and connections[using].vendor == 'sqlite'
+
+
+@contextmanager
+def serialized_writes(using=DEFAULT_DB_ALIAS):
+    """
+    Run the block while holding the process-wide SQLite write lock. Waiting
+    is bounded by ``SQLITE_WRITE_LOCK_TIMEOUT``; past that the block runs
+    anyway and SQLite's own busy timeout takes over.
+    """
+    if not should_serialize_writes(using):
+        yield
+        return
+    acquired = _write_lock.acquire(timeout=getattr(settings, 'SQLITE_WRITE_LOCK_TIMEOUT', 20))
+    try:
+        yield
+    finally:
+        if acquired:
+            _write_lock.release()
+
+
+class SerializedWritesMixin:
+    """Serialize a view's unsafe requests (see ``serialized_writes``)"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with serialized_writes():
+            return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,96 @@
+import csv
+
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Image
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows buffered into one chunk of the streamed body
+ROWS_PER_CHUNK = 500
+
+EXPORT_COLUMNS = [
+    'id', 'title', 'details', 'price', 'status', 'created_at', 'updated_at',
+    'account_id', 'account_username', 'cover_image',
+]
+
+
+def export_queryset(queryset):
+    """
+    Flatten books into plain value rows: owner username from a join and the
+    cover image (or newest image) from a correlated subquery, so no model
+    instances or prefetch caches are ever built.
+    """
+    cover = Image.objects.filter(book=OuterRef('pk')).order_by('-is_cover', '-created_at').values('image')[:1]
+    return queryset.annotate(cover_image=Subquery(cover)).values_list(
+        'id', 'title', 'details', 'price', 'status', 'created_at', 'updated_at',
+        'account_id', 'account__username', 'cover_image',
+    )
+
+
+def export_rows(queryset, request=None):
+    """Yield one dict per book, reading the database in fixed-size chunks"""
+    for row in export_queryset(queryset).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        record = dict(zip(EXPORT_COLUMNS, row))
+        record['created_at'] = timezone.localtime(record['created_at']).isoformat()
+        record['updated_at'] = timezone.localtime(record['updated_at']).isoformat()
+        if record['cover_image']:
+            url = default_storage.url(record['cover_image'])
+            record['cover_image'] = request.build_absolute_uri(url) if request is not None else url
+        yield record
+
+
+class _Echo:
+    """File-like object whose write() hands the value straight back"""
+
+    def write(self, value):
+        return value
+
+
+def _chunked(lines):
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= ROWS_PER_CHUNK:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+
+    def lines():
+        yield writer.writerow(EXPORT_COLUMNS)
+        for record in rows:
+            yield writer.writerow([record[column] for column in EXPORT_COLUMNS])
+
+    return _chunked(lines())
+
+
+def stream_ndjson(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    return _chunked(encoder.encode(record) + '\n' for record in rows)
+
+
+async def aiterate(chunks):
+    """
+    The chunks as an async iterator. Given a sync one, Django's ASGI handler
+    would read the whole body into a list before sending any of it; this
+    pulls one chunk at a time on the thread the sync code runs on.
+    """
+    chunks = iter(chunks)
+    end = object()
+    while (chunk := await sync_to_async(next)(chunks, end)) is not end:
+        yield chunk
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson; charset=utf-8'),
+}
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Book
+
+FACETS = ('status', 'price')
+
+DEFAULT_PRICE_BUCKETS = [0, 10, 25, 50, 100, 250]
+
+MAX_PRICE_BUCKETS = 20
+
+
+def parse_facets(value):
+    """``?facets=status,price`` (or ``?facets=true`` for all) -> set of facet names"""
+    if value is None:
+        return set()
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    if names & {'true', '1', 'all'}:
+        return set(FACETS)
+    unknown = names - set(FACETS)
+    if unknown:
+        raise ValidationError({'facets': [f"Unknown facet '{name}'" for name in sorted(unknown)]})
+    return names
+
+
+def parse_price_buckets(value):
+    """``?price_buckets=0,10,50`` -> sorted bucket boundaries"""
+    if value is None:
+        return list(getattr(settings, 'BOOK_PRICE_FACET_BUCKETS', DEFAULT_PRICE_BUCKETS))
+    try:
+        bounds = sorted({float(bound) for bound in value.split(',') if bound.strip()})
+    except ValueError:
+        raise ValidationError({'price_buckets': ['Expected comma-separated numbers']})
+    if not bounds or len(bounds) > MAX_PRICE_BUCKETS:
+        raise ValidationError({'price_buckets': [f'Expected between 1 and {MAX_PRICE_BUCKETS} boundaries']})
+    return [int(bound) if bound.is_integer() else bound for bound in bounds]
+
+
+def bucket_ranges(bounds):
+    """[0, 10, 50] -> [(0, 10), (10, 50), (50, None)]"""
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def facet_queryset(queryset, bounds):
+    """
+    One GROUP BY status query over the filtered set, with a conditional
+    count per price bucket. It only reads ``status`` and ``price``, the
+    columns of the ``(price, status)`` index.
+    """
+    buckets = {}
+    for index, (low, high) in enumerate(bucket_ranges(bounds)):
+        condition = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+        buckets[f'price_{index}'] = Count('id', filter=condition)
+    return (
+        queryset.select_related(None).prefetch_related(None).order_by()
+        .values('status')
+        .annotate(total=Count('id'), **buckets)
+    )
+
+
+def collect_facets(rows, names, bounds):
+    """Shape the grouped rows into the ``facets`` object of the response"""
+    rows = list(rows)
+    facets = OrderedDict()
+    if 'status' in names:
+        counts = {row['status']: row['total'] for row in rows}
+        facets['status'] = OrderedDict((value, counts.get(value, 0)) for value, _ in Book.STATUS_CHOICES)
+    if 'price' in names:
+        facets['price'] = [
+            OrderedDict([
+                ('min', low),
+                ('max', high),
+                ('count', sum(row[f'price_{index}'] for row in rows)),
+            ])
+            for index, (low, high) in enumerate(bucket_ranges(bounds))
+        ]
+    return facets
+
+
+class FacetMixin:
+    """
+    Adds ``?facets=status,price`` to a list view: the paginated response gets
+    a ``facets`` object with counts per status and per price bucket over the
+    whole filtered set, not only the current page. Price bucket boundaries
+    come from ``?price_buckets=`` or the ``BOOK_PRICE_FACET_BUCKETS`` setting.
+    """
+    facets_query_param = 'facets'
+    price_buckets_query_param = 'price_buckets'
+
+    def list(self, request, *args, **kwargs):
+        names, bounds = self.get_facet_options(request)
+        response = super().list(request, *args, **kwargs)
+        if names and response.status_code == 200 and isinstance(response.data, dict):
+            response.data['facets'] = self.get_facets(names, bounds)
+        return response
+
+    def get_facet_options(self, request):
+        names = parse_facets(request.query_params.get(self.facets_query_param))
+        bounds = parse_price_buckets(request.query_params.get(self.price_buckets_query_param)) if names else None
+        return names, bounds
+
+    def get_facets(self, names, bounds):
+        queryset = facet_queryset(self.filter_queryset(self.get_queryset()), bounds)
+        return collect_facets(queryset, names, bounds)
+
+    async def aget_facets(self, names, bounds):
+        queryset = facet_queryset(self.filter_queryset(self.get_queryset()), bounds)
+        return collect_facets([row async for row in queryset], names, bounds)
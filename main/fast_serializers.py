@@ -0,0 +1,136 @@
+"""
+Compiled read path for ModelSerializers.
+
+``Serializer.to_representation`` walks ``_readable_fields`` for every
+instance, resolving each field's source through the generic
+``get_attribute`` helper and dispatching ``to_representation`` through the
+field class. For list endpoints that is most of the CPU spent per request.
+
+``compile_serializer`` does that resolution once per serializer instance and
+returns a flat plan of ``(name, getter, converter)`` steps: plain attribute
+getters for concrete model columns, inlined conversions for the stock DRF
+field types, and nested plans for nested serializers. Anything it does not
+recognise (custom fields, overridden ``to_representation``, dotted sources)
+keeps going through the field's own methods, so the output is always the
+same as the regular serializer's.
+"""
+from operator import attrgetter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.manager import BaseManager
+from rest_framework import fields, serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import ISO_8601, api_settings
+
+
+def render(plan, instance):
+    ret = {}
+    for name, getter, convert in plan:
+        try:
+            attribute = getter(instance)
+        except SkipField:
+            continue
+        check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+        ret[name] = None if check_for_none is None else convert(attribute)
+    return ret
+
+
+def compile_serializer(serializer):
+    """Flat representation plan for a bound serializer instance"""
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    return [
+        (field.field_name, compile_getter(field, model), compile_converter(field))
+        for field in serializer._readable_fields
+    ]
+
+
+def compile_getter(field, model):
+    if field.source_attrs == [] and type(field).get_attribute is fields.Field.get_attribute:
+        return _identity
+    if len(field.source_attrs) == 1 and type(field).get_attribute is fields.Field.get_attribute and model is not None:
+        try:
+            model_field = model._meta.get_field(field.source_attrs[0])
+        except FieldDoesNotExist:
+            model_field = None
+        # Plain columns can never raise or be callable; relations still go
+        # through DRF for its DoesNotExist / None handling
+        if model_field is not None and model_field.concrete and not model_field.is_relation:
+            return attrgetter(model_field.attname)
+    return field.get_attribute
+
+
+def compile_converter(field):
+    field_class = type(field)
+    method = field_class.to_representation
+
+    if isinstance(field, serializers.ListSerializer):
+        child = field.child
+        if method is not serializers.ListSerializer.to_representation or not _is_compilable(child):
+            return field.to_representation
+        child_plan = compile_serializer(child)
+
+        def convert_list(data):
+            iterable = data.all() if isinstance(data, BaseManager) else data
+            return [render(child_plan, item) for item in iterable]
+        return convert_list
+
+    if isinstance(field, serializers.BaseSerializer):
+        if not _is_compilable(field):
+            return field.to_representation
+        plan = compile_serializer(field)
+        return lambda instance: render(plan, instance)
+
+    if method is fields.IntegerField.to_representation:
+        return int
+    if method is fields.FloatField.to_representation:
+        return float
+    if method is fields.CharField.to_representation:
+        return str
+    if method is fields.ReadOnlyField.to_representation:
+        return _identity
+    if method is fields.BooleanField.to_representation:
+        return lambda value: value if value is True or value is False else field.to_representation(value)
+    if method is fields.ChoiceField.to_representation:
+        choices = field.choice_strings_to_values
+        return lambda value: (choices.get(value, value) if value else value) if type(value) is str \
+            else field.to_representation(value)
+    if method is fields.DateTimeField.to_representation:
+        return _compile_datetime(field)
+    return field.to_representation
+
+
+def _compile_datetime(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if isinstance(value, str) or not value or value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def _is_compilable(serializer):
+    method = type(serializer).to_representation
+    return method is serializers.Serializer.to_representation or isinstance(serializer, CompiledSerializerMixin)
+
+
+def _identity(value):
+    return value
+
+
+class CompiledSerializerMixin:
+    """
+    Render with a plan compiled on first use instead of the generic
+    per-field loop. Writes, validation and schema generation are untouched.
+    """
+
+    def to_representation(self, instance):
+        plan = getattr(self, '_compiled_plan', None)
+        if plan is None:
+            plan = self._compiled_plan = compile_serializer(self)
+        return render(plan, instance)
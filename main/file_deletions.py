@@ -0,0 +1,178 @@
+"""
+Queued deletion of media files.
+
+Files used to be removed while the request that deleted their row was
+still running, and only by code that saw each row: queryset and cascade
+deletes (an account takes its books and their images along) could leave
+them behind. Now every file reference given up, through
+``storage.delete()`` or the signals in ``main.signals``, becomes a
+``FileDeletion`` row written in the transaction that deleted or replaced
+the row using it. A rollback queues nothing and a commit cannot lose one.
+
+``process_file_deletions`` (``manage.py process_file_deletions``) releases
+them in batches, one transaction per batch, so an interrupted worker
+leaves its rows for the next run. Failures are retried by later runs up
+to ``FILE_DELETION_MAX_ATTEMPTS`` times.
+
+``find_orphaned_files`` walks ``MEDIA_ROOT`` with ``os.scandir`` and
+yields the files no row refers to: left by crashes, or by writes that
+bypassed the queue (``manage.py scan_orphaned_media``).
+"""
+import logging
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .db import serialized_writes
+from .models import Account, ArchivedBook, FileDeletion, Image, StoredFile
+
+logger = logging.getLogger(__name__)
+
+SCAN_CHUNK_SIZE = 1000
+
+
+def queue_file_deletions(names):
+    FileDeletion.objects.bulk_create([FileDeletion(name=name) for name in names if name])
+
+
+def image_file_names(instance):
+    """Storage names of an Image or Account's file and its variants"""
+    names = [instance.image.name] if instance.image else []
+    names.extend(name for variant, name in instance.image_variants.items() if variant != 'source' and name)
+    return names
+
+
+def media_storage():
+    return Image._meta.get_field('image').storage
+
+
+def pending_deletions():
+    return FileDeletion.objects.filter(attempts__lt=getattr(settings, 'FILE_DELETION_MAX_ATTEMPTS', 5))
+
+
+def release(storage, name, count):
+    if hasattr(storage, 'release'):
+        storage.release(name, count)
+    else:
+        storage.delete(name)  # a plain storage counts no references
+
+
+def process_batch(after=0, batch_size=None):
+    """
+    Release the queued references with ids above ``after``, up to
+    ``batch_size`` rows. Returns (rows processed, failures, last id).
+    """
+    batch_size = batch_size or getattr(settings, 'FILE_DELETION_BATCH_SIZE', 500)
+    storage = media_storage()
+    with serialized_writes(), transaction.atomic():
+        rows = list(
+            pending_deletions().filter(pk__gt=after).select_for_update(skip_locked=True)
+            .order_by('pk').values_list('pk', 'name')[:batch_size]
+        )
+        by_name = {}
+        for pk, name in rows:
+            by_name.setdefault(name, []).append(pk)
+        done, failed = [], {}
+        for name, pks in by_name.items():
+            try:
+                release(storage, name, len(pks))
+            except OSError as exc:
+                logger.warning('Could not delete media file %s: %s', name, exc)
+                failed.setdefault(str(exc), []).extend(pks)
+            else:
+                done.extend(pks)
+        FileDeletion.objects.filter(pk__in=done).delete()
+        for error, pks in failed.items():
+            FileDeletion.objects.filter(pk__in=pks).update(attempts=F('attempts') + 1, last_error=error)
+    return len(rows), sum(len(pks) for pks in failed.values()), rows[-1][0] if rows else after
+
+
+def process_file_deletions(batch_size=None, max_batches=None):
+    """Work through the queue once, batch by batch; returns totals"""
+    totals = {'batches': 0, 'processed': 0, 'failed': 0}
+    after = 0
+    while max_batches is None or totals['batches'] < max_batches:
+        processed, failed, after = process_batch(after, batch_size)
+        if not processed:
+            break
+        totals['batches'] += 1
+        totals['processed'] += processed
+        totals['failed'] += failed
+    return totals
+
+
+def walk_media(root):
+    """Yield (storage name, stat) for every file under ``root``, depth first"""
+    directories = ['']
+    while directories:
+        directory = directories.pop()
+        try:
+            entries = os.scandir(os.path.join(root, directory))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f'{directory}/{entry.name}' if directory else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry.stat(follow_symlinks=False)
+
+
+def referenced_files():
+    """Every storage name a row still uses or is about to release"""
+    names = set()
+    for model in (Image, Account):
+        for image, image_variants in model._default_manager.values_list('image', 'image_variants').iterator(chunk_size=2000):
+            if image:
+                names.add(image)
+            names.update(name for variant, name in image_variants.items() if variant != 'source' and name)
+    for files in ArchivedBook.objects.filter(files_purged_at__isnull=True).values_list('files', flat=True).iterator():
+        names.update(files)
+    return names
+
+
+def find_orphaned_files(min_age=3600):
+    """
+    Yield (name, size) of the files under ``MEDIA_ROOT`` that no row uses,
+    have no queued deletion and were last modified ``min_age`` seconds ago
+    or earlier (younger ones may belong to an upload still in progress).
+    """
+    referenced = referenced_files()
+    cutoff = time.time() - min_age
+    files = (
+        (name, stat.st_size) for name, stat in walk_media(settings.MEDIA_ROOT)
+        if name not in referenced and stat.st_mtime <= cutoff
+    )
+    while chunk := list(islice(files, SCAN_CHUNK_SIZE)):
+        queued = set(FileDeletion.objects.filter(name__in=[name for name, _ in chunk]).values_list('name', flat=True))
+        yield from ((name, size) for name, size in chunk if name not in queued)
+
+
+def queue_orphaned_files(names, min_age=0):
+    """
+    Queue orphans for deletion, dropping any reference count left behind.
+    Names an image or account took meanwhile, or whose file was touched
+    less than ``min_age`` seconds ago (a duplicate upload refreshes it), are
+    skipped. Returns the names queued.
+    """
+    cutoff = time.time() - min_age
+    with serialized_writes(), transaction.atomic():
+        taken = set()
+        for model in (Image, Account):
+            taken.update(model._default_manager.filter(image__in=names).values_list('image', flat=True))
+        names = [name for name in names if name not in taken and modified_before(name, cutoff)]
+        StoredFile.objects.filter(name__in=names).delete()
+        queue_file_deletions(names)
+    return names
+
+
+def modified_before(name, cutoff):
+    try:
+        return os.stat(os.path.join(settings.MEDIA_ROOT, name)).st_mtime <= cutoff
+    except FileNotFoundError:
+        return True
@@ -0,0 +1,13 @@
+from django_filters import rest_framework as filters
+
+from .models import Book
+
+
+class BookFilter(filters.FilterSet):
+    # Filter on the raw column: a ModelChoiceFilter would query Account just
+    # to validate the id, and unknown ids simply match nothing.
+    account = filters.NumberFilter(field_name='account_id')
+
+    class Meta:
+        model = Book
+        fields = ['status', 'account']
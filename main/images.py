@@ -0,0 +1,132 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image as PILImage, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# name -> bounding box, output format and encoder options
+VARIANTS = {
+    'thumbnail': {'size': (240, 240), 'format': 'JPEG', 'options': {'quality': 80, 'optimize': True, 'progressive': True}},
+    'medium': {'size': (800, 800), 'format': 'JPEG', 'options': {'quality': 85, 'optimize': True, 'progressive': True}},
+    'webp': {'size': (1200, 1200), 'format': 'WEBP', 'options': {'quality': 80, 'method': 4}},
+}
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+                thread_name_prefix='image-variants',
+            )
+        return _executor
+
+
+def variant_name(source_name, variant):
+    """books/cover.jpg -> books/variants/cover.thumbnail.jpg"""
+    directory, filename = os.path.split(source_name)
+    stem = os.path.splitext(filename)[0]
+    extension = EXTENSIONS[VARIANTS[variant]['format']]
+    return os.path.join(directory, 'variants', f'{stem}.{variant}.{extension}')
+
+
+def needs_variants(instance):
+    source = instance.image.name if instance.image else None
+    return instance.image_variants.get('source') != source
+
+
+def render_variant(source, spec):
+    image = source.copy()
+    image.thumbnail(spec['size'], PILImage.LANCZOS)
+    if spec['format'] == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif spec['format'] == 'WEBP' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, spec['format'], **spec['options'])
+    return buffer.getvalue()
+
+
+def delete_variant_files(storage, image_variants):
+    for variant, name in image_variants.items():
+        if variant != 'source' and name:
+            storage.delete(name)
+
+
+def generate_variants(model, pk):
+    """
+    Build every variant for ``model`` row ``pk`` and record them in its
+    ``image_variants`` field. Safe to call repeatedly; rows whose image is
+    unchanged since the last run are skipped.
+    """
+    try:
+        instance = model._default_manager.filter(pk=pk).first()
+        if instance is None or not needs_variants(instance):
+            return None
+
+        storage = instance.image.storage
+        delete_variant_files(storage, instance.image_variants)
+        image_variants = {'source': instance.image.name or None}
+        if instance.image:
+            try:
+                with instance.image.open('rb') as file:
+                    source = PILImage.open(file)
+                    source.load()
+                source = ImageOps.exif_transpose(source)
+                for variant, spec in VARIANTS.items():
+                    name = variant_name(instance.image.name, variant)
+                    if storage.exists(name):
+                        storage.delete(name)
+                    image_variants[variant] = storage.save(name, ContentFile(render_variant(source, spec)))
+            except (OSError, UnidentifiedImageError) as exc:
+                logger.warning('Could not build variants for %s %s: %s', model.__name__, pk, exc)
+
+        instance.image_variants = image_variants
+        update_fields = ['image_variants']
+        if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+            update_fields.append('updated_at')
+        instance.save(update_fields=update_fields)
+        return image_variants
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+def schedule_variants(instance):
+    """Generate variants once the current transaction commits"""
+    model, pk = type(instance), instance.pk
+
+    def submit():
+        if getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+            get_executor().submit(generate_variants, model, pk)
+        else:
+            generate_variants(model, pk)
+
+    transaction.on_commit(submit)
+
+
+def variant_urls(instance, request=None):
+    """Public URLs of the variants built for the instance's current image"""
+    if not instance.image or needs_variants(instance):
+        return {}
+    storage = instance.image.storage
+    urls = {}
+    for variant in VARIANTS:
+        name = instance.image_variants.get(variant)
+        if name:
+            url = storage.url(name)
+            urls[variant] = request.build_absolute_uri(url) if request is not None else url
+    return urls
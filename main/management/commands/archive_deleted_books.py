@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.archival import archivable_books, archive_deleted_books, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Move books soft-deleted before the retention cutoff into the archive and delete their media'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help=f'Retention period in days (default: BOOK_ARCHIVE_RETENTION_DAYS, {settings.BOOK_ARCHIVE_RETENTION_DAYS})',
+        )
+        parser.add_argument('--batch-size', type=int, help='Books per transaction (default: BOOK_ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--pause', type=float, help='Seconds to sleep between batches (default: BOOK_ARCHIVE_PAUSE)')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches; the next run resumes')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many books are due')
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep running every INTERVAL seconds instead of exiting',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days cannot be negative')
+        for name in ('batch_size', 'max_batches'):
+            if options[name] is not None and options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1")
+        while True:
+            cutoff = retention_cutoff(options['days'])
+            if options['dry_run']:
+                self.stdout.write(f'{archivable_books(cutoff).count()} books deleted before {cutoff:%Y-%m-%d %H:%M} are due')
+                return
+            totals = archive_deleted_books(
+                cutoff,
+                batch_size=options['batch_size'],
+                pause=options['pause'],
+                max_batches=options['max_batches'],
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"Archived {totals['archived']} books in {totals['batches']} batches; "
+                f"purged files of {totals['files_purged']} archived books"
+            ))
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
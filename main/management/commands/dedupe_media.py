@@ -0,0 +1,123 @@
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from main.cache import response_cache
+from main.file_deletions import pending_deletions
+from main.models import Account, ArchivedBook, Book, FileDeletion, Image, StoredFile
+from main.storage import ContentAddressedStorage
+
+# Models whose ``image`` (and the variants built from it) live in the storage
+MEDIA_MODELS = [Image, Account]
+
+
+def referenced_names(image, image_variants):
+    names = [image] if image else []
+    names.extend(name for variant, name in image_variants.items() if variant != 'source' and name)
+    return names
+
+
+class Command(BaseCommand):
+    help = (
+        'Move existing media into the content-addressed layout, storing identical files once, '
+        'and recount the references to every stored file. Run it while uploads are paused.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows updated per transaction')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError('The default storage is not content-addressed')
+        self.renamed = {}
+        self.stats = Counter()
+        touched_books = set()
+
+        for model in MEDIA_MODELS:
+            rows = model._base_manager.exclude(image='').values_list('pk', 'image', 'image_variants')
+            changed = []
+            for pk, image, image_variants in rows.iterator():
+                new_image = self.adopt(image)
+                new_variants = {
+                    # 'source' records which image the variants were built from
+                    variant: self.renamed.get(name, name) if variant == 'source' or not name else self.adopt(name)
+                    for variant, name in image_variants.items()
+                }
+                if new_image != image or new_variants != image_variants:
+                    changed.append((pk, new_image, new_variants))
+                if len(changed) >= options['batch_size']:
+                    touched_books |= self.update_rows(model, changed)
+                    changed = []
+            touched_books |= self.update_rows(model, changed)
+
+        # Queued deletions and unpurged archives still hold references that
+        # will be released later: move and count them like the live ones
+        with transaction.atomic():
+            for pk, name in pending_deletions().values_list('pk', 'name'):
+                if self.adopt(name) != name:
+                    FileDeletion.objects.filter(pk=pk).update(name=self.renamed[name])
+            for pk, files in ArchivedBook.objects.filter(files_purged_at__isnull=True).values_list('pk', 'files'):
+                new_files = [self.adopt(name) for name in files]
+                if new_files != files:
+                    ArchivedBook.objects.filter(pk=pk).update(files=new_files)
+
+        counts = Counter()
+        for model in MEDIA_MODELS:
+            rows = model._base_manager.exclude(image='').values_list('image', 'image_variants')
+            for image, image_variants in rows.iterator():
+                counts.update(referenced_names(image, image_variants))
+        counts.update(pending_deletions().values_list('name', flat=True))
+        for files in ArchivedBook.objects.filter(files_purged_at__isnull=True).values_list('files', flat=True):
+            counts.update(files)
+        with transaction.atomic():
+            StoredFile.objects.all().delete()
+            StoredFile.objects.bulk_create(
+                [StoredFile(name=name, refcount=refcount) for name, refcount in counts.items()],
+                batch_size=options['batch_size'],
+            )
+        if touched_books:
+            response_cache.invalidate_books(touched_books)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {self.stats['moved']} files, merged {self.stats['merged']} duplicates "
+            f"({self.stats['reclaimed']} bytes reclaimed), {len(counts)} files referenced"
+        ))
+        if self.stats['missing']:
+            self.stdout.write(self.style.WARNING(f"{self.stats['missing']} referenced files are missing"))
+
+    def adopt(self, name):
+        if name not in self.renamed:
+            try:
+                size = default_storage.size(name)
+                new_name, merged = default_storage.adopt(name)
+            except FileNotFoundError:
+                self.stats['missing'] += 1
+                new_name, merged = name, False
+            if new_name != name:
+                self.stats['moved'] += 1
+                if merged:
+                    self.stats['merged'] += 1
+                    self.stats['reclaimed'] += size
+            self.renamed[name] = new_name
+        return self.renamed[name]
+
+    def update_rows(self, model, changed):
+        """Point the rows at the new names; returns the books whose output changed"""
+        if not changed:
+            return set()
+        now = timezone.now()
+        extra = {'updated_at': now} if model is Account else {}
+        with transaction.atomic():
+            # Queryset updates: no signal may queue the old names for deletion
+            for pk, image, image_variants in changed:
+                model._base_manager.filter(pk=pk).update(image=image, image_variants=image_variants, **extra)
+            pks = [pk for pk, _, _ in changed]
+            if model is Image:
+                book_ids = set(Image.objects.filter(pk__in=pks).values_list('book_id', flat=True))
+            else:
+                book_ids = set(Book.all_with_deleted.filter(account_id__in=pks).values_list('pk', flat=True))
+            Book.all_with_deleted.filter(pk__in=book_ids).update(updated_at=now)
+        return book_ids
@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from main.images import generate_variants
+from main.models import Account, Image
+
+
+class Command(BaseCommand):
+    help = 'Build missing resized variants for book images and profile pictures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of parallel workers')
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rebuild variants even if they are up to date',
+        )
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model in (Image, Account):
+            queryset = model._default_manager.exclude(image='').exclude(image__isnull=True)
+            if options['force']:
+                queryset.update(image_variants={})
+            for pk, image, image_variants in queryset.values_list('pk', 'image', 'image_variants').iterator():
+                if image_variants.get('source') != image:
+                    jobs.append((model, pk))
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                futures = [executor.submit(generate_variants, model, pk) for model, pk in jobs]
+                results = [future.result() for future in as_completed(futures)]
+        else:
+            results = [generate_variants(model, pk) for model, pk in jobs]
+
+        built = sum(1 for result in results if result and len(result) > 1)
+        failed = len(results) - built
+
+        self.stdout.write(self.style.SUCCESS(f'Built variants for {built} images ({failed} skipped)'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import get_resolver
+
+from main.openapi import SCHEMA_VIEWS, SchemaArtifact, schema_dir, source_fingerprint
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema documents served by the schema views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Schema names (default: every schema view in the URLconf)')
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Fail if an artifact is missing or stale instead of writing it',
+        )
+
+    def handle(self, *args, **options):
+        get_resolver().url_patterns  # importing the URLconf registers its schema views
+        names = options['names'] or sorted(SCHEMA_VIEWS)
+        unknown = set(names) - set(SCHEMA_VIEWS)
+        if unknown:
+            raise CommandError(f"Unknown schema: {', '.join(sorted(unknown))}")
+
+        fingerprint = source_fingerprint()
+        stale = [name for name in names if SchemaArtifact.read(name, fingerprint) is None]
+        if options['check']:
+            if stale:
+                raise CommandError(f"Stale OpenAPI schema: {', '.join(stale)}")
+            self.stdout.write('OpenAPI schema is up to date')
+            return
+
+        for name in names:
+            SCHEMA_VIEWS[name].get_artifact(fingerprint, regenerate=True)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {name} schema to {schema_dir()}'))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.file_deletions import pending_deletions, process_file_deletions
+
+
+class Command(BaseCommand):
+    help = 'Delete the media files queued by deleted and replaced rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Queue rows per transaction (default: FILE_DELETION_BATCH_SIZE)')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches; the next run resumes')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many deletions are queued')
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep running every INTERVAL seconds instead of exiting',
+        )
+
+    def handle(self, *args, **options):
+        for name in ('batch_size', 'max_batches'):
+            if options[name] is not None and options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be at least 1")
+        while True:
+            if options['dry_run']:
+                self.stdout.write(f'{pending_deletions().count()} file deletions are queued')
+                return
+            totals = process_file_deletions(batch_size=options['batch_size'], max_batches=options['max_batches'])
+            if totals['processed'] or options['interval'] is None:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Processed {totals['processed']} queued deletions in {totals['batches']} batches; "
+                    f"{totals['failed']} failed and will be retried"
+                ))
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from main.search import rebuild_search_index, supports_full_text_search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for books in one bulk pass'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--optimize',
+            action='store_true',
+            help='Merge the index b-trees after rebuilding',
+        )
+
+    def handle(self, *args, **options):
+        database = options['database']
+        if not supports_full_text_search(connections[database]):
+            raise CommandError(f"Database '{database}' does not support FTS5 search")
+
+        indexed = rebuild_search_index(using=database, optimize=options['optimize'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} books'))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.file_deletions import SCAN_CHUNK_SIZE, find_orphaned_files, queue_orphaned_files
+
+
+class Command(BaseCommand):
+    help = 'List the files under MEDIA_ROOT that no image or account uses, and optionally queue their deletion'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Ignore files modified less than this many seconds ago (default: 3600)',
+        )
+        parser.add_argument('--delete', action='store_true', help='Queue the orphans for process_file_deletions')
+
+    def handle(self, *args, **options):
+        if options['min_age'] < 0:
+            raise CommandError('--min-age cannot be negative')
+        count = size = 0
+        chunk = {}
+        for name, file_size in find_orphaned_files(options['min_age']):
+            if options['verbosity'] > 1:
+                self.stdout.write(name)
+            if not options['delete']:
+                count += 1
+                size += file_size
+                continue
+            chunk[name] = file_size
+            if len(chunk) >= SCAN_CHUNK_SIZE:
+                count, size = self.queue(chunk, options['min_age'], count, size)
+                chunk = {}
+        if chunk:
+            count, size = self.queue(chunk, options['min_age'], count, size)
+        action = 'queued for deletion' if options['delete'] else 'found'
+        self.stdout.write(self.style.SUCCESS(f'{count} orphaned files ({size} bytes) {action}'))
+
+    def queue(self, chunk, min_age, count, size):
+        """Queue a chunk of orphans; returns the running totals of those queued"""
+        queued = queue_orphaned_files(list(chunk), min_age)
+        return count + len(queued), size + sum(chunk[name] for name in queued)
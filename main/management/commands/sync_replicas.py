@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.connection import ConnectionDoesNotExist
+
+from main.replication import sync_replicas
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into every read replica (local replication stand-in)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Replica aliases (default: DATABASE_REPLICAS)')
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep syncing every INTERVAL seconds, like a replica with that much lag',
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or None
+        while True:
+            try:
+                synced = sync_replicas(aliases)
+            except (ConnectionDoesNotExist, ValueError) as exc:
+                raise CommandError(str(exc))
+            if not synced:
+                raise CommandError('No replicas configured; set BOOKSTORE_DB_REPLICAS')
+            self.stdout.write(f'Synced {", ".join(synced)}')
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
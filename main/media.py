@@ -0,0 +1,166 @@
+"""
+Serving user-uploaded media.
+
+``serve_media`` replaces ``django.views.static.serve`` for ``MEDIA_URL``. It
+answers conditional requests from the file's stat alone, and then, depending
+on ``MEDIA_SERVE_MODE``:
+
+- ``django``: streams the file with ``FileResponse``. WSGI servers that
+  offer ``wsgi.file_wrapper`` (gunicorn, uWSGI) send it with ``sendfile()``
+  without copying it through Python. Single byte ranges get a 206.
+- ``x-sendfile`` (Apache mod_xsendfile, lighttpd) and ``x-accel-redirect``
+  (nginx): returns headers only and lets the front server send the bytes,
+  ranges included. For nginx, ``MEDIA_ACCEL_REDIRECT_PREFIX`` must be an
+  ``internal`` location aliased to ``MEDIA_ROOT``.
+
+Content-addressed names (see ``main.storage``) never change content, so
+they get their hash as ETag and an immutable, year-long ``Cache-Control``.
+"""
+import mimetypes
+import os
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, parse_http_date_safe, quote_etag
+
+from .conditional import not_modified_response, set_validators
+from .storage import is_content_addressed, name_digest
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """
+    ``length`` bytes of an open file from ``start``. Keeps ``fileno()`` so a
+    WSGI file wrapper can still ``sendfile()`` the window, bounded by the
+    response's Content-Length.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def media_etag(name, stat):
+    if is_content_addressed(name):
+        return quote_etag(name_digest(name))
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+def parse_range(header, size):
+    """
+    ``Range: bytes=…`` -> (start, end) inclusive, None to send the whole file
+    (absent, malformed or multi-range headers), or ``False`` when the range
+    cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start > end:
+            return False
+    else:
+        length = int(last)
+        if not length:
+            return False
+        start, end = max(size - length, 0), size - 1
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    """An ``If-Range`` validator that no longer matches asks for the whole file"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return etag in parse_etags(if_range) and not if_range.startswith('W/')
+    return parse_http_date_safe(if_range) == int(last_modified.timestamp())
+
+
+def set_cache_headers(response, name):
+    if is_content_addressed(name):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600))
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_media(request, path):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (OSError, SuspiciousFileOperation):
+        raise Http404('No such media file')
+    if not os.path.isfile(full_path) or os.path.basename(path).startswith('.'):
+        raise Http404('No such media file')
+
+    name = path.replace(os.sep, '/')
+    etag = media_etag(name, stat)
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), dt_timezone.utc)
+    response = not_modified_response(request, etag, last_modified)
+    if response is not None:
+        return set_cache_headers(response, name)
+
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+    if mode in ('x-sendfile', 'x-accel-redirect'):
+        response = HttpResponse(content_type=mimetypes.guess_type(full_path)[0] or 'application/octet-stream')
+        if mode == 'x-sendfile':
+            response['X-Sendfile'] = full_path
+        else:
+            response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/') + name
+    else:
+        size = stat.st_size
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        if byte_range is not None and not if_range_matches(request, etag, last_modified):
+            byte_range = None
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return set_cache_headers(response, name)
+        file = open(full_path, 'rb')
+        if byte_range is None:
+            response = FileResponse(file)
+        else:
+            start, end = byte_range
+            response = FileResponse(FileRange(file, start, end - start + 1), status=206)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    set_validators(response, etag, last_modified)
+    return set_cache_headers(response, name)
+
+
+def media_urlpatterns():
+    """``serve_media`` mounted at MEDIA_URL (nothing if media lives on another host)"""
+    prefix = settings.MEDIA_URL
+    if not prefix or '://' in prefix:
+        return []
+    return [re_path(r'^%s(?P<path>.*)$' % re.escape(prefix.lstrip('/')), serve_media, name='media')]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from main.search import drop_search_index, install_search_index
+
+
+def create_index(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("INSERT INTO main_book_fts(main_book_fts) VALUES ('rebuild')")
+
+
+def remove_index(apps, schema_editor):
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_alter_account_options_alter_book_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, remove_index),
+    ]
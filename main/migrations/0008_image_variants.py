@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the profile picture, by variant name'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the image, by variant name'),
+        ),
+    ]
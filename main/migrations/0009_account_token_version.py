@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Bumped to revoke every token issued to the user'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-17 06:44
+
+from django.db import migrations, models
+
+from main.search import install_search_index
+
+
+def reinstall_search_index(apps, schema_editor):
+    # Altering created_at remakes main_book on SQLite, which drops the
+    # triggers that keep the full-text index in sync
+    install_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_account_token_version'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='book',
+            name='main_book_price_9dfada_idx',
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['created_at'], name='book_live_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['status', 'created_at'], name='book_live_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['price', 'status'], name='book_live_price_status_idx'),
+        ),
+        migrations.RunPython(reinstall_search_index, migrations.RunPython.noop),
+    ]
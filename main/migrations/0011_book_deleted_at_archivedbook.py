@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-17 06:47
+
+from django.db import migrations, models
+
+
+def backfill_deleted_at(apps, schema_editor):
+    # Books deleted before deleted_at existed were last saved by soft_delete()
+    Book = apps.get_model('main', 'Book')
+    Book.objects.filter(is_deleted=True, deleted_at__isnull=True).update(deleted_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_book_live_manager_and_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book_id', models.BigIntegerField(unique=True)),
+                ('account_id', models.BigIntegerField(db_index=True)),
+                ('title', models.CharField(max_length=255)),
+                ('details', models.TextField(blank=True, null=True)),
+                ('price', models.FloatField()),
+                ('status', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('deleted_at', models.DateTimeField(null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('images', models.JSONField(default=list)),
+                ('files', models.JSONField(default=list)),
+                ('files_purged_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Archived book',
+                'verbose_name_plural': 'Archived books',
+                'ordering': ['-archived_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the book was soft-deleted', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['deleted_at'], name='book_deleted_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedbook',
+            index=models.Index(condition=models.Q(('files_purged_at__isnull', True)), fields=['id'], name='archivedbook_pending_files_idx'),
+        ),
+        migrations.RunPython(backfill_deleted_at, migrations.RunPython.noop),
+    ]
@@ -1,18 +1,51 @@
-from django.dispatch import receiver
+from django.dispatch import Signal, receiver
 from django.db.models.signals import post_delete
-import os
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import connections, models, router
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 
-class Account(AbstractUser):
+from . import passwords
+
+
+class StoredImageMixin:
+    """
+    Remembers the ``image`` name last read from or written to the database,
+    so a save that replaces the file can queue the old one for deletion.
+    """
+    _stored_image = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_image = instance.__dict__.get('image') or None
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        if fields is None or 'image' in fields:
+            self._stored_image = self.image.name or None
+
+
+class Account(StoredImageMixin, AbstractUser):
     image = models.ImageField(
         upload_to='accounts/',
         null=True,
         blank=True,
         help_text=_('Profile picture of the user')
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text=_('Resized copies of the profile picture, by variant name')
+    )
+    token_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text=_('Bumped to revoke every token issued to the user')
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -24,12 +57,95 @@ class Account(AbstractUser):
     def __str__(self):
         return self.username
 
-    def delete(self, *args, **kwargs):
-        # Delete user's image when account is deleted
-        if self.image:
-            if os.path.isfile(self.image.path):
-                os.remove(self.image.path)
-        super().delete(*args, **kwargs)
+    def set_password(self, raw_password):
+        self.password = passwords.make_password(raw_password)
+        self._password = raw_password
+        # A new password invalidates the tokens issued under the old one
+        if self.pk is not None:
+            self.token_version += 1
+
+    def check_password(self, raw_password):
+        is_correct, must_update = passwords.verify_password(raw_password, self.password)
+        if is_correct and must_update:
+            # A hash upgrade is not a password change: tokens stay valid
+            self.password = passwords.make_password(raw_password)
+            self.save(update_fields=['password'])
+        return is_correct
+
+    async def acheck_password(self, raw_password):
+        is_correct, must_update = await passwords.averify_password(raw_password, self.password)
+        if is_correct and must_update:
+            self.password = await passwords.amake_password(raw_password)
+            await self.asave(update_fields=['password'])
+        return is_correct
+
+    def revoke_tokens(self):
+        """Invalidate every access and refresh token issued so far"""
+        self.token_version = models.F('token_version') + 1
+        self.save(update_fields=['token_version', 'updated_at'])
+        self.refresh_from_db(fields=['token_version'])
+
+
+# Sent with ``book_ids`` after ``BookQuerySet.transition`` changed some
+# statuses; the UPDATE bypasses post_save
+book_status_changed = Signal()
+
+
+class StatusConflict(Exception):
+    """A status transition found the book in another status than expected"""
+
+    def __init__(self, book_id, status, current):
+        self.book_id = book_id
+        self.status = status
+        self.current = current
+        super().__init__(f'Book {book_id} cannot become {status!r}: it is {current!r}')
+
+
+class BookQuerySet(models.QuerySet):
+    def live(self):
+        return self.filter(is_deleted=False)
+
+    def deleted(self):
+        return self.filter(is_deleted=True)
+
+    def transition(self, status, expected=None):
+        """
+        Move the books in this queryset to ``status`` with one conditional
+        ``UPDATE ... WHERE status IN (expected) ... RETURNING id``. Books
+        already in ``status``, or in none of the ``expected`` statuses
+        (default: any other), are left alone. Returns the ids changed.
+        """
+        statuses = {value for value, _ in self.model.STATUS_CHOICES}
+        expected = statuses if expected is None else set(expected)
+        if status not in statuses or not expected <= statuses:
+            raise ValueError(f'Unknown book status in {status!r} / {sorted(expected)!r}')
+        expected.discard(status)
+        if not expected:
+            return []
+
+        connection = connections[router.db_for_write(self.model)]
+        subquery, params = self.filter(status__in=expected).order_by().values('pk').query.sql_with_params()
+        updated_at = self.model._meta.get_field('updated_at').get_db_prep_value(timezone.now(), connection)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {self.model._meta.db_table} SET status = %s, updated_at = %s
+                WHERE id IN ({subquery}) AND status IN ({', '.join(['%s'] * len(expected))})
+                RETURNING id
+                """,
+                [status, updated_at, *params, *expected]
+            )
+            changed = sorted(row[0] for row in cursor.fetchall())
+        if changed:
+            book_status_changed.send(sender=self.model, book_ids=changed)
+        return changed
+
+
+class LiveBookManager(models.Manager.from_queryset(BookQuerySet)):
+    """Default manager: soft-deleted books are left out"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
 
 
 class Book(models.Model):
@@ -63,9 +179,15 @@ class Book(models.Model):
         db_index=True,
         help_text=_('Current status of the book')
     )
-    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_deleted = models.BooleanField(default=False)
+    deleted_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=_('When the book was soft-deleted')
+    )
     account = models.ForeignKey(
         Account,
         on_delete=models.CASCADE,
@@ -73,13 +195,40 @@ class Book(models.Model):
         help_text=_('Owner of the book')
     )
 
+    # ``objects`` comes first so it is the default manager: related managers
+    # (account.books, wishlist.books) and the admin only see live books too.
+    # ``all_with_deleted`` is the escape hatch for code that must see every row.
+    objects = LiveBookManager()
+    all_with_deleted = BookQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('Book')
         verbose_name_plural = _('Books')
         ordering = ['-created_at']
+        # Catalog scans only ever read live rows, so the hot indexes leave
+        # soft-deleted books out
         indexes = [
             models.Index(fields=['title', 'status']),
-            models.Index(fields=['price', 'status']),
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(is_deleted=False),
+                name='book_live_created_idx'
+            ),
+            models.Index(
+                fields=['status', 'created_at'],
+                condition=models.Q(is_deleted=False),
+                name='book_live_status_created_idx'
+            ),
+            models.Index(
+                fields=['price', 'status'],
+                condition=models.Q(is_deleted=False),
+                name='book_live_price_status_idx'
+            ),
+            models.Index(
+                fields=['deleted_at'],
+                condition=models.Q(is_deleted=True),
+                name='book_deleted_at_idx'
+            ),
         ]
 
     def __str__(self):
@@ -88,31 +237,48 @@ class Book(models.Model):
     def soft_delete(self):
         """Soft delete the book instead of permanent deletion"""
         self.is_deleted = True
-        self.save(update_fields=['is_deleted'])
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
+
+    def transition(self, status, expected=None):
+        """
+        Compare-and-set the status: move to ``status`` only if the row is
+        still ``expected`` (default: the status this instance holds).
+        Raises StatusConflict when another request got there first.
+        """
+        expected = self.status if expected is None else expected
+        books = Book.all_with_deleted.filter(pk=self.pk)
+        if not books.transition(status, [expected]):
+            raise StatusConflict(self.pk, status, books.values_list('status', flat=True).first())
+        self.status = status
+        self.refresh_from_db(fields=['updated_at'])
 
     def mark_as_sold(self):
         """Mark the book as sold"""
-        self.status = 'sold'
-        self.save(update_fields=['status'])
+        self.transition('sold')
 
     def mark_as_reserved(self):
         """Mark the book as reserved"""
-        self.status = 'reserved'
-        self.save(update_fields=['status'])
+        self.transition('reserved')
 
     def mark_as_available(self):
         """Mark the book as available"""
-        self.status = 'available'
-        self.save(update_fields=['status'])
+        self.transition('available')
 
 
-class Image(models.Model):
+class Image(StoredImageMixin, models.Model):
     image = models.ImageField(
         upload_to='books/',
         blank=True,
         null=True,
         help_text=_('Image of the book')
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text=_('Resized copies of the image, by variant name')
+    )
     is_cover = models.BooleanField(
         default=False,
         help_text=_('Whether this is the cover image')
@@ -133,11 +299,110 @@ class Image(models.Model):
     def __str__(self):
         return f"Image for {self.book.title}"
 
-    def delete(self, *args, **kwargs):
-        # Delete the image file when the model instance is deleted
-        if self.image and os.path.isfile(self.image.path):
-            os.remove(self.image.path)
-        super().delete(*args, **kwargs)
+
+class StoredFile(models.Model):
+    """Reference count of a file in the content-addressed media storage"""
+    name = models.CharField(max_length=255, primary_key=True)
+    refcount = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Stored file')
+        verbose_name_plural = _('Stored files')
+
+    def __str__(self):
+        return self.name
+
+
+class FileDeletion(models.Model):
+    """
+    A media file reference to release, queued in the transaction that
+    deleted or replaced the row using it (see ``main.file_deletions``)
+    """
+    name = models.CharField(max_length=255)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    queued_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('File deletion')
+        verbose_name_plural = _('File deletions')
+
+    def __str__(self):
+        return self.name
+
+
+class ArchivedBook(models.Model):
+    """
+    What is kept of a soft-deleted book once ``archive_deleted_books`` has
+    removed it from the catalog tables. ``files`` lists the media it owned
+    until ``files_purged_at`` records that they are gone from storage.
+    """
+    book_id = models.BigIntegerField(unique=True)
+    account_id = models.BigIntegerField(db_index=True)
+    title = models.CharField(max_length=255)
+    details = models.TextField(blank=True, null=True)
+    price = models.FloatField()
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    deleted_at = models.DateTimeField(null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    images = models.JSONField(default=list)
+    files = models.JSONField(default=list)
+    files_purged_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('Archived book')
+        verbose_name_plural = _('Archived books')
+        ordering = ['-archived_at']
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=models.Q(files_purged_at__isnull=True),
+                name='archivedbook_pending_files_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class WishListManager(models.Manager):
+    def add_book(self, account, book_id):
+        """
+        Add a live book to ``account``'s wishlist with a single INSERT.
+        Returns False if it was already there or the book doesn't exist.
+        """
+        through = self.model.books.through
+        book_table = Book._meta.db_table
+        with connections[router.db_for_write(through)].cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {through._meta.db_table} (wishlist_id, book_id)
+                SELECT w.id, b.id FROM {self.model._meta.db_table} w, {book_table} b
+                WHERE w.account_id = %s AND b.id = %s AND b.is_deleted = %s
+                ON CONFLICT DO NOTHING
+                """,
+                [account.pk, book_id, False]
+            )
+            added = cursor.rowcount == 1
+        if added:
+            self.filter(account=account).update(updated_at=timezone.now())
+        return added
+
+    def remove_book(self, account, book_id):
+        """
+        Remove a book from ``account``'s wishlist with a single DELETE.
+        Like ``WishList.remove_books``, soft-deleted books can still be removed.
+        """
+        deleted, _ = self.model.books.through.objects.filter(
+            wishlist__account=account,
+            book_id=book_id
+        ).delete()
+        if deleted:
+            self.filter(account=account).update(updated_at=timezone.now())
+        return bool(deleted)
 
 
 class WishList(models.Model):
@@ -155,6 +420,8 @@ class WishList(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = WishListManager()
+
     class Meta:
         verbose_name = _('Wishlist')
         verbose_name_plural = _('Wishlists')
@@ -165,18 +432,89 @@ class WishList(models.Model):
 
     def add_book(self, book):
         """Add a book to the wishlist if it's not already there"""
-        if not self.books.filter(id=book.id).exists():
-            self.books.add(book)
-            return True
-        return False
+        return bool(self.add_books([book.pk], live_only=False)['added'])
 
     def remove_book(self, book):
         """Remove a book from the wishlist if it exists"""
-        if self.books.filter(id=book.id).exists():
-            self.books.remove(book)
-            return True
-        return False
+        return bool(self.remove_books([book.pk])['removed'])
+
+    def _membership(self, book_ids):
+        """Map requested book ids to (is_deleted, in_wishlist) in one query"""
+        through = self.books.through
+        rows = Book.all_with_deleted.filter(id__in=book_ids).annotate(
+            in_wishlist=models.Exists(through.objects.filter(wishlist_id=self.pk, book_id=models.OuterRef('pk')))
+        ).values_list('id', 'is_deleted', 'in_wishlist')
+        return {book_id: (is_deleted, in_wishlist) for book_id, is_deleted, in_wishlist in rows}
 
+    def _touch(self):
+        self.updated_at = timezone.now()
+        WishList.objects.filter(pk=self.pk).update(updated_at=self.updated_at)
 
+    def add_books(self, book_ids, live_only=True):
+        """
+        Add many books with one membership query and one bulk INSERT.
+        Returns the ids that were ``added``, already there (``unchanged``) and
+        ``unknown`` (no such book, or soft-deleted).
+        """
+        book_ids = set(book_ids)
+        membership = self._membership(book_ids)
+        known = {
+            book_id for book_id, (is_deleted, _) in membership.items()
+            if not (live_only and is_deleted)
+        }
+        added = {book_id for book_id in known if not membership[book_id][1]}
+        if added:
+            through = self.books.through
+            through.objects.bulk_create(
+                [through(wishlist_id=self.pk, book_id=book_id) for book_id in added],
+                ignore_conflicts=True
+            )
+            self._touch()
+        return {
+            'added': sorted(added),
+            'unchanged': sorted(known - added),
+            'unknown': sorted(book_ids - known),
+        }
 
+    def remove_books(self, book_ids):
+        """
+        Remove many books with one membership query and one DELETE.
+        Soft-deleted books can still be removed.
+        """
+        book_ids = set(book_ids)
+        membership = self._membership(book_ids)
+        removed = {book_id for book_id, (_, in_wishlist) in membership.items() if in_wishlist}
+        if removed:
+            self.books.through.objects.filter(wishlist_id=self.pk, book_id__in=removed).delete()
+            self._touch()
+        unknown = {
+            book_id for book_id in book_ids
+            if book_id not in membership or (membership[book_id][0] and book_id not in removed)
+        }
+        return {
+            'removed': sorted(removed),
+            'unchanged': sorted(book_ids - removed - unknown),
+            'unknown': sorted(unknown),
+        }
 
+    def replace_books(self, book_ids):
+        """Make the wishlist hold exactly the given live books"""
+        book_ids = set(book_ids)
+        through = self.books.through
+        wanted = set(Book.objects.filter(id__in=book_ids).values_list('id', flat=True))
+        current = set(through.objects.filter(wishlist_id=self.pk).values_list('book_id', flat=True))
+        added, removed = wanted - current, current - wanted
+        if removed:
+            through.objects.filter(wishlist_id=self.pk, book_id__in=removed).delete()
+        if added:
+            through.objects.bulk_create(
+                [through(wishlist_id=self.pk, book_id=book_id) for book_id in added],
+                ignore_conflicts=True
+            )
+        if added or removed:
+            self._touch()
+        return {
+            'added': sorted(added),
+            'removed': sorted(removed),
+            'unknown': sorted(book_ids - wanted),
+        }
@@ -0,0 +1,167 @@
+"""
+Precomputed OpenAPI schema.
+
+drf_yasg's schema view introspects every view and ``swagger_auto_schema``
+decorator each time the schema is requested. ``get_cached_schema_view``
+builds the same view, but its JSON and YAML documents are generated once,
+written to ``OPENAPI_SCHEMA_DIR`` and then served from memory with an ETag
+and a ``Cache-Control`` max-age of ``OPENAPI_SCHEMA_MAX_AGE``.
+
+Each artifact records a fingerprint of the project's source code. A process
+that finds the artifact missing or stale regenerates it on its first schema
+request; ``manage.py generate_openapi_schema`` produces it at build time.
+"""
+import hashlib
+import importlib
+import os
+import threading
+from pathlib import Path
+
+import drf_yasg
+from django.apps import apps
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.renderers import _SpecRenderer
+from drf_yasg.views import get_schema_view
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .conditional import not_modified_response, set_validators
+
+CODECS = {'json': OpenAPICodecJson, 'yaml': OpenAPICodecYaml}
+
+# name -> schema view class, filled in as URLconfs are imported
+SCHEMA_VIEWS = {}
+
+
+def source_fingerprint():
+    """Hash of the Python sources of the project's apps and URLconf"""
+    base = Path(settings.BASE_DIR).resolve()
+    roots = {Path(app.path).resolve() for app in apps.get_app_configs()}
+    roots.add(Path(importlib.import_module(settings.ROOT_URLCONF).__file__).resolve().parent)
+    digest = hashlib.sha256(drf_yasg.__version__.encode())
+    for root in sorted(root for root in roots if root.is_relative_to(base)):
+        for path in sorted(root.rglob('*.py')):
+            digest.update(str(path.relative_to(base)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def schema_dir():
+    return Path(getattr(settings, 'OPENAPI_SCHEMA_DIR', Path(settings.BASE_DIR) / 'openapi'))
+
+
+class SchemaArtifact:
+    """The rendered documents of one schema, by format, with their ETags"""
+
+    def __init__(self, fingerprint, documents):
+        self.fingerprint = fingerprint
+        self.documents = documents
+        self.etags = {
+            schema_format: quote_etag(hashlib.sha256(document).hexdigest()[:40])
+            for schema_format, document in documents.items()
+        }
+
+    @classmethod
+    def read(cls, name, fingerprint):
+        """The artifact stored on disk, or None if it is missing or stale"""
+        directory = schema_dir()
+        try:
+            if (directory / f'{name}.fingerprint').read_text().strip() != fingerprint:
+                return None
+            documents = {
+                schema_format: (directory / f'{name}.{schema_format}').read_bytes()
+                for schema_format in CODECS
+            }
+        except OSError:
+            return None
+        return cls(fingerprint, documents)
+
+    def write(self, name):
+        """Store the documents, then the fingerprint that validates them"""
+        directory = schema_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        files = [(f'{name}.{schema_format}', document) for schema_format, document in self.documents.items()]
+        files.append((f'{name}.fingerprint', self.fingerprint.encode()))
+        for filename, content in files:
+            temporary = directory / f'.{filename}.tmp'
+            temporary.write_bytes(content)
+            os.replace(temporary, directory / filename)
+
+
+def get_cached_schema_view(info, name='openapi', url=None, patterns=None, urlconf=None, **kwargs):
+    """
+    ``drf_yasg.views.get_schema_view`` serving a precomputed public schema.
+    The UI pages only show the API's title and version and fetch the spec
+    from the cached documents, so they are rendered without introspection.
+    """
+    base = get_schema_view(info, url=url, patterns=patterns, urlconf=urlconf, public=True, **kwargs)
+
+    class CachedSchemaView(base):
+        schema_name = name
+        _artifact = None
+        _lock = threading.Lock()
+
+        @classmethod
+        def generate(cls):
+            """Introspect the API and render every format"""
+            # Views still look at self.request while being introspected
+            request = Request(RequestFactory().get('/'))
+            generator = cls.generator_class(info, '', url, patterns, urlconf)
+            schema = generator.get_schema(request=request, public=True)
+            if url is None:
+                # Not the fake request's host: UIs then use the one serving them
+                schema.pop('host', None)
+                schema.pop('schemes', None)
+            return {schema_format: codec([]).encode(schema) for schema_format, codec in CODECS.items()}
+
+        @classmethod
+        def get_artifact(cls, fingerprint=None, regenerate=False):
+            """The current artifact: from memory, from disk, or generated and stored"""
+            with cls._lock:
+                if cls._artifact is not None and not regenerate:
+                    return cls._artifact
+                fingerprint = fingerprint or source_fingerprint()
+                artifact = None if regenerate else SchemaArtifact.read(name, fingerprint)
+                if artifact is None:
+                    artifact = SchemaArtifact(fingerprint, cls.generate())
+                    try:
+                        artifact.write(name)
+                    except OSError:
+                        pass  # a read-only deploy still serves it from memory
+                cls._artifact = artifact
+                return artifact
+
+        @classmethod
+        def forget_artifact(cls):
+            with cls._lock:
+                cls._artifact = None
+
+        def get(self, request, version='', format=None):
+            renderer = request.accepted_renderer
+            if not isinstance(renderer, _SpecRenderer):
+                version = request.version or version or ''
+                # The templates only read the title and version
+                return Response(openapi.Swagger(info=info, _url=url, _prefix='/', _version=version,
+                                                paths=openapi.Paths({})))
+            artifact = self.get_artifact()
+            schema_format = 'yaml' if renderer.codec_class is OpenAPICodecYaml else 'json'
+            etag = artifact.etags[schema_format]
+            response = not_modified_response(request, etag, None)
+            if response is None:
+                response = HttpResponse(
+                    artifact.documents[schema_format],
+                    content_type=f'{renderer.media_type}; charset=utf-8',
+                )
+                set_validators(response, etag, None)
+            patch_cache_control(response, public=True, max_age=getattr(settings, 'OPENAPI_SCHEMA_MAX_AGE', 86400))
+            patch_vary_headers(response, ['Accept'])
+            return response
+
+    SCHEMA_VIEWS[name] = CachedSchemaView
+    return CachedSchemaView
@@ -0,0 +1,225 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on ``(field, id)`` instead of using OFFSET,
+    so every page costs the same no matter how deep the client scrolls.
+
+    The sort field is taken from the ordering already applied to the
+    queryset (e.g. by OrderingFilter), falling back to ``default_ordering``.
+    Only non-nullable, indexed columns are accepted as seek keys. Relevance
+    ranking from a search is not a stable key, so cursor mode pages search
+    results by ``default_ordering`` unless an explicit ordering is given.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    default_ordering = '-created_at'
+    keyset_fields = ('created_at', 'price', 'title')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request)
+        return self.finish_page([obj async for obj in page_queryset.aiterator(chunk_size=self.page_size + 1)])
+
+    def get_page_queryset(self, queryset, request):
+        """Build the (lazy) seek query for the requested page"""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+
+        self.cursor = self.decode_cursor(request)
+        self.reverse = self.cursor is not None and self.cursor['reverse']
+        # Walking backwards flips the sort direction; results are re-reversed below
+        step_descending = descending != self.reverse
+        direction = '-' if step_descending else ''
+        queryset = queryset.order_by(f'{direction}{field}', f'{direction}id')
+
+        if self.cursor is not None:
+            lookup = 'lt' if step_descending else 'gt'
+            value = self.cursor['value']
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': value}) |
+                Q(**{field: value, f'id__{lookup}': self.cursor['id']})
+            )
+        return queryset[:self.page_size + 1]
+
+    def finish_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by)
+        if ordering and isinstance(ordering[0], str) and ordering[0].lstrip('-') in self.keyset_fields:
+            return ordering[0]
+        return self.default_ordering
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            cursor = {
+                'ordering': data['o'],
+                'value': self.coerce_value(self.ordering.lstrip('-'), data['v']),
+                'id': self.coerce_id(data['id']),
+                'reverse': bool(data.get('r')),
+            }
+        except (TypeError, ValueError, KeyError, InvalidOperation, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if cursor['ordering'] != self.ordering:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    @staticmethod
+    def coerce_id(value):
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise TypeError(value)
+        return int(value)
+
+    @staticmethod
+    def coerce_value(field, value):
+        """The cursor's seek value as ``field`` stores it; raises on anything else"""
+        if value is None or isinstance(value, (bool, list, dict)):
+            raise TypeError(value)
+        if field == 'created_at':
+            value = parse_datetime(str(value))
+            if value is None:
+                raise ValueError('not a datetime')
+            return value
+        if field == 'price':
+            value = Decimal(str(value))
+            if not value.is_finite():
+                raise ValueError('not a finite number')
+            return float(value)
+        return str(value)
+
+    def encode_cursor(self, instance, reverse):
+        value = getattr(instance, self.ordering.lstrip('-'))
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        data = {'o': self.ordering, 'v': value, 'id': instance.id}
+        if reverse:
+            data['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class BookPagination(PageNumberPagination):
+    """
+    Page-number pagination by default. Clients opt in to keyset pagination
+    per request with ``?pagination=cursor`` (or by following a ``cursor`` link).
+    """
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    mode_query_param = 'pagination'
+    cursor_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async twin of paginate_queryset for the async read views"""
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_class()
+            return await self.cursor_paginator.apaginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Prime the cached count so Paginator never queries synchronously
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        self.page.object_list = [
+            obj async for obj in self.page.object_list.aiterator(chunk_size=page_size)
+        ]
+        return list(self.page)
+
+    def use_cursor(self, request):
+        params = request.query_params
+        return params.get(self.mode_query_param) == 'cursor' or self.cursor_class.cursor_query_param in params
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
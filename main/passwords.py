@@ -0,0 +1,78 @@
+"""
+Password hashing on a bounded thread pool.
+
+PBKDF2 costs hundreds of milliseconds of CPU per password. Hashing runs on
+``PASSWORD_HASH_WORKERS`` threads (one per CPU by default); ``hashlib``
+releases the GIL while it works, so they run in parallel. Async views
+await the result without blocking the event loop, and sync views wait on
+it without more than one hash per core running at any time.
+
+At most ``PASSWORD_HASH_QUEUE_SIZE`` hashes may be running or waiting.
+Beyond that, callers get a 503 at once instead of queuing behind seconds
+of work. ``Account.set_password`` and ``Account.check_password`` go
+through here, so registration, ``/token/`` and the admin all share the
+pool.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import exceptions, status
+
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+class PasswordHashingBusy(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins and registrations in progress, try again shortly.'
+    default_code = 'password_hashing_busy'
+
+
+def get_executor():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 1
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            _slots = threading.BoundedSemaphore(max(getattr(settings, 'PASSWORD_HASH_QUEUE_SIZE', 64), workers))
+        return _executor
+
+
+def submit(function, *args):
+    """Run ``function`` on the pool; returns its concurrent Future"""
+    executor = get_executor()
+    if not _slots.acquire(blocking=False):
+        raise PasswordHashingBusy()
+    try:
+        future = executor.submit(function, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda future: _slots.release())
+    return future
+
+
+def make_password(password):
+    if password is None:
+        return hashers.make_password(None)  # unusable, nothing to hash
+    return submit(hashers.make_password, password).result()
+
+
+async def amake_password(password):
+    if password is None:
+        return hashers.make_password(None)
+    return await asyncio.wrap_future(submit(hashers.make_password, password))
+
+
+def verify_password(password, encoded):
+    """(is_correct, must_update), see ``django.contrib.auth.hashers``"""
+    return submit(hashers.verify_password, password, encoded).result()
+
+
+async def averify_password(password, encoded):
+    return await asyncio.wrap_future(submit(hashers.verify_password, password, encoded))
@@ -0,0 +1,88 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def _related_field(model, source):
+    """Return the model relation a serializer field reads from, or None"""
+    if not source or '.' in source or source == '*':
+        return None
+    try:
+        field = model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+@lru_cache(maxsize=None)
+def get_related_plan(serializer_class):
+    """
+    Walk the nested fields of a ModelSerializer and work out which relations
+    it will touch while rendering.
+
+    Returns a tuple ``(select_related, prefetches)`` where ``select_related``
+    is a tuple of lookups for single-valued relations and ``prefetches`` is a
+    tuple of ``(lookup, model, child_serializer_class)`` entries for
+    multi-valued relations. ``child_serializer_class`` is None when the field
+    only needs the related rows, not a nested plan.
+    """
+    select_related = []
+    prefetches = []
+    model = serializer_class.Meta.model
+
+    for field in serializer_class().fields.values():
+        if field.write_only:
+            continue
+        relation = _related_field(model, field.source)
+        if relation is None:
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            if relation.one_to_many or relation.many_to_many:
+                prefetches.append((field.source, relation.related_model, type(field.child)))
+        elif isinstance(field, serializers.BaseSerializer):
+            if relation.many_to_one or relation.one_to_one:
+                select_related.append(field.source)
+                child_select, child_prefetches = get_related_plan(type(field))
+                select_related.extend(f'{field.source}__{lookup}' for lookup in child_select)
+                prefetches.extend(
+                    (f'{field.source}__{lookup}', related_model, child)
+                    for lookup, related_model, child in child_prefetches
+                )
+        elif isinstance(field, serializers.ManyRelatedField):
+            prefetches.append((field.source, relation.related_model, None))
+        elif isinstance(field, serializers.RelatedField):
+            if not field.use_pk_only_optimization() and (relation.many_to_one or relation.one_to_one):
+                select_related.append(field.source)
+
+    return tuple(select_related), tuple(prefetches)
+
+
+def optimize_queryset(queryset, serializer_class):
+    """Apply the joins and prefetches ``serializer_class`` needs to ``queryset``"""
+    if getattr(getattr(serializer_class, 'Meta', None), 'model', None) is not queryset.model:
+        return queryset
+
+    select_related, prefetches = get_related_plan(serializer_class)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    for lookup, related_model, child in prefetches:
+        if child is None:
+            queryset = queryset.prefetch_related(lookup)
+        else:
+            child_queryset = optimize_queryset(related_model._default_manager.all(), child)
+            queryset = queryset.prefetch_related(Prefetch(lookup, queryset=child_queryset))
+    return queryset
+
+
+class QueryPlanMixin:
+    """
+    Generic view mixin that optimizes the filtered queryset for the view's
+    serializer, so nested serializers don't trigger a query per row.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return optimize_queryset(queryset, self.get_serializer_class())
@@ -0,0 +1,33 @@
+"""
+Local replication stand-in for the SQLite read replicas.
+
+Production replicas would be kept in sync by the database (or a tool such
+as Litestream / LiteFS). Locally each replica is a plain SQLite file that
+``sync_replicas`` refreshes from the primary with SQLite's online backup
+API, which copies a consistent snapshot while the primary stays writable.
+"""
+import sqlite3
+from contextlib import closing
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def sync_replica(alias, source=DEFAULT_DB_ALIAS):
+    source_name = str(connections[source].settings_dict['NAME'])
+    target_name = str(connections[alias].settings_dict['NAME'])
+    if connections[source].vendor != 'sqlite' or connections[alias].vendor != 'sqlite':
+        raise ValueError('The replication stand-in only copies SQLite databases')
+    if source_name == target_name:
+        return  # a test mirror of the primary
+    # Drop Django's idle connection so the copy does not wait on its locks
+    connections[alias].close()
+    with closing(sqlite3.connect(source_name)) as primary, closing(sqlite3.connect(target_name)) as replica:
+        primary.backup(replica)
+
+
+def sync_replicas(aliases=None, source=DEFAULT_DB_ALIAS):
+    aliases = list(aliases if aliases is not None else getattr(settings, 'DATABASE_REPLICAS', []))
+    for alias in aliases:
+        sync_replica(alias, source)
+    return aliases
@@ -0,0 +1,166 @@
+"""
+Read-replica routing for catalog reads.
+
+Everything goes to ``default`` unless a view explicitly opts in with
+``ReplicaReadMixin``: then, for a safe request, reads of the catalog models
+(books, their images and the owners nested in them) go to one replica picked
+for the whole request. Authentication, permission checks and every write
+still use the primary.
+
+Read-your-writes: ``ReplicaRoutingMiddleware`` remembers users who wrote
+anything. For ``REPLICA_STICKINESS_SECONDS`` afterwards their reads stay on
+the primary, so a client never reads a replica that has not caught up with
+its own change. Once a request writes, its remaining reads use the primary
+too. Writers are remembered in the ``REPLICA_STICKINESS_CACHE_ALIAS``
+cache, which has to be shared (Redis) when several workers serve the same
+users; with a per-process locmem cache a write is only honoured by the
+worker that took it.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+
+CATALOG_MODELS = {'main.book', 'main.image', 'main.account'}
+
+_state = ContextVar('replica_routing', default=None)
+
+
+class RoutingState:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+def _sticky_key(user_id):
+    return f'db:read-primary:{user_id}'
+
+
+def _stickiness_cache():
+    return caches[getattr(settings, 'REPLICA_STICKINESS_CACHE_ALIAS', 'default')]
+
+
+def mark_sticky(user_id):
+    """Keep ``user_id``'s reads on the primary for the stickiness window"""
+    _stickiness_cache().set(_sticky_key(user_id), True, getattr(settings, 'REPLICA_STICKINESS_SECONDS', 5))
+
+
+def is_sticky(user_id):
+    return user_id is not None and _stickiness_cache().get(_sticky_key(user_id), False)
+
+
+async def ais_sticky(user_id):
+    return user_id is not None and await _stickiness_cache().aget(_sticky_key(user_id), False)
+
+
+def choose_replica():
+    replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+    return random.choice(replicas) if replicas else None
+
+
+def start_request():
+    state = RoutingState()
+    return state, _state.set(state)
+
+
+def end_request(token):
+    _state.reset(token)
+
+
+def use_replica():
+    """Send the current request's catalog reads to a replica from now on"""
+    state = _state.get()
+    if state is not None and not state.wrote:
+        state.replica = choose_replica()
+
+
+def current_replica():
+    """The replica the current request reads the catalog from, if any"""
+    state = _state.get()
+    if state is None or state.wrote:
+        return None
+    return state.replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in CATALOG_MODELS:
+            return None
+        return current_replica()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+            state.replica = None
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {'default', *getattr(settings, 'DATABASE_REPLICAS', [])}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Tracks routing state per request and records writers for stickiness"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        self.remember_writer(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        self.remember_writer(request, state)
+        return response
+
+    def remember_writer(self, request, state):
+        if not state.wrote:
+            return
+        # DRF stores the user it authenticated on the Django request
+        user = getattr(request, 'user', None)
+        if user is not None and getattr(user, 'is_authenticated', False):
+            mark_sticky(user.pk)
+
+
+class ReplicaReadMixin:
+    """
+    Lets a read-only view serve its catalog queries from a replica. Runs
+    after authentication so the user's stickiness window can be honoured.
+
+    Responses that go into the response cache (``CachedResponseMixin``) are
+    built from the primary: a lagging replica's rows would otherwise be
+    cached under the latest version and outlive the lag by the cache timeout.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS or self.fills_response_cache(request):
+            return
+        if not is_sticky(request.user.pk):
+            use_replica()
+
+    def fills_response_cache(self, request):
+        is_cacheable = getattr(self, 'is_cacheable', None)
+        return is_cacheable is not None and is_cacheable(request)
@@ -0,0 +1,123 @@
+from django.db import connections
+from rest_framework.filters import SearchFilter
+
+# External-content FTS5 index over main_book(title, details). The triggers keep
+# it in sync for every write path, including bulk_create and queryset.update().
+FTS_TABLE = 'main_book_fts'
+
+CREATE_INDEX_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, details,
+        content='main_book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON main_book BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, details)
+        VALUES (new.id, new.title, new.details);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON main_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, details)
+        VALUES ('delete', old.id, old.title, old.details);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, details ON main_book BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, details)
+        VALUES ('delete', old.id, old.title, old.details);
+        INSERT INTO {FTS_TABLE}(rowid, title, details)
+        VALUES (new.id, new.title, new.details);
+    END
+    """,
+]
+
+DROP_INDEX_SQL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+# bm25 column weights: a hit in the title counts more than one in the details
+BM25_WEIGHTS = (4.0, 1.0)
+
+
+def supports_full_text_search(connection):
+    return connection.vendor == 'sqlite'
+
+
+def install_search_index(connection):
+    """Create the FTS5 table and its sync triggers (idempotent)"""
+    if not supports_full_text_search(connection):
+        return
+    with connection.cursor() as cursor:
+        for sql in CREATE_INDEX_SQL:
+            cursor.execute(sql)
+
+
+def drop_search_index(connection):
+    if not supports_full_text_search(connection):
+        return
+    with connection.cursor() as cursor:
+        for sql in DROP_INDEX_SQL:
+            cursor.execute(sql)
+
+
+def rebuild_search_index(using='default', optimize=False):
+    """Re-read every row of main_book into the index in one bulk pass"""
+    connection = connections[using]
+    install_search_index(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        if optimize:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def build_match_expression(terms):
+    """
+    Turn search terms into an FTS5 MATCH expression. Every term becomes a
+    quoted prefix phrase, so user input can never inject FTS5 query syntax,
+    and all terms must match (same semantics as SearchFilter).
+    """
+    phrases = []
+    for term in terms:
+        if not any(char.isalnum() for char in term):
+            continue
+        phrases.append('"%s"*' % term.replace('"', '""'))
+    return ' '.join(phrases)
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    SearchFilter backed by the FTS5 index. Results are ranked by bm25 unless
+    the client asks for an explicit ordering. Any other filters on the
+    queryset (is_deleted, status, account) still apply. Falls back to the
+    regular LIKE search on databases without FTS5.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+        if not search_fields or not search_terms:
+            return queryset
+
+        connection = connections[queryset.db]
+        match = build_match_expression(search_terms)
+        if not match or not supports_full_text_search(connection):
+            return super().filter_queryset(request, queryset, view)
+
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+        return queryset.extra(
+            select={'search_rank': f'bm25({FTS_TABLE}, {weights})'},
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+            order_by=['search_rank'],
+        )
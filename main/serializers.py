@@ -1,15 +1,32 @@
+from asgiref.sync import sync_to_async
 from rest_framework import serializers
-from django.contrib.auth import get_user_model
+from rest_framework.exceptions import AuthenticationFailed
+from django.contrib.auth import aauthenticate, get_user_model
+from django.contrib.auth.models import update_last_login
+from django.db import transaction
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from . import passwords
+from .authentication import VERSION_CLAIM, add_token_claims, check_token_version, get_token_version
+from .db import serialized_writes
+from .fast_serializers import CompiledSerializerMixin
+from .images import schedule_variants, variant_urls
 from .models import Account, Book, Image, WishList
+from .storage import file_digest, name_digest
 
 Account = get_user_model()
 
 class AccountSerializer(serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Account
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'image', 'date_joined']
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'image', 'image_variants', 'date_joined']
         read_only_fields = ['date_joined']
 
+    def get_image_variants(self, obj) -> dict:
+        return variant_urls(obj, self.context.get('request'))
+
 class AccountPostSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
     confirm_password = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
@@ -24,17 +41,63 @@ class AccountPostSerializer(serializers.ModelSerializer):
         return data
 
     def create(self, validated_data):
+        """
+        The account and its wishlist are created in one transaction. The
+        password is hashed before it (async callers pass ``encoded_password``
+        to ``save()``), so no write lock is held while PBKDF2 runs.
+        """
         validated_data.pop('confirm_password')
-        user = Account.objects.create_user(**validated_data)
-        return user
+        password = validated_data.pop('password')
+        encoded_password = validated_data.pop('encoded_password', None) or passwords.make_password(password)
+        account = Account(**validated_data)
+        account.username = Account.normalize_username(account.username)
+        account.email = Account.objects.normalize_email(account.email)
+        account.password = encoded_password
+        with serialized_writes(), transaction.atomic():
+            account.save()
+            WishList.objects.create(account=account)
+        return account
+
+class AccountTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Adds the claims StatelessJWTAuthentication trusts instead of a user lookup"""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_token_claims(super().get_token(user), user)
+
+    async def avalidate(self, attrs):
+        """``validate`` for async views: the password is checked on the hashing pool"""
+        credentials = {self.username_field: attrs[self.username_field], 'password': attrs['password']}
+        self.user = await aauthenticate(self.context.get('request'), **credentials)
+        if not jwt_settings.USER_AUTHENTICATION_RULE(self.user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        refresh = self.get_token(self.user)
+        if jwt_settings.UPDATE_LAST_LOGIN:
+            await sync_to_async(update_last_login)(None, self.user)
+        return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+
+class AccountTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses refresh tokens revoked through Account.token_version"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if VERSION_CLAIM in refresh:
+            check_token_version(refresh, get_token_version(refresh[jwt_settings.USER_ID_CLAIM]))
+        return super().validate(attrs)
 
 class ImageSerializer(serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Image
-        fields = ['id', 'image', 'is_cover', 'book', 'created_at']
-        read_only_fields = ['created_at']
+        fields = ['id', 'image', 'image_variants', 'is_cover', 'book', 'created_at']
+        # The owning book comes from the parent when images are nested
+        read_only_fields = ['book', 'created_at']
+
+    def get_image_variants(self, obj) -> dict:
+        return variant_urls(obj, self.context.get('request'))
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(CompiledSerializerMixin, serializers.ModelSerializer):
     images = ImageSerializer(many=True, read_only=True)
     account = AccountSerializer(read_only=True)
 
@@ -44,8 +107,12 @@ class BookSerializer(serializers.ModelSerializer):
                  'created_at', 'updated_at', 'is_deleted']
         read_only_fields = ['created_at', 'updated_at', 'is_deleted']
 
+class BookImageSerializer(ImageSerializer):
+    """Nested in BookPostSerializer; ``id`` refers to an image the book already has"""
+    id = serializers.IntegerField(required=False)
+
 class BookPostSerializer(serializers.ModelSerializer):
-    images = ImageSerializer(many=True, required=False)
+    images = BookImageSerializer(many=True, required=False)
 
     class Meta:
         model = Book
@@ -58,31 +125,124 @@ class BookPostSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Price cannot exceed 1,000,000")
         return value
 
+    def validate_images(self, value):
+        """Image ids must name distinct images the book already has"""
+        ids = [item['id'] for item in value if 'id' in item]
+        if not ids:
+            return value
+        owned = set()
+        if self.instance is not None:
+            owned = set(self.instance.images.filter(pk__in=ids).values_list('pk', flat=True))
+        errors = [f'Image {pk} does not belong to this book.' for pk in ids if pk not in owned]
+        repeated = sorted({pk for pk in ids if ids.count(pk) > 1})
+        errors.extend(f'Image {pk} is listed more than once.' for pk in repeated)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return value
+
     def create(self, validated_data):
         images_data = validated_data.pop('images', [])
         book = Book.objects.create(**validated_data)
         
         for image_data in images_data:
+            image_data.pop('id', None)
             Image.objects.create(book=book, **image_data)
         
         return book
 
+    @staticmethod
+    def bulk_create(items, **extra):
+        """
+        Insert already-validated books with one bulk INSERT for the books and
+        one for all of their images. Returns the created books in order.
+        """
+        books = []
+        images_per_book = []
+        for validated_data in items:
+            validated_data = dict(validated_data, **extra)
+            images_per_book.append(validated_data.pop('images', []))
+            books.append(Book(**validated_data))
+        Book.objects.bulk_create(books)
+
+        images = [
+            Image(book=book, **{key: value for key, value in image_data.items() if key != 'id'})
+            for book, images_data in zip(books, images_per_book)
+            for image_data in images_data
+        ]
+        Image.objects.bulk_create(images)
+        for image in images:
+            if image.image:
+                schedule_variants(image)
+        return books
+
     def update(self, instance, validated_data):
-        images_data = validated_data.pop('images', [])
-        
-        # Update book fields
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        
-        # Update images if provided
-        if images_data:
-            instance.images.all().delete()  # Remove existing images
-            for image_data in images_data:
-                Image.objects.create(book=instance, **image_data)
-        
+        # Without 'images' the book keeps its images; an empty list removes them all
+        images_data = validated_data.pop('images', None)
+        with transaction.atomic():
+            if images_data is not None:
+                self.update_images(instance, images_data)
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
         return instance
 
+    @staticmethod
+    def update_images(book, images_data):
+        """
+        Make the book's images match ``images_data``. Items are matched to
+        the existing images by ``id``, then the remaining images by the
+        content hash of the other items' uploads; matched rows keep their files and URLs. Only new items are
+        inserted, only images left unmatched are deleted, and cover flags
+        change in one bulk update, so the queries don't grow with the
+        number of images.
+        """
+        existing = {image.pk: image for image in book.images.only('id', 'book_id', 'image', 'is_cover')}
+        by_digest = {name_digest(image.image.name): image for image in existing.values() if image.image}
+        by_digest.pop(None, None)
+
+        # Ids first, so an upload matching an image by content can't claim
+        # one that a later item names explicitly
+        matches, unmatched = [], []
+        for item in images_data:
+            if 'id' not in item:
+                unmatched.append(item)
+            elif item['id'] in existing:
+                matches.append((existing[item['id']], item, item.get('image')))
+            # else: deleted since validation
+        kept = {image.pk for image, _, _ in matches}
+
+        added = []
+        for item in unmatched:
+            upload = item.get('image')
+            image = by_digest.get(file_digest(upload)) if upload and by_digest else None
+            if image is None or image.pk in kept:
+                added.append(Image(book=book, image=upload, is_cover=item.get('is_cover', False)))
+                continue
+            kept.add(image.pk)
+            matches.append((image, item, None))  # identical to the stored file
+
+        covers, replaced = [], []
+        for image, item, upload in matches:
+            if upload and name_digest(image.image.name or '') != file_digest(upload):
+                image.image = upload
+                replaced.append(image)
+            if 'is_cover' in item and item['is_cover'] != image.is_cover:
+                image.is_cover = item['is_cover']
+                covers.append(image)
+
+        removed = existing.keys() - kept
+        if removed:
+            Image.objects.filter(pk__in=removed).delete()
+        if covers:
+            Image.objects.bulk_update(covers, ['is_cover'])
+        for image in replaced:
+            image.save(update_fields=['image'])
+        if added:
+            Image.objects.bulk_create(added)
+            for image in added:
+                if image.image:
+                    schedule_variants(image)
+
 class BookMarkSoldSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
@@ -101,3 +261,25 @@ class WishListSerializer(serializers.ModelSerializer):
         model = WishList
         fields = ['id', 'account', 'books', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
+
+class WishListBooksSerializer(serializers.Serializer):
+    book_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=True,
+        max_length=1000
+    )
+
+class BookStatusSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Book.STATUS_CHOICES)
+    expected_status = serializers.ChoiceField(
+        choices=Book.STATUS_CHOICES,
+        required=False,
+        help_text='Only change books that are still in this status'
+    )
+
+class BookBulkStatusSerializer(BookStatusSerializer):
+    book_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=1000
+    )
@@ -0,0 +1,106 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .authentication import forget_token_version
+from .cache import response_cache
+from .file_deletions import image_file_names, queue_file_deletions
+from .images import needs_variants, schedule_variants
+from .models import Account, Book, Image, WishList, book_status_changed
+
+# Account fields that show up nested in BookSerializer
+RENDERED_ACCOUNT_FIELDS = {'username', 'email', 'first_name', 'last_name', 'image', 'image_variants'}
+
+
+def invalidate_books_on_commit(book_ids):
+    """
+    Drop the cached responses now and again once the write commits. A read
+    between the two still sees the old rows and would otherwise cache them
+    under the version that is meant to be fresh.
+    """
+    response_cache.invalidate_books(book_ids)
+    transaction.on_commit(lambda: response_cache.invalidate_books(book_ids))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book(sender, instance, **kwargs):
+    invalidate_books_on_commit([instance.pk])
+
+
+@receiver(book_status_changed, sender=Book)
+def invalidate_book_statuses(sender, book_ids, **kwargs):
+    invalidate_books_on_commit(book_ids)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def invalidate_book_image(sender, instance, **kwargs):
+    # Images have no updated_at of their own; bump the book's so its
+    # ETag/Last-Modified change with them
+    Book.all_with_deleted.filter(pk=instance.book_id).update(updated_at=timezone.now())
+    invalidate_books_on_commit([instance.book_id])
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_account_books(sender, instance, update_fields=None, created=False, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not RENDERED_ACCOUNT_FIELDS.intersection(update_fields):
+        return
+    book_ids = Book.all_with_deleted.filter(account_id=instance.pk).values_list('id', flat=True)
+    invalidate_books_on_commit(list(book_ids))
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def forget_account_token_version(sender, instance, **kwargs):
+    # is_active, password and token_version changes must reach stateless
+    # JWT authentication without waiting for its cache TTL
+    forget_token_version(instance.pk)
+
+
+@receiver(m2m_changed, sender=WishList.books.through)
+def touch_wishlist(sender, instance, action, reverse, pk_set, **kwargs):
+    # Membership changes don't save the WishList row; bump updated_at so the
+    # wishlist's ETag/Last-Modified follow them
+    if reverse:
+        if action == 'pre_clear':
+            wishlists = WishList.objects.filter(books=instance)
+        elif action in ('post_add', 'post_remove'):
+            wishlists = WishList.objects.filter(pk__in=pk_set)
+        else:
+            return
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        wishlists = WishList.objects.filter(pk=instance.pk)
+    else:
+        return
+    wishlists.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_save, sender=Account)
+def build_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw and needs_variants(instance):
+        schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Image)
+@receiver(post_delete, sender=Account)
+def queue_deleted_image_files(sender, instance, **kwargs):
+    # Also sent for queryset and cascade deletes; queued in their transaction
+    queue_file_deletions(image_file_names(instance))
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_save, sender=Account)
+def queue_replaced_image_file(sender, instance, raw=False, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    current = instance.image.name or None
+    if not raw and instance._stored_image and instance._stored_image != current:
+        # Its variants go when the new image's variants are built
+        queue_file_deletions([instance._stored_image])
+    instance._stored_image = current
@@ -0,0 +1,146 @@
+"""
+Content-addressed media storage.
+
+Uploads are hashed while they are streamed to disk and stored under their
+SHA-256, ``books/ab/ab12…ef.jpg``, so identical bytes are kept once however
+many rows use them. ``StoredFile`` counts the references to each file: every
+``save`` adds one and every ``delete`` releases one, and the file is only
+removed with its last reference. ``delete`` only queues the release (see
+``main.file_deletions``): rows deleted or given a new file queue theirs in
+the same transaction, image variants are saved and released the same way,
+and shared files survive until nobody uses them.
+
+Files saved before this storage (no ``StoredFile`` row) are deleted on
+their first release; ``manage.py dedupe_media`` moves them into the layout.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+CHUNK_SIZE = 64 * 1024
+
+CONTENT_ADDRESSED_NAME = re.compile(r'^(?:[^/]+/)?[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?$')
+
+
+def content_name(name, digest):
+    """books/cover.JPG + digest -> books/ab/ab12…ef.jpg (the top directory is kept)"""
+    root = name.split('/', 1)[0] if '/' in name else ''
+    extension = os.path.splitext(name)[1].lower()
+    return '/'.join(part for part in (root, digest[:2], f'{digest}{extension}') if part)
+
+
+def is_content_addressed(name):
+    return bool(name and CONTENT_ADDRESSED_NAME.match(name))
+
+
+def name_digest(name):
+    """The SHA-256 in a content-addressed name, None for other names"""
+    return os.path.splitext(os.path.basename(name))[0] if is_content_addressed(name) else None
+
+
+def file_digest(file):
+    """SHA-256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content, see _save
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        os.makedirs(self.location, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.location, prefix='.upload-', delete=False) as temporary:
+            try:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    temporary.write(chunk)
+            except BaseException:
+                temporary.close()
+                os.unlink(temporary.name)
+                raise
+        name = content_name(name, digest.hexdigest())
+        # Take the reference before placing the file: a delete releasing the
+        # last reference to the same content either finished first (and the
+        # file is put back below) or now sees this one
+        self.retain(name)
+        self.place(temporary.name, name)
+        return name
+
+    def place(self, source_path, name):
+        """
+        Move a file into ``name`` unless an identical copy is already there.
+        Returns False when the file was a duplicate.
+        """
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            try:
+                # Referenced again: an orphan scan must not see an old file
+                os.utime(full_path)
+            except FileNotFoundError:
+                pass  # released meanwhile, put this copy in its place
+            else:
+                os.unlink(source_path)
+                return False
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        os.replace(source_path, full_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return True
+
+    def adopt(self, name):
+        """
+        Move a file saved before this storage to its content-addressed name.
+        Returns the new name and whether an identical file already had it.
+        References are not counted; see ``dedupe_media``.
+        """
+        if is_content_addressed(name):
+            return name, False
+        with self.open(name, 'rb') as file:
+            new_name = content_name(name, file_digest(file))
+        return new_name, not self.place(self.path(name), new_name)
+
+    def retain(self, name):
+        """Add a reference to ``name``"""
+        from .models import StoredFile
+
+        if StoredFile.objects.filter(name=name).update(refcount=F('refcount') + 1):
+            return
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, refcount=1)
+        except IntegrityError:
+            StoredFile.objects.filter(name=name).update(refcount=F('refcount') + 1)
+
+    def delete(self, name):
+        """Queue the release of a reference to ``name`` (see ``release``)"""
+        from .file_deletions import queue_file_deletions
+
+        if not name:
+            raise ValueError('The name must be given to delete().')
+        queue_file_deletions([name])
+
+    def release(self, name, count=1):
+        """Release ``count`` references to ``name``; the last one removes the file"""
+        from .models import StoredFile
+
+        with transaction.atomic():
+            if StoredFile.objects.filter(name=name, refcount__gt=count).update(refcount=F('refcount') - count):
+                return
+            StoredFile.objects.filter(name=name).delete()
+            super().delete(name)
+
+    def references(self, name):
+        from .models import StoredFile
+
+        return StoredFile.objects.filter(name=name).values_list('refcount', flat=True).first() or 0
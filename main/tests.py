@@ -1,13 +1,65 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+from base64 import urlsafe_b64encode
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.urls import reverse
-from rest_framework.test import APITestCase
-from rest_framework import status
-from .models import Book, Image, WishList
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework import serializers, status
+from rest_framework_simplejwt.tokens import RefreshToken
+from PIL import Image as PILImage
+from .archival import archivable_books, archive_deleted_books, purge_archived_files, retention_cutoff
+from .authentication import user_cache
+from .cache import response_cache
+from .db import _write_lock, serialized_writes
+from .file_deletions import process_file_deletions, queue_orphaned_files, walk_media
+from .routers import ReplicaRouter, end_request, mark_sticky, start_request, use_replica
+from .openapi import SCHEMA_VIEWS
+from .models import ArchivedBook, Book, FileDeletion, Image, StatusConflict, StoredFile, WishList
+from .serializers import AccountPostSerializer, BookPostSerializer, BookSerializer, ImageSerializer, WishListSerializer
+from .throttling import reset_throttles
+from . import passwords
 
 Account = get_user_model()
 
+
+class QueryBudgetMixin:
+    """Fail when a block runs more than a fixed number of queries"""
+
+    @contextmanager
+    def assertMaxQueries(self, limit, using=DEFAULT_DB_ALIAS):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        executed = len(context.captured_queries)
+        self.assertLessEqual(
+            executed, limit,
+            '%d queries executed, at most %d allowed:\n%s' % (
+                executed, limit,
+                '\n'.join(query['sql'] for query in context.captured_queries)
+            )
+        )
+
 class AccountTestCase(TestCase):
     def setUp(self):
         self.account = Account.objects.create_user(
@@ -87,8 +139,8 @@ class BookTestCase(TestCase):
     def test_book_soft_delete(self):
         self.book.soft_delete()
         self.assertTrue(self.book.is_deleted)
-        self.assertEqual(Book.objects.count(), 2)  # Still in database
-        self.assertEqual(Book.objects.filter(is_deleted=False).count(), 1)
+        self.assertEqual(Book.all_with_deleted.count(), 2)  # Still in database
+        self.assertEqual(Book.objects.count(), 1)
 
     def test_book_str(self):
         self.assertEqual(str(self.book), 'Test book')
@@ -316,3 +368,1855 @@ class AccountAPITestCase(APITestCase):
         self.assertEqual(self.account.username, 'updateduser')
 
 
+class ListQueryBudgetTestCase(QueryBudgetMixin, APITestCase):
+    # validator + count + page + images prefetch, plus the wishlist lookup
+    LIST_QUERY_BUDGET = 5
+
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.wishlist = WishList.objects.create(account=self.account)
+        for i in range(30):
+            book = Book.objects.create(
+                title=f'Book {i}',
+                price=1000.0 + i,
+                account=self.account
+            )
+            Image.objects.create(book=book, is_cover=True)
+            Image.objects.create(book=book)
+            self.wishlist.books.add(book)
+        self.client.force_authenticate(user=self.account)
+
+    def test_list_endpoints_stay_within_budget(self):
+        for url in ['/books/', '/books/mine/', '/accounts/my-wish-list/']:
+            for page_size in [5, 30]:
+                with self.subTest(url=url, page_size=page_size):
+                    with self.assertMaxQueries(self.LIST_QUERY_BUDGET):
+                        response = self.client.get(url, {'page_size': page_size})
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    self.assertEqual(len(response.data['results']), page_size)
+                    self.assertEqual(len(response.data['results'][0]['images']), 2)
+                    self.assertEqual(response.data['results'][0]['account']['username'], 'testuser')
+
+    def test_detail_stays_within_budget(self):
+        book = Book.objects.first()
+        with self.assertMaxQueries(3):
+            response = self.client.get(f'/books/{book.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class FullTextSearchTestCase(APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.python_title = Book.objects.create(
+            title='Learning Python',
+            details='A beginner friendly guide',
+            price=100.0,
+            account=self.account
+        )
+        self.python_details = Book.objects.create(
+            title='Programming cookbook',
+            details='Recipes in Python and Go',
+            price=50.0,
+            account=self.account
+        )
+        self.other = Book.objects.create(
+            title='Gardening',
+            details='Growing tomatoes',
+            price=20.0,
+            status='sold',
+            account=self.account
+        )
+
+    def search(self, url='/books/', **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book['id'] for book in response.data['results']]
+
+    def test_search_ranks_title_matches_first(self):
+        self.assertEqual(self.search(search='python'), [self.python_title.id, self.python_details.id])
+
+    def test_search_matches_prefixes_and_requires_all_terms(self):
+        self.assertEqual(self.search(search='garden tomato'), [self.other.id])
+        self.assertEqual(self.search(search='python tomato'), [])
+
+    def test_search_respects_filters(self):
+        self.python_details.soft_delete()
+        self.assertEqual(self.search(search='python'), [self.python_title.id])
+        self.assertEqual(self.search(search='gardening', status='available'), [])
+
+    def test_explicit_ordering_overrides_rank(self):
+        self.assertEqual(
+            self.search(search='python', ordering='price'),
+            [self.python_details.id, self.python_title.id]
+        )
+
+    def test_index_follows_updates(self):
+        self.other.title = 'Orchids'
+        self.other.save()
+        self.assertEqual(self.search(search='gardening'), [])
+        self.assertEqual(self.search(search='orchids'), [self.other.id])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.search(search='"python OR NEAR('), [])
+        self.assertEqual(self.search(search='***'), [])
+
+    def test_my_books_search(self):
+        self.client.force_authenticate(user=self.account)
+        self.assertEqual(self.search('/books/mine/', search='cookbook'), [self.python_details.id])
+
+    def test_rebuild_command(self):
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 3 books', out.getvalue())
+        self.assertEqual(self.search(search='python'), [self.python_title.id, self.python_details.id])
+
+
+class KeysetPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.wishlist = WishList.objects.create(account=self.account)
+        # Duplicate prices make sure ties are broken by id
+        for i in range(11):
+            book = Book.objects.create(
+                title=f'Book {i:02d}',
+                price=float(i // 3),
+                account=self.account
+            )
+            self.wishlist.books.add(book)
+        self.client.force_authenticate(user=self.account)
+
+    def walk(self, url, params):
+        ids, pages = [], []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            pages.append(response.data)
+            ids.extend(book['id'] for book in response.data['results'])
+            if not response.data['next']:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_pages_match_ordering(self):
+        cases = [
+            ('/books/', {}, Book.objects.order_by('-created_at', '-id')),
+            ('/books/', {'ordering': 'price'}, Book.objects.order_by('price', 'id')),
+            ('/books/', {'ordering': '-price'}, Book.objects.order_by('-price', '-id')),
+            ('/books/mine/', {'ordering': 'title'}, Book.objects.order_by('title', 'id')),
+            ('/accounts/my-wish-list/', {}, Book.objects.order_by('title', 'id')),
+        ]
+        for url, params, expected in cases:
+            with self.subTest(url=url, params=params):
+                ids, pages = self.walk(url, {'pagination': 'cursor', 'page_size': 4, **params})
+                self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+                self.assertEqual(len(pages), 3)
+                self.assertIsNone(pages[0]['previous'])
+
+    def test_previous_link_walks_back(self):
+        _, pages = self.walk('/books/', {'pagination': 'cursor', 'page_size': 4, 'ordering': 'price'})
+        response = self.client.get(pages[2]['previous'])
+        self.assertEqual(response.data['results'], pages[1]['results'])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(response.data['results'], pages[0]['results'])
+        self.assertIsNone(response.data['previous'])
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get('/books/', {'page_size': 4, 'page': 2})
+        self.assertEqual(response.data['count'], 11)
+        self.assertEqual(len(response.data['results']), 4)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/books/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tampered_cursor_values(self):
+        cases = [
+            ('price', {'a': 1}, 1),
+            ('price', None, 1),
+            ('price', 'NaN', 1),
+            ('title', ['Book'], 1),
+            ('-created_at', '2020-13-45T00:00:00', 1),
+            ('-created_at', None, 1),
+            ('price', 1.0, {'id': 1}),
+            ('price', 1.0, None),
+        ]
+        for ordering, value, book_id in cases:
+            with self.subTest(ordering=ordering, value=value, id=book_id):
+                data = json.dumps({'o': ordering, 'v': value, 'id': book_id}).encode()
+                cursor = urlsafe_b64encode(data).decode('ascii')
+                response = self.client.get('/books/', {'cursor': cursor, 'ordering': ordering})
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ResponseCacheTestCase(APITestCase):
+    def setUp(self):
+        response_cache.backend.clear()
+        response_cache.reset_stats()
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.book = Book.objects.create(
+            title='Test book',
+            price=30000.0,
+            account=self.account
+        )
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_anonymous_list_and_detail_are_cached(self):
+        for url in ['/books/', f'/books/{self.book.pk}/']:
+            with self.subTest(url=url):
+                self.assertEqual(self.get(url)['X-Cache'], 'MISS')
+                with self.assertNumQueries(0):
+                    response = self.get(url)
+                self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response_cache.stats(), {'hits': 2, 'misses': 2})
+
+    def test_query_string_is_normalized(self):
+        self.get('/books/', {'status': 'available', 'ordering': 'price', 'search': ''})
+        response = self.client.get('/books/?ordering=price&status=available')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(self.get('/books/', {'ordering': '-price'})['X-Cache'], 'MISS')
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.force_authenticate(user=self.account)
+        self.get('/books/')
+        self.assertNotIn('X-Cache', self.get('/books/'))
+        self.assertEqual(response_cache.stats(), {'hits': 0, 'misses': 0})
+
+    def test_book_changes_invalidate(self):
+        detail_url = f'/books/{self.book.pk}/'
+        for change in [self.book.mark_as_sold, self.book.mark_as_reserved, self.book.soft_delete]:
+            with self.subTest(change=change.__name__):
+                self.get('/books/')
+                self.get(detail_url)
+                change()
+                self.assertEqual(self.client.get('/books/')['X-Cache'], 'MISS')
+                self.assertEqual(self.client.get(detail_url)['X-Cache'], 'MISS')
+
+    def test_responses_cached_before_commit_are_dropped(self):
+        detail_url = f'/books/{self.book.pk}/'
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.book.title = 'Renamed'
+            self.book.save()
+            # A read racing the commit, cached after the first bump
+            self.get(detail_url)
+            self.assertEqual(self.get(detail_url)['X-Cache'], 'HIT')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.get(detail_url)['X-Cache'], 'MISS')
+
+    def test_other_books_detail_survives(self):
+        other = Book.objects.create(title='Other', price=1.0, account=self.account)
+        self.get(f'/books/{other.pk}/')
+        self.book.mark_as_sold()
+        self.assertEqual(self.get(f'/books/{other.pk}/')['X-Cache'], 'HIT')
+
+    def test_image_and_account_changes_invalidate(self):
+        detail_url = f'/books/{self.book.pk}/'
+        self.get(detail_url)
+        image = Image.objects.create(book=self.book)
+        self.assertEqual(self.get(detail_url)['X-Cache'], 'MISS')
+        image.delete()
+        self.assertEqual(self.get(detail_url)['X-Cache'], 'MISS')
+
+        self.account.first_name = 'Renamed'
+        self.account.save()
+        response = self.get(detail_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['account']['first_name'], 'Renamed')
+
+        self.account.save(update_fields=['last_login'])
+        self.assertEqual(self.get(detail_url)['X-Cache'], 'HIT')
+
+
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.book = Book.objects.create(
+            title='Test book',
+            price=30000.0,
+            account=self.account
+        )
+        self.wishlist = WishList.objects.create(account=self.account)
+        self.client.force_authenticate(user=self.account)
+
+    def revalidate(self, url, etag, expected_status):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, expected_status)
+        return response
+
+    def test_detail_returns_304_until_book_changes(self):
+        url = f'/books/{self.book.pk}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = self.revalidate(url, etag, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        Image.objects.create(book=self.book)
+        etag = self.revalidate(url, etag, status.HTTP_200_OK)['ETag']
+        self.book.mark_as_sold()
+        etag = self.revalidate(url, etag, status.HTTP_200_OK)['ETag']
+        self.account.first_name = 'Renamed'
+        self.account.save()
+        self.revalidate(url, etag, status.HTTP_200_OK)
+
+    def test_list_aggregate_validator(self):
+        for url in ['/books/', '/books/mine/']:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(1):
+                    self.revalidate(url, etag, status.HTTP_304_NOT_MODIFIED)
+                other = Book.objects.create(title='Other', price=1.0, account=self.account)
+                etag = self.revalidate(url, etag, status.HTTP_200_OK)['ETag']
+                other.soft_delete()
+                self.revalidate(url, etag, status.HTTP_200_OK)
+
+    def test_list_validator_depends_on_query(self):
+        etag = self.client.get('/books/')['ETag']
+        self.assertNotEqual(self.client.get('/books/', {'status': 'sold'})['ETag'], etag)
+
+    def test_wishlist_validator_follows_membership(self):
+        url = '/accounts/my-wish-list/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            self.revalidate(url, etag, status.HTTP_304_NOT_MODIFIED)
+        self.wishlist.add_book(self.book)
+        etag = self.revalidate(url, etag, status.HTTP_200_OK)['ETag']
+        self.book.mark_as_reserved()
+        etag = self.revalidate(url, etag, status.HTTP_200_OK)['ETag']
+        self.wishlist.remove_book(self.book)
+        self.revalidate(url, etag, status.HTTP_200_OK)
+
+    def test_if_modified_since(self):
+        url = f'/books/{self.book.pk}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_cached_anonymous_response_revalidates(self):
+        response_cache.backend.clear()
+        self.client.force_authenticate(user=None)
+        url = f'/books/{self.book.pk}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.revalidate(url, etag, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+
+def make_test_image(name='cover.png', size=(1600, 1200), mode='RGBA'):
+    buffer = BytesIO()
+    PILImage.new(mode, size, (200, 50, 50, 255)[:len(mode)]).save(buffer, 'PNG')
+    return SimpleUploadedFile(name=name, content=buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False, MEDIA_ROOT=tempfile.mkdtemp())
+class ImageVariantsTestCase(APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.book = Book.objects.create(
+            title='Test book',
+            price=30000.0,
+            account=self.account
+        )
+
+    def test_variants_built_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(book=self.book, image=make_test_image())
+        image.refresh_from_db()
+        self.assertEqual(image.image_variants['source'], image.image.name)
+        storage = image.image.storage
+        expected = {'thumbnail': ('JPEG', 240), 'medium': ('JPEG', 800), 'webp': ('WEBP', 1200)}
+        for variant, (image_format, longest_side) in expected.items():
+            with storage.open(image.image_variants[variant]) as file:
+                rendered = PILImage.open(file)
+                self.assertEqual(rendered.format, image_format)
+                self.assertEqual(max(rendered.size), longest_side)
+
+        response = self.client.get(f'/books/{self.book.pk}/')
+        urls = response.data['images'][0]['image_variants']
+        self.assertEqual(set(urls), set(expected))
+        self.assertTrue(urls['thumbnail'].startswith('http://testserver/media/books/'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertTrue(storage.exists(image.image_variants['thumbnail']))
+        process_file_deletions()
+        self.assertFalse(storage.exists(image.image_variants['thumbnail']))
+
+    def test_account_image_replacement(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.account.image = make_test_image('avatar.png', (300, 300), 'RGB')
+            self.account.save()
+        self.account.refresh_from_db()
+        old_thumbnail = self.account.image_variants['thumbnail']
+        storage = self.account.image.storage
+        self.assertTrue(storage.exists(old_thumbnail))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.account.image = make_test_image('other.png', (300, 300), 'L')
+            self.account.save()
+        process_file_deletions()
+        self.account.refresh_from_db()
+        self.assertFalse(storage.exists(old_thumbnail))
+        self.assertNotEqual(self.account.image_variants['thumbnail'], old_thumbnail)
+        self.assertTrue(storage.exists(self.account.image_variants['thumbnail']))
+
+    def test_unreadable_upload_is_skipped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(
+                book=self.book,
+                image=SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+            )
+        image.refresh_from_db()
+        self.assertEqual(image.image_variants, {'source': image.image.name})
+        self.assertEqual(ImageSerializer(image).data['image_variants'], {})
+
+    def test_backfill_command(self):
+        image = Image.objects.create(book=self.book, image=make_test_image())
+        Image.objects.filter(pk=image.pk).update(image_variants={})
+        out = StringIO()
+        call_command('generate_image_variants', workers=1, stdout=out)
+        self.assertIn('Built variants for 1 images', out.getvalue())
+        image.refresh_from_db()
+        self.assertIn('webp', image.image_variants)
+
+
+class BookBulkCreateTestCase(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.client.force_authenticate(user=self.account)
+
+    def test_bulk_create_reports_each_item(self):
+        payload = {'books': [
+            {'title': 'First', 'price': 10.0, 'images': [{'is_cover': True}, {'is_cover': False}]},
+            {'title': 'Broken', 'price': -5},
+            {'title': 'Third', 'details': 'Bulk', 'price': 30.0, 'status': 'reserved'},
+        ]}
+        response = self.client.post('/books/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.data['data']
+        self.assertEqual([result['success'] for result in results], [True, False, True])
+        self.assertIn('price', results[1]['errors'])
+
+        first = Book.objects.get(pk=results[0]['id'])
+        self.assertEqual(first.account, self.account)
+        self.assertEqual(first.images.count(), 2)
+        self.assertEqual(first.images.filter(is_cover=True).count(), 1)
+        self.assertEqual(Book.objects.get(pk=results[2]['id']).status, 'reserved')
+
+    def test_bulk_create_uses_constant_queries(self):
+        books = [{'title': f'Book {i}', 'price': float(i), 'images': [{'is_cover': True}]} for i in range(200)]
+        # savepoint/release plus a few INSERT batches (SQLite caps bound variables)
+        with self.assertMaxQueries(6):
+            response = self.client.post('/books/bulk/', books, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Book.objects.count(), 200)
+        self.assertEqual(Image.objects.count(), 200)
+        self.assertEqual(len(self.client.get('/books/', {'search': 'book'}).data['results']), 12)
+
+    def test_bulk_create_rejects_empty_and_invalid_batches(self):
+        self.assertEqual(self.client.post('/books/bulk/', [], format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/books/bulk/', [{'title': 'No price'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Book.objects.count(), 0)
+
+    def test_bulk_create_invalidates_list_cache(self):
+        self.client.force_authenticate(user=None)
+        self.client.get('/books/')
+        self.client.force_authenticate(user=self.account)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/books/bulk/', [{'title': 'New', 'price': 1.0}], format='json')
+        self.client.force_authenticate(user=None)
+        response = self.client.get('/books/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['count'], 1)
+
+
+class WishListBulkTestCase(APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.books = [
+            Book.objects.create(title=f'Book {i}', price=10.0, account=self.account)
+            for i in range(4)
+        ]
+        self.deleted = Book.objects.create(title='Deleted', price=10.0, account=self.account, is_deleted=True)
+        self.wishlist = WishList.objects.create(account=self.account)
+        self.client.force_authenticate(user=self.account)
+
+    def ids(self, *indexes):
+        return [self.books[index].id for index in indexes]
+
+    def wishlist_ids(self):
+        return sorted(self.wishlist.books.values_list('id', flat=True))
+
+    def test_add_books(self):
+        self.wishlist.books.add(self.books[0])
+        response = self.client.post(
+            '/accounts/my-wish-list/add-books/',
+            {'book_ids': self.ids(0, 1, 2) + [self.deleted.id, 9999]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data'], {
+            'added': self.ids(1, 2),
+            'unchanged': self.ids(0),
+            'unknown': sorted([self.deleted.id, 9999]),
+        })
+        self.assertEqual(self.wishlist_ids(), self.ids(0, 1, 2))
+
+    def test_remove_books(self):
+        self.wishlist.books.add(self.books[0], self.books[1], self.deleted)
+        response = self.client.post(
+            '/accounts/my-wish-list/remove-books/',
+            {'book_ids': self.ids(0, 2) + [self.deleted.id, 9999]},
+            format='json'
+        )
+        self.assertEqual(response.data['data'], {
+            'removed': sorted(self.ids(0) + [self.deleted.id]),
+            'unchanged': self.ids(2),
+            'unknown': [9999],
+        })
+        self.assertEqual(self.wishlist_ids(), self.ids(1))
+
+    def test_replace_books(self):
+        self.wishlist.books.add(self.books[0], self.books[1])
+        response = self.client.post(
+            '/accounts/my-wish-list/replace-books/',
+            {'book_ids': self.ids(1, 2, 3) + [self.deleted.id]},
+            format='json'
+        )
+        self.assertEqual(response.data['data'], {
+            'added': self.ids(2, 3),
+            'removed': self.ids(0),
+            'unknown': [self.deleted.id],
+        })
+        self.assertEqual(self.wishlist_ids(), self.ids(1, 2, 3))
+
+    def test_bulk_touches_wishlist(self):
+        before = self.wishlist.updated_at
+        self.client.post('/accounts/my-wish-list/add-books/', {'book_ids': self.ids(0)}, format='json')
+        self.wishlist.refresh_from_db()
+        self.assertGreater(self.wishlist.updated_at, before)
+
+    def test_invalid_payload(self):
+        response = self.client.post('/accounts/my-wish-list/add-books/', {'book_ids': ['x']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_single_item_endpoints(self):
+        book = self.books[0]
+        # INSERT ... SELECT, then touch the wishlist
+        with self.assertNumQueries(2):
+            response = self.client.post(f'/accounts/{book.pk}/wishlist-add-book/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.post(f'/accounts/{book.pk}/wishlist-add-book/').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post(f'/accounts/{self.deleted.pk}/wishlist-add-book/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+        with self.assertNumQueries(2):
+            response = self.client.delete(f'/accounts/{book.pk}/wishlist-remove-book/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.delete(f'/accounts/{book.pk}/wishlist-remove-book/').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.wishlist_ids(), [])
+
+
+class AsyncReadViewsTestCase(APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.other = Account.objects.create_user(username='other', password='testpassword123')
+        self.wishlist = WishList.objects.create(account=self.account)
+        for i in range(15):
+            book = Book.objects.create(
+                title=f'Python volume {i}' if i % 2 else f'Gardening {i}',
+                details='Async parity',
+                price=float(i % 4),
+                status='sold' if i % 5 == 0 else 'available',
+                account=self.account if i % 3 else self.other
+            )
+            Image.objects.create(book=book, is_cover=True)
+            if i % 2:
+                self.wishlist.books.add(book)
+        self.token = str(RefreshToken.for_user(self.account).access_token)
+
+    def assertParity(self, path, params=None, authenticated=False):
+        headers = {'Authorization': f'Bearer {self.token}'} if authenticated else {}
+        sync_response = self.client.get(path, params, headers=headers)
+        async_response = async_to_sync(self.async_client.get)(f'/async{path}', params or {}, headers=headers)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        sync_body = json.loads(sync_response.content.decode().replace('/books/', '/async/books/')
+                               .replace('/accounts/', '/async/accounts/'))
+        self.assertEqual(json.loads(async_response.content), sync_body)
+        return async_response
+
+    def test_book_list_parity(self):
+        cases = [
+            {},
+            {'status': 'available'},
+            {'account': self.other.pk},
+            {'search': 'python'},
+            {'search': 'python', 'ordering': '-price'},
+            {'ordering': 'price', 'page_size': 4, 'page': 2},
+            {'pagination': 'cursor', 'page_size': 5, 'ordering': '-price'},
+            {'page': 99},
+            {'status': 'bogus'},
+            {'facets': 'status,price', 'search': 'python'},
+            {'facets': 'bogus'},
+        ]
+        for params in cases:
+            with self.subTest(params=params):
+                self.assertParity('/books/', params)
+
+    def test_authenticated_list_parity(self):
+        for path, params in [
+            ('/books/mine/', {}),
+            ('/books/mine/', {'status': 'sold', 'ordering': 'title'}),
+            ('/accounts/my-wish-list/', {'page_size': 3}),
+            ('/accounts/my-wish-list/', {'pagination': 'cursor', 'page_size': 3}),
+        ]:
+            with self.subTest(path=path, params=params):
+                self.assertParity(path, params, authenticated=True)
+
+    def test_detail_parity(self):
+        book = Book.objects.first()
+        self.assertParity(f'/books/{book.pk}/')
+        self.assertParity('/books/999999/')
+
+    def test_authentication_required(self):
+        response = async_to_sync(self.async_client.get)('/async/books/mine/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = async_to_sync(self.async_client.get)('/async/books/mine/', headers={'Authorization': 'Bearer nope'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class BookExportTestCase(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.other = Account.objects.create_user(username='other', password='testpassword123')
+        for i in range(30):
+            book = Book.objects.create(
+                title=f'Python volume {i}' if i % 2 else f'Gardening, "{i}"',
+                details='Line one\nline two',
+                price=float(i),
+                status='sold' if i % 5 == 0 else 'available',
+                account=self.account if i % 3 else self.other
+            )
+            if i == 1:
+                Image.objects.create(book=book, image='books/old.jpg')
+                Image.objects.create(book=book, image='books/cover.jpg', is_cover=True)
+        Book.objects.filter(title='Gardening, "0"').update(is_deleted=True)
+        self.client.force_authenticate(user=self.account)
+
+    def export(self, path, params=None):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        rows = list(csv.DictReader(StringIO(self.export('/books/export.csv'))))
+        self.assertEqual(len(rows), 29)
+        self.assertEqual(rows[0]['title'], 'Python volume 29')
+        by_title = {row['title']: row for row in rows}
+        self.assertEqual(by_title['Gardening, "2"']['details'], 'Line one\nline two')
+        self.assertEqual(by_title['Python volume 1']['account_username'], 'testuser')
+        self.assertTrue(by_title['Python volume 1']['cover_image'].endswith('/media/books/cover.jpg'))
+        self.assertEqual(by_title['Python volume 3']['cover_image'], '')
+
+    def test_ndjson_export_applies_list_filters(self):
+        params = {'status': 'available', 'account': self.other.pk, 'search': 'python', 'ordering': 'price'}
+        records = [json.loads(line) for line in self.export('/books/export.ndjson', params).splitlines()]
+        expected = self.client.get('/books/', params).data['results']
+        self.assertEqual([record['id'] for record in records], [book['id'] for book in expected])
+        self.assertEqual(records[0]['price'], 3.0)
+        self.assertEqual(records[0]['account_id'], self.other.pk)
+
+    def test_seller_inventory_export(self):
+        records = [json.loads(line) for line in self.export('/books/mine/export.ndjson', {'status': 'sold'}).splitlines()]
+        self.assertEqual({record['account_id'] for record in records}, {self.account.pk})
+        self.assertEqual({record['status'] for record in records}, {'sold'})
+
+    def test_asgi_export_streams_asynchronously(self):
+        token = RefreshToken.for_user(self.account).access_token
+        headers = {'Authorization': f'Bearer {token}'}
+        wsgi = self.export('/books/export.ndjson')
+
+        async def fetch():
+            response = await self.async_client.get('/books/export.ndjson', headers=headers)
+            return response, b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        response, body = async_to_sync(fetch)()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+        self.assertEqual(body, wsgi)
+        self.assertFalse(self.client.get('/books/export.ndjson').is_async)
+
+    def test_export_reads_in_constant_queries(self):
+        with self.assertMaxQueries(1):
+            self.export('/books/export.csv')
+
+    def test_unknown_format_and_anonymous(self):
+        self.assertEqual(self.client.get('/books/export.xml').status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get('/books/export.csv').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_books', export_format='ndjson', status='sold', stdout=out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(records), 5)
+        with tempfile.NamedTemporaryFile('r', suffix='.csv') as file:
+            call_command('export_books', output=file.name)
+            self.assertEqual(len(list(csv.DictReader(file))), 29)
+
+
+class ReferenceBookSerializer(BookSerializer):
+    """BookSerializer rendered through DRF's generic field loop"""
+
+    def to_representation(self, instance):
+        return serializers.Serializer.to_representation(self, instance)
+
+
+class CompiledSerializerParityTestCase(APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123',
+            first_name='Ünïcode',
+            image='accounts/avatar.jpg'
+        )
+        self.account.image_variants = {'source': 'accounts/avatar.jpg', 'thumbnail': 'accounts/variants/avatar.thumbnail.jpg'}
+        self.account.save(update_fields=['image_variants'])
+        self.other = Account.objects.create_user(username='other', password='testpassword123')
+        for i in range(8):
+            book = Book.objects.create(
+                title=f'Book "{i}" — \U0001F4DA',
+                details=None if i % 3 == 0 else f'Details {i}\n',
+                price=i * 1.1,
+                status=['available', 'sold', 'reserved'][i % 3],
+                account=self.account if i % 2 else self.other,
+                is_deleted=i == 7
+            )
+            for n in range(i % 3):
+                Image.objects.create(book=book, image=f'books/{i}-{n}.jpg' if n else None, is_cover=n == 0)
+        self.wishlist = WishList.objects.create(account=self.account)
+        self.wishlist.books.set(Book.objects.all()[:4])
+        self.request = APIRequestFactory().get('/books/')
+
+    def assertSameBytes(self, instance, many=False, context=None):
+        context = context or {}
+        expected = JSONRenderer().render(ReferenceBookSerializer(instance, many=many, context=context).data)
+        actual = JSONRenderer().render(BookSerializer(instance, many=many, context=context).data)
+        self.assertEqual(actual, expected)
+
+    def books(self):
+        return Book.objects.select_related('account').prefetch_related('images')
+
+    def test_list_parity(self):
+        self.assertSameBytes(self.books(), many=True)
+        self.assertSameBytes(self.books(), many=True, context={'request': self.request})
+
+    def test_detail_parity(self):
+        for book in Book.objects.all():
+            with self.subTest(book=book.pk):
+                self.assertSameBytes(book)
+                self.assertSameBytes(book, context={'request': self.request})
+
+    def test_in_memory_values_and_timezone_parity(self):
+        book = self.books().first()
+        book.price, book.status, book.details = 3, 'unknown', 42
+        self.assertSameBytes(book)
+        with timezone.override('UTC'):
+            self.assertSameBytes(self.books(), many=True)
+
+    def test_nested_in_wishlist(self):
+        data = WishListSerializer(self.wishlist, context={'request': self.request}).data
+        expected = ReferenceBookSerializer(self.wishlist.books.all(), many=True, context={'request': self.request}).data
+        self.assertEqual(JSONRenderer().render(data['books']), JSONRenderer().render(expected))
+
+    def test_api_output_unchanged(self):
+        response = self.client.get('/books/', {'page_size': 100})
+        expected = ReferenceBookSerializer(
+            self.books().filter(is_deleted=False), many=True, context={'request': response.wsgi_request}
+        ).data
+        self.assertEqual(JSONRenderer().render(response.data['results']), JSONRenderer().render(expected))
+
+
+class StatelessJWTAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        Book.objects.create(title='Mine', price=5.0, account=self.account)
+
+    def obtain(self, password='testpassword123'):
+        response = self.client.post('/token/', {'username': 'testuser', 'password': password}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def get_mine(self, access):
+        return self.client.get('/books/mine/', headers={'Authorization': f'Bearer {access}'})
+
+    def account_queries(self, access):
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as context:
+            response = self.get_mine(access)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [query['sql'] for query in context.captured_queries if 'FROM "main_account"' in query['sql']]
+
+    def test_claims_replace_user_lookup(self):
+        access = self.obtain()['access']
+        self.assertEqual(len(self.account_queries(access)), 1)  # token version, once
+        self.assertEqual(self.account_queries(access), [])
+        self.assertEqual(self.get_mine(access).data['results'][0]['title'], 'Mine')
+
+    def test_revoked_tokens_are_rejected(self):
+        tokens = self.obtain()
+        self.assertEqual(self.get_mine(tokens['access']).status_code, status.HTTP_200_OK)
+        self.account.revoke_tokens()
+        response = self.get_mine(tokens['access'])
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data['code'], 'token_revoked')
+        response = self.client.post('/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.get_mine(self.obtain()['access']).status_code, status.HTTP_200_OK)
+
+    def test_password_change_and_deactivation_revoke(self):
+        access = self.obtain()['access']
+        self.get_mine(access)
+        self.account.set_password('newpassword456')
+        self.account.save()
+        self.assertEqual(self.get_mine(access).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        access = self.obtain('newpassword456')['access']
+        self.get_mine(access)
+        self.account.is_active = False
+        self.account.save(update_fields=['is_active'])
+        self.assertEqual(self.get_mine(access).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_tokens_without_claims_use_lookup(self):
+        access = str(RefreshToken.for_user(self.account).access_token)
+        self.assertEqual(len(self.account_queries(access)), 1)
+        self.assertEqual(len(self.account_queries(access)), 1)
+
+    def test_profile_loads_full_account(self):
+        access = self.obtain()['access']
+        response = self.client.get('/accounts/me/', headers={'Authorization': f'Bearer {access}'})
+        self.assertEqual(response.data['email'], 'test@example.com')
+
+    def test_async_views_use_claims(self):
+        tokens = self.obtain()
+        response = async_to_sync(self.async_client.get)(
+            '/async/books/mine/', headers={'Authorization': f'Bearer {tokens["access"]}'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.account.revoke_tokens()
+        response = async_to_sync(self.async_client.get)(
+            '/async/books/mine/', headers={'Authorization': f'Bearer {tokens["access"]}'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class BookFacetsTestCase(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.other = Account.objects.create_user(username='other', password='testpassword123')
+        prices = [5, 9.99, 10, 24, 30, 75, 120, 500]
+        for i, price in enumerate(prices):
+            Book.objects.create(
+                title=f'Python volume {i}' if i % 2 else f'Gardening {i}',
+                price=price,
+                status=['available', 'sold'][i % 2],
+                account=self.account if i < 6 else self.other
+            )
+        Book.objects.create(title='Deleted', price=1, account=self.account, is_deleted=True)
+
+    def test_status_and_price_facets(self):
+        response = self.client.get('/books/', {'facets': 'true', 'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        facets = response.data['facets']
+        self.assertEqual(facets['status'], {'available': 4, 'sold': 4, 'reserved': 0})
+        self.assertEqual(
+            [(bucket['min'], bucket['max'], bucket['count']) for bucket in facets['price']],
+            [(0, 10, 2), (10, 25, 2), (25, 50, 1), (50, 100, 1), (100, 250, 1), (250, None, 1)]
+        )
+
+    def test_facets_follow_filters_and_custom_buckets(self):
+        response = self.client.get('/books/', {
+            'facets': 'price', 'account': self.account.pk, 'search': 'python', 'price_buckets': '0,25.5',
+        })
+        self.assertNotIn('status', response.data['facets'])
+        self.assertEqual(response.data['facets']['price'], [
+            {'min': 0, 'max': 25.5, 'count': 2},
+            {'min': 25.5, 'max': None, 'count': 1},
+        ])
+
+    def test_facets_cost_one_query(self):
+        with self.assertMaxQueries(6):
+            with_facets = self.client.get('/books/', {'facets': 'status,price', 'status': 'sold'})
+        self.assertEqual(with_facets.data['facets']['status']['sold'], 4)
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as context:
+            self.client.get('/books/', {'status': 'sold', 'page': 1})
+        with self.assertMaxQueries(len(context.captured_queries) + 1):
+            self.client.get('/books/', {'facets': 'status,price', 'status': 'sold', 'page': 1})
+        self.assertNotIn('facets', self.client.get('/books/').data)
+
+    def test_invalid_options(self):
+        self.assertEqual(self.client.get('/books/', {'facets': 'colour'}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/books/', {'facets': 'price', 'price_buckets': 'cheap'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SQLiteProfileTestCase(APITestCase):
+    def test_pragmas_applied_on_connect(self):
+        connection = connections[DEFAULT_DB_ALIAS]
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    @staticmethod
+    def write_lock_held():
+        """Whether some thread holds the write lock (RLock has no locked())"""
+        held = []
+
+        def probe():
+            acquired = _write_lock.acquire(blocking=False)
+            if acquired:
+                _write_lock.release()
+            held.append(not acquired)
+
+        thread = threading.Thread(target=probe)
+        thread.start()
+        thread.join()
+        return held[0]
+
+    @override_settings(SERIALIZE_SQLITE_WRITES=True)
+    def test_serialized_writes(self):
+        with serialized_writes():
+            self.assertTrue(self.write_lock_held())
+        self.assertFalse(self.write_lock_held())
+        account = Account.objects.create_user(username='writer', password='testpassword123')
+        self.client.force_authenticate(user=account)
+        response = self.client.post('/books/', {'title': 'Serialized', 'price': 1.0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(self.write_lock_held())
+
+    @override_settings(SERIALIZE_SQLITE_WRITES=True, SQLITE_WRITE_LOCK_TIMEOUT=5)
+    def test_serialized_writes_nest(self):
+        started = time.monotonic()
+        with serialized_writes(), serialized_writes():
+            self.assertTrue(self.write_lock_held())
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertFalse(self.write_lock_held())
+
+    @override_settings(SERIALIZE_SQLITE_WRITES=False)
+    def test_serialization_can_be_disabled(self):
+        with serialized_writes():
+            self.assertFalse(self.write_lock_held())
+
+
+class ReplicaRoutingTestCase(APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        WishList.objects.create(account=self.account)
+        self.other = Account.objects.create_user(username='other', password='testpassword123')
+        self.book = Book.objects.create(title='Replicated', price=5.0, account=self.account)
+        self.router = ReplicaRouter()
+        self.stickiness = caches[settings.REPLICA_STICKINESS_CACHE_ALIAS]
+        self.stickiness.clear()
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_router_decisions(self):
+        self.assertIsNone(self.router.db_for_read(Book))  # outside a request
+        state, token = start_request()
+        self.addCleanup(end_request, token)
+        self.assertIsNone(self.router.db_for_read(Book))  # no view opted in
+        use_replica()
+        self.assertEqual(self.router.db_for_read(Book), 'replica1')
+        self.assertEqual(self.router.db_for_read(Account), 'replica1')
+        self.assertIsNone(self.router.db_for_read(WishList))
+        self.assertEqual(self.router.db_for_write(Book), 'default')
+        self.assertIsNone(self.router.db_for_read(Book))  # read-your-writes within the request
+        self.assertTrue(state.wrote)
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_catalog_views_read_from_replica_until_user_writes(self):
+        with mock.patch('main.routers.choose_replica', return_value='default') as choose:
+            self.client.force_authenticate(user=self.account)
+            self.client.get('/books/')
+            self.assertEqual(choose.call_count, 1)
+            self.client.get('/books/mine/')
+            self.assertEqual(choose.call_count, 2)
+
+            response = self.client.post('/books/', {'title': 'Fresh', 'price': 2.0}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(choose.call_count, 2)  # writes never use a replica
+
+            response = self.client.get('/books/mine/')
+            self.assertEqual(choose.call_count, 2)  # sticky to the primary
+            self.assertEqual(response.data['count'], 2)
+
+            self.client.force_authenticate(user=self.other)
+            self.client.get(f'/books/{self.book.pk}/')
+            self.assertEqual(choose.call_count, 3)  # other clients still use replicas
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_response_cache_is_filled_from_the_primary(self):
+        response_cache.backend.clear()
+        with mock.patch('main.routers.choose_replica', return_value='default') as choose:
+            for url in ['/books/', f'/books/{self.book.pk}/']:
+                self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+            choose.assert_not_called()
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_export_reads_from_the_replica_while_streaming(self):
+        self.client.force_authenticate(user=self.account)
+        with mock.patch('main.routers.choose_replica', return_value='replica1'), \
+                mock.patch('django.db.models.query.QuerySet.using', autospec=True,
+                           side_effect=lambda queryset, alias: queryset) as using:
+            response = self.client.get('/books/export.csv')
+            self.assertEqual(len(list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))), 1)
+        self.assertEqual([call.args[1] for call in using.call_args_list], ['replica1'])
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_stickiness_expires(self):
+        self.client.force_authenticate(user=self.account)
+        with mock.patch('main.routers.choose_replica', return_value='default') as choose:
+            mark_sticky(self.account.pk)
+            self.client.get('/accounts/my-wish-list/')
+            self.assertEqual(choose.call_count, 0)
+            self.stickiness.clear()
+            self.client.get('/accounts/my-wish-list/')
+            self.assertEqual(choose.call_count, 1)
+
+    def test_sync_replicas_requires_configuration(self):
+        with self.assertRaises(CommandError):
+            call_command('sync_replicas', stdout=StringIO())
+
+
+class LiveBookManagerTestCase(APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.wishlist = WishList.objects.create(account=self.account)
+        self.live = Book.objects.create(title='Live', price=5.0, account=self.account)
+        self.dead = Book.objects.create(title='Dead', price=7.0, account=self.account)
+        self.wishlist.books.add(self.live, self.dead)
+        self.dead.soft_delete()
+
+    def test_default_manager_hides_deleted_books(self):
+        self.assertEqual(list(Book.objects.all()), [self.live])
+        self.assertEqual(list(self.account.books.all()), [self.live])
+        self.assertEqual(list(self.wishlist.books.all()), [self.live])
+        self.assertEqual(Book.all_with_deleted.count(), 2)
+        self.assertEqual(list(Book.all_with_deleted.deleted()), [self.dead])
+        # Forward relations still reach a deleted book
+        image = Image.objects.create(book=self.dead)
+        self.assertEqual(Image.objects.get(pk=image.pk).book, self.dead)
+
+    def test_views_hide_deleted_books(self):
+        self.client.force_authenticate(user=self.account)
+        response = self.client.get(f'/books/{self.dead.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get('/books/mine/')
+        self.assertEqual([book['id'] for book in response.data['results']], [self.live.pk])
+
+    def test_deleted_books_can_leave_the_wishlist(self):
+        result = self.wishlist.remove_books([self.dead.pk])
+        self.assertEqual(result['removed'], [self.dead.pk])
+        self.assertEqual(self.wishlist.add_books([self.dead.pk])['unknown'], [self.dead.pk])
+
+    def test_deleted_book_can_leave_the_wishlist_through_the_endpoint(self):
+        self.client.force_authenticate(user=self.account)
+        response = self.client.delete(f'/accounts/{self.dead.pk}/wishlist-remove-book/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(self.wishlist.books.through.objects.filter(book_id=self.dead.pk).exists())
+
+    def test_catalog_scans_use_partial_indexes(self):
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+            self.skipTest('query plans are SQLite-specific')
+        self.assertIn('book_live_created_idx', Book.objects.all()[:20].explain())
+        self.assertIn('book_live_status_created_idx', Book.objects.filter(status='sold')[:20].explain())
+        self.assertIn('book_live_price_status_idx', Book.objects.filter(price__lt=10).order_by('price').explain())
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False, MEDIA_ROOT=tempfile.mkdtemp())
+class BookArchivalTestCase(APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.wishlist = WishList.objects.create(account=self.account)
+        self.old = [Book.objects.create(title=f'Old {n}', price=n, account=self.account) for n in range(5)]
+        self.recent = Book.objects.create(title='Recent', price=1.0, account=self.account)
+        self.live = Book.objects.create(title='Live', price=1.0, account=self.account)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.image = Image.objects.create(book=self.old[0], image=make_test_image(), is_cover=True)
+        self.image.refresh_from_db()
+        self.wishlist.books.add(self.old[0], self.recent, self.live)
+        for book in self.old + [self.recent]:
+            book.soft_delete()
+        Book.all_with_deleted.filter(pk__in=[book.pk for book in self.old]).update(
+            deleted_at=timezone.now() - timezone.timedelta(days=40)
+        )
+
+    def test_archives_in_batches(self):
+        storage = self.image.image.storage
+        files = [self.image.image.name, self.image.image_variants['thumbnail']]
+        self.assertTrue(all(storage.exists(name) for name in files))
+
+        call_command('archive_deleted_books', '--batch-size', '2', '--pause', '0', stdout=StringIO())
+        process_file_deletions()
+
+        self.assertEqual(
+            set(Book.all_with_deleted.values_list('pk', flat=True)), {self.recent.pk, self.live.pk}
+        )
+        self.assertFalse(Image.objects.filter(pk=self.image.pk).exists())
+        self.assertEqual(set(self.wishlist.books.through.objects.values_list('book_id', flat=True)),
+                         {self.recent.pk, self.live.pk})
+        self.assertFalse(any(storage.exists(name) for name in files))
+
+        archived = ArchivedBook.objects.get(book_id=self.old[0].pk)
+        self.assertEqual(archived.title, 'Old 0')
+        self.assertEqual(archived.account_id, self.account.pk)
+        self.assertEqual(archived.images, [{'image': self.image.image.name, 'is_cover': True}])
+        self.assertIn(self.image.image.name, archived.files)
+        self.assertIsNotNone(archived.files_purged_at)
+        self.assertEqual(ArchivedBook.objects.count(), 5)
+
+    def test_resumes_after_interruption(self):
+        totals = archive_deleted_books(batch_size=2, pause=0, max_batches=1)
+        self.assertEqual((totals['batches'], totals['archived']), (1, 2))
+        # A crash between the commit and the file cleanup
+        ArchivedBook.objects.update(files_purged_at=None)
+
+        totals = archive_deleted_books(batch_size=2, pause=0)
+        self.assertEqual((totals['batches'], totals['archived'], totals['files_purged']), (2, 3, 5))
+        self.assertEqual(archive_deleted_books(pause=0), {'batches': 0, 'archived': 0, 'files_purged': 0})
+        self.assertFalse(archivable_books(retention_cutoff()).exists())
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('archive_deleted_books', '--dry-run', stdout=out)
+        self.assertTrue(out.getvalue().startswith('5 books'))
+        call_command('archive_deleted_books', '--dry-run', '--days', '0', stdout=out)
+        self.assertIn('6 books', out.getvalue())
+        self.assertEqual(ArchivedBook.objects.count(), 0)
+
+
+class CachedSchemaTestCase(APITestCase):
+    def setUp(self):
+        self.enterContext(override_settings(OPENAPI_SCHEMA_DIR=tempfile.mkdtemp()))
+        self.client.get('/docs/')  # imports the URLconf
+        self.schema_view = SCHEMA_VIEWS['openapi']
+        self.schema_view.forget_artifact()
+
+    def test_generated_once_and_served_with_validators(self):
+        with mock.patch.object(self.schema_view, 'generate', wraps=self.schema_view.generate) as generate:
+            response = self.client.get('/docs/openapi.json')
+            self.client.get('/docs/', {'format': 'openapi'})
+            self.client.get('/docs/openapi.yaml')
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/json; charset=utf-8')
+        self.assertIn('max-age=86400', response['Cache-Control'])
+        schema = json.loads(response.content)
+        self.assertIn('/books/', schema['paths'])
+        self.assertNotIn('host', schema)
+
+        response = self.client.get('/docs/openapi.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get('/docs/openapi.yaml')
+        self.assertTrue(response.content.startswith(b'swagger:'))
+        self.assertEqual(self.client.get('/docs/').status_code, status.HTTP_200_OK)
+
+    def test_ui_pages_do_not_introspect(self):
+        with mock.patch.object(self.schema_view.generator_class, 'get_schema') as get_schema:
+            for url in ['/docs/', '/docs/redoc/', '/docs/']:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertIn(b'Book Store API', response.content)
+        get_schema.assert_not_called()
+
+    def test_artifact_reused_until_code_changes(self):
+        out = StringIO()
+        call_command('generate_openapi_schema', stdout=out)
+        call_command('generate_openapi_schema', '--check', stdout=out)
+        self.schema_view.forget_artifact()
+        with mock.patch.object(self.schema_view, 'generate') as generate:
+            self.assertEqual(self.client.get('/docs/openapi.json').status_code, status.HTTP_200_OK)
+        generate.assert_not_called()
+
+        self.schema_view.forget_artifact()
+        with mock.patch('main.openapi.source_fingerprint', return_value='changed'), \
+                mock.patch('main.management.commands.generate_openapi_schema.source_fingerprint', return_value='changed'):
+            with self.assertRaises(CommandError):
+                call_command('generate_openapi_schema', '--check', stdout=out)
+            with mock.patch.object(self.schema_view, 'generate', wraps=self.schema_view.generate) as generate:
+                self.client.get('/docs/openapi.json')
+        self.assertEqual(generate.call_count, 1)
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False, MEDIA_ROOT=tempfile.mkdtemp())
+class ContentAddressedStorageTestCase(APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpassword123'
+        )
+        self.book = Book.objects.create(title='Test book', price=10.0, account=self.account)
+        self.other_book = Book.objects.create(title='Other book', price=10.0, account=self.account)
+
+    def test_identical_uploads_stored_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Image.objects.create(book=self.book, image=make_test_image('a.png'))
+            second = Image.objects.create(book=self.other_book, image=make_test_image('b.PNG'))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        storage = first.image.storage
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^books/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(storage.references(first.image.name), 2)
+        self.assertEqual(first.image_variants, second.image_variants)
+        thumbnail = first.image_variants['thumbnail']
+        self.assertEqual(storage.references(thumbnail), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        process_file_deletions()
+        self.assertTrue(storage.exists(second.image.name))
+        self.assertTrue(storage.exists(thumbnail))
+        self.assertEqual(storage.references(second.image.name), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other_book.delete()  # cascades to the image
+        process_file_deletions()
+        self.assertFalse(storage.exists(second.image.name))
+        self.assertFalse(storage.exists(thumbnail))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_dedupe_existing_media(self):
+        storage = Image._meta.get_field('image').storage
+        content = make_test_image().read()
+        for name in ('books/legacy-1.png', 'books/legacy-2.png'):
+            FileSystemStorage(location=storage.location).save(name, ContentFile(content))
+        first = Image.objects.create(book=self.book)
+        second = Image.objects.create(book=self.other_book)
+        Image.objects.filter(pk=first.pk).update(image='books/legacy-1.png')
+        Image.objects.filter(pk=second.pk).update(image='books/legacy-2.png')
+        Account.objects.filter(pk=self.account.pk).update(image='accounts/missing.png')
+
+        out = StringIO()
+        call_command('dedupe_media', stdout=out)
+        self.assertIn('Moved 2 files, merged 1 duplicates', out.getvalue())
+        self.assertIn('1 referenced files are missing', out.getvalue())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(storage.exists(first.image.name))
+        self.assertFalse(storage.exists('books/legacy-1.png'))
+        self.assertFalse(storage.exists('books/legacy-2.png'))
+        self.assertEqual(storage.references(first.image.name), 2)
+
+    def test_dedupe_keeps_pending_references(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            kept = Image.objects.create(book=self.book, image=make_test_image())
+            queued = Image.objects.create(book=self.other_book, image=make_test_image())
+            archived = Image.objects.create(book=self.other_book, image=make_test_image())
+        kept.refresh_from_db()
+        storage = kept.image.storage
+        queued.delete()
+        ArchivedBook.objects.create(book_id=self.other_book.pk, account_id=self.account.pk, title='Other book',
+                                    price=10.0, status='available', created_at=timezone.now(),
+                                    updated_at=timezone.now(), files=[kept.image.name])
+        Image.objects.filter(pk=archived.pk).update(image='')
+
+        call_command('dedupe_media', stdout=StringIO())
+        self.assertEqual(storage.references(kept.image.name), 3)
+        process_file_deletions()
+        purge_archived_files()
+        process_file_deletions()
+        self.assertTrue(storage.exists(kept.image.name))
+        self.assertEqual(storage.references(kept.image.name), 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), MEDIA_SERVE_MODE='django')
+class MediaServingTestCase(APITestCase):
+    def setUp(self):
+        self.content = bytes(range(256)) * 40
+        storage = Image._meta.get_field('image').storage
+        self.name = storage.save('books/cover.bin', ContentFile(self.content))
+        self.url = f'/media/{self.name}'
+        self.addCleanup(storage.delete, self.name)
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_file_with_immutable_caching(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['ETag'], '"%s"' % self.name.split('/')[-1].split('.')[0])
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response, _ = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_byte_ranges(self):
+        response, body = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(body, self.content[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response, body = self.get(HTTP_RANGE='bytes=-5')
+        self.assertEqual(body, self.content[-5:])
+        response, body = self.get(HTTP_RANGE='bytes=10000-')
+        self.assertEqual(body, self.content[10000:])
+
+        response, _ = self.get(HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+        # A stale If-Range validator gets the whole file
+        response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(body, self.content)
+
+    def test_front_server_modes(self):
+        with override_settings(MEDIA_SERVE_MODE='x-accel-redirect'):
+            response, body = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(body, b'')
+        with override_settings(MEDIA_SERVE_MODE='x-sendfile'):
+            response, _ = self.get()
+        self.assertTrue(response['X-Sendfile'].endswith(self.name))
+
+    def test_legacy_names_and_missing_files(self):
+        FileSystemStorage(location=Image._meta.get_field('image').storage.location).save(
+            'books/plain.txt', ContentFile(b'plain')
+        )
+        response, body = self.get('/media/books/plain.txt')
+        self.assertEqual(body, b'plain')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=3600', response['Cache-Control'])
+        self.assertEqual(self.client.get('/media/books/missing.png').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/media/../core/settings.py').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.post(self.url).status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class ThrottlingTestCase(APITestCase):
+    rates = {'ip': '100/min', 'account': '100/min', 'search': '3/min', 'write': '2/min', 'register': '2/hour', 'token': '2/min'}
+
+    def setUp(self):
+        self.enterContext(override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=self.rates)))
+        reset_throttles()
+        self.addCleanup(reset_throttles)
+        self.account = Account.objects.create_user(username='testuser', password='testpassword123')
+        Book.objects.create(title='Python', price=5.0, account=self.account)
+
+    def register(self, username, **extra):
+        data = {
+            'username': username,
+            'email': f'{username}@example.com',
+            'password': 'newpassword123',
+            'confirm_password': 'newpassword123',
+        }
+        return self.client.post('/accounts/register/', data, **extra)
+
+    def test_search_has_its_own_bucket(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get('/books/', {'search': 'python'}).status_code, status.HTTP_200_OK)
+        response = self.client.get('/books/', {'search': 'python'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '20')
+        self.assertEqual(self.client.get('/books/').status_code, status.HTTP_200_OK)
+        response = async_to_sync(self.async_client.get)('/async/books/', {'search': 'python'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+    def test_register_is_limited_per_address(self):
+        self.assertEqual(self.register('first').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.register('second').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.register('third').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.register('third', REMOTE_ADDR='10.0.0.2').status_code, status.HTTP_201_CREATED)
+
+    def test_forwarded_for_does_not_pick_the_bucket(self):
+        for n in range(2):
+            response = self.register(f'user{n}', HTTP_X_FORWARDED_FOR=f'203.0.113.{n}')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.register('third', HTTP_X_FORWARDED_FOR='203.0.113.99')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        with override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, NUM_PROXIES=1)):
+            response = self.register('third', HTTP_X_FORWARDED_FOR='203.0.113.99')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_token_obtain_is_limited(self):
+        credentials = {'username': 'testuser', 'password': 'wrong'}
+        for _ in range(2):
+            self.assertEqual(self.client.post('/token/', credentials).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.post('/token/', credentials).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_writes_are_limited_per_account(self):
+        other = Account.objects.create_user(username='other', password='testpassword123')
+        self.client.force_authenticate(self.account)
+        for _ in range(2):
+            self.assertEqual(self.client.patch('/accounts/me/', {'first_name': 'A'}).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.patch('/accounts/me/', {'first_name': 'A'}).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.client.get('/accounts/me/').status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.patch('/accounts/me/', {'first_name': 'B'}).status_code, status.HTTP_200_OK)
+
+    def test_bucket_refills(self):
+        with mock.patch('main.throttling.time') as clock:
+            clock.time.return_value = 1000.0
+            for _ in range(3):
+                self.assertEqual(self.client.get('/books/', {'search': 'python'}).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.client.get('/books/', {'search': 'python'}).status_code, 429)
+            clock.time.return_value = 1020.0  # one token back
+            self.assertEqual(self.client.get('/books/', {'search': 'python'}).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.client.get('/books/', {'search': 'python'}).status_code, 429)
+
+    def test_rejections_skip_the_cache(self):
+        for _ in range(4):
+            self.client.get('/books/', {'search': 'python'})
+        backend = caches[settings.THROTTLE_CACHE_ALIAS]
+        with mock.patch.object(backend, 'get', wraps=backend.get) as get:
+            response = self.client.get('/books/', {'search': 'python'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # Only the per-address bucket, which still lets the request through
+        self.assertEqual([call.args[0] for call in get.call_args_list], ['throttle:ip:127.0.0.1'])
+
+
+class PasswordHashingTestCase(APITestCase):
+    def setUp(self):
+        reset_throttles()
+        self.addCleanup(reset_throttles)
+        self.account = Account.objects.create_user(username='testuser', password='testpassword123')
+
+    def registration(self, username='newuser'):
+        return {
+            'username': username,
+            'email': f'{username}@example.com',
+            'password': 'newpassword123',
+            'confirm_password': 'newpassword123',
+        }
+
+    @contextmanager
+    def hashing_threads(self):
+        threads = []
+
+        def record(password, *args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return make_password(password, *args, **kwargs)
+
+        with mock.patch('django.contrib.auth.hashers.make_password', side_effect=record):
+            yield threads
+
+    def test_registration_hashes_on_the_pool(self):
+        with self.hashing_threads() as threads:
+            response = self.client.post('/accounts/register/', self.registration())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('password-hash'))
+        account = Account.objects.get(username='newuser')
+        self.assertTrue(account.check_password('newpassword123'))
+        self.assertTrue(WishList.objects.filter(account=account).exists())
+
+    def test_registration_is_atomic(self):
+        serializer = AccountPostSerializer(data=self.registration())
+        self.assertTrue(serializer.is_valid())
+        with mock.patch.object(WishList.objects, 'create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                serializer.save()
+        self.assertFalse(Account.objects.filter(username='newuser').exists())
+
+    def test_full_pool_rejects_at_once(self):
+        passwords.get_executor()
+        with mock.patch.object(passwords, '_slots') as slots:
+            slots.acquire.return_value = False
+            response = self.client.post('/accounts/register/', self.registration())
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.data['detail'].code, 'password_hashing_busy')
+        self.assertFalse(Account.objects.filter(username='newuser').exists())
+
+    def test_async_registration(self):
+        post = async_to_sync(self.async_client.post)
+        with self.hashing_threads() as threads:
+            response = post('/async/accounts/register/', self.registration(), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['username'], 'newuser')
+        self.assertNotIn('password', response.json())
+        self.assertTrue(threads[0].startswith('password-hash'))
+        self.assertTrue(WishList.objects.filter(account__username='newuser').exists())
+
+        response = post('/async/accounts/register/', self.registration(), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('username', response.json())
+        self.assertEqual(Account.objects.filter(username='newuser').count(), 1)
+
+    def test_async_token_obtain(self):
+        post = async_to_sync(self.async_client.post)
+        response = post('/async/token/', {'username': 'testuser', 'password': 'testpassword123'},
+                        content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        access = response.json()['access']
+        self.assertEqual(self.client.get('/books/mine/', headers={'Authorization': f'Bearer {access}'}).status_code,
+                         status.HTTP_200_OK)
+
+        response = post('/async/token/', {'username': 'testuser', 'password': 'wrong'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json()['detail'], 'No active account found with the given credentials')
+        with self.hashing_threads() as threads:
+            response = post('/async/token/', {'username': 'nobody', 'password': 'wrong'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertTrue(threads[0].startswith('password-hash'))  # same work as a wrong password
+        response = post('/async/token/', {'username': 'testuser'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', response.json())
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class FileDeletionQueueTestCase(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.account = Account.objects.create_user(username='testuser', password='testpassword123')
+        self.book = Book.objects.create(title='Python', price=5.0, account=self.account)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.image = Image.objects.create(book=self.book, image=make_test_image())
+        self.image.refresh_from_db()
+        self.storage = self.image.image.storage
+        self.files = [self.image.image.name, *(name for variant, name in self.image.image_variants.items()
+                                               if variant != 'source')]
+
+    def test_cascade_deletes_are_queued(self):
+        self.account.delete()
+        self.assertEqual(sorted(FileDeletion.objects.values_list('name', flat=True)), sorted(self.files))
+        self.assertTrue(all(self.storage.exists(name) for name in self.files))
+
+        totals = process_file_deletions(batch_size=2)
+        self.assertEqual(totals, {'batches': 2, 'processed': 4, 'failed': 0})
+        self.assertFalse(any(self.storage.exists(name) for name in self.files))
+        self.assertFalse(FileDeletion.objects.exists())
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_queryset_delete_is_queued(self):
+        Image.objects.filter(book=self.book).delete()
+        self.assertEqual(FileDeletion.objects.count(), len(self.files))
+
+    def test_rollback_queues_nothing(self):
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            self.image.delete()
+            raise DatabaseError
+        self.assertFalse(FileDeletion.objects.exists())
+        process_file_deletions()
+        self.assertTrue(all(self.storage.exists(name) for name in self.files))
+
+    def test_replaced_image_is_queued(self):
+        old_name = self.image.image.name
+        self.image.image = make_test_image('other.png', mode='L')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.image.save()
+        self.assertIn(old_name, FileDeletion.objects.values_list('name', flat=True))
+        self.image.save(update_fields=['is_cover'])
+        self.assertEqual(FileDeletion.objects.filter(name=self.image.image.name).count(), 0)
+        process_file_deletions()
+        self.assertFalse(self.storage.exists(old_name))
+        self.assertTrue(self.storage.exists(self.image.image.name))
+
+    @override_settings(FILE_DELETION_MAX_ATTEMPTS=2)
+    def test_failures_are_retried_then_left(self):
+        self.image.delete()
+        with mock.patch('main.storage.ContentAddressedStorage.release', side_effect=PermissionError('denied')):
+            self.assertEqual(process_file_deletions()['failed'], len(self.files))
+            self.assertEqual(process_file_deletions()['failed'], len(self.files))
+            self.assertEqual(process_file_deletions(), {'batches': 0, 'processed': 0, 'failed': 0})
+        self.assertEqual(set(FileDeletion.objects.values_list('attempts', 'last_error')), {(2, 'denied')})
+
+        out = StringIO()
+        call_command('process_file_deletions', '--dry-run', stdout=out)
+        self.assertIn('0 file deletions are queued', out.getvalue())
+
+    def test_duplicate_upload_rescues_an_old_orphan(self):
+        name = self.image.image.name
+        path = os.path.join(self.media_root, name)
+        os.utime(path, (0, 0))
+        Image.objects.filter(pk=self.image.pk).update(image='')  # an old orphan
+        self.assertEqual(Image._meta.get_field('image').storage.save('books/again.png', make_test_image()), name)
+        self.assertGreater(os.stat(path).st_mtime, time.time() - 60)
+        self.assertEqual(queue_orphaned_files([name], min_age=3600), [])
+        self.assertFalse(FileDeletion.objects.filter(name=name).exists())
+
+    def test_orphan_scan(self):
+        orphan = 'books/ab/leftover.png'
+        os.makedirs(os.path.join(self.media_root, 'books/ab'))
+        for name in (orphan, 'books/fresh.png'):
+            with open(os.path.join(self.media_root, name), 'wb') as file:
+                file.write(b'orphan')
+        os.utime(os.path.join(self.media_root, orphan), (0, 0))
+
+        out = StringIO()
+        call_command('scan_orphaned_media', '--verbosity', '2', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [orphan, '1 orphaned files (6 bytes) found'])
+
+        call_command('scan_orphaned_media', '--delete', '--min-age', '0', stdout=out)
+        self.assertIn('2 orphaned files (12 bytes) queued for deletion', out.getvalue())
+        call_command('process_file_deletions', stdout=StringIO())
+        self.assertEqual(sorted(name for name, _ in walk_media(self.media_root)), sorted(self.files))
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class BookImageUpdateTestCase(APITestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=tempfile.mkdtemp()))
+        self.account = Account.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(self.account)
+        self.book = Book.objects.create(title='Python', price=5.0, account=self.account)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.images = [
+                Image.objects.create(book=self.book, image=make_test_image(f'{n}.png', (40 + n, 40)), is_cover=n == 0)
+                for n in range(3)
+            ]
+
+    def put(self, images):
+        return self.client.put(f'/books/{self.book.pk}/', {'title': 'Python', 'price': 5.0, 'images': images},
+                               format='json')
+
+    def test_kept_images_keep_their_rows_and_files(self):
+        first, second, third = self.images
+        names = {image.pk: Image.objects.get(pk=image.pk).image.name for image in self.images}
+        response = self.put([{'id': first.pk, 'is_cover': False}, {'id': third.pk, 'is_cover': True}, {}])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        images = {image.pk: image for image in self.book.images.all()}
+        self.assertEqual(len(images), 3)
+        self.assertNotIn(second.pk, images)
+        self.assertEqual(images[first.pk].image.name, names[first.pk])
+        self.assertEqual(images[third.pk].image.name, names[third.pk])
+        self.assertFalse(images[first.pk].is_cover)
+        self.assertTrue(images[third.pk].is_cover)
+        self.assertIn(names[second.pk], FileDeletion.objects.values_list('name', flat=True))
+        self.assertNotIn(names[first.pk], FileDeletion.objects.values_list('name', flat=True))
+
+    def test_images_left_out_are_untouched(self):
+        response = self.client.put(f'/books/{self.book.pk}/', {'title': 'Renamed', 'price': 5.0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.book.images.count(), 3)
+        self.assertFalse(FileDeletion.objects.exists())
+
+    def test_same_upload_matches_by_content(self):
+        first = Image.objects.get(pk=self.images[0].pk)
+        with first.image.open('rb') as file:
+            content = file.read()
+        data = {'images': [{'image': SimpleUploadedFile('again.png', content, 'image/png'), 'is_cover': True}]}
+        serializer = BookPostSerializer(self.book, data=data, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(list(self.book.images.values_list('pk', 'image')), [(first.pk, first.image.name)])
+
+    def test_ids_are_matched_before_content(self):
+        first = Image.objects.get(pk=self.images[0].pk)
+        with first.image.open('rb') as file:
+            content = file.read()
+        data = {'images': [{'image': SimpleUploadedFile('again.png', content, 'image/png'), 'is_cover': False},
+                           {'id': first.pk, 'is_cover': True}]}
+        serializer = BookPostSerializer(self.book, data=data, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        images = list(self.book.images.order_by('pk').values_list('pk', 'image', 'is_cover'))
+        self.assertEqual(images[0], (first.pk, first.image.name, True))
+        self.assertEqual(len(images), 2)
+        self.assertEqual(images[1][1:], (first.image.name, False))  # stored once, referenced twice
+
+    def test_queries_do_not_grow_with_images(self):
+        def count_queries():
+            images = [{'id': pk, 'is_cover': False} for pk in self.book.images.values_list('pk', flat=True)]
+            with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+                self.assertEqual(self.put(images + [{}]).status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        few = count_queries()
+        Image.objects.bulk_create([Image(book=self.book, is_cover=True) for _ in range(20)])
+        self.assertEqual(count_queries(), few)
+
+    def test_empty_list_removes_every_image(self):
+        names = [Image.objects.get(pk=image.pk).image.name for image in self.images]
+        self.assertEqual(self.put([]).status_code, status.HTTP_200_OK)
+        self.assertFalse(self.book.images.exists())
+        self.assertTrue(set(names) <= set(FileDeletion.objects.values_list('name', flat=True)))
+
+    def test_foreign_image_id_is_rejected(self):
+        other = Book.objects.create(title='Other', price=1.0, account=self.account)
+        image = Image.objects.create(book=other)
+        response = self.put([{'id': image.pk}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('images', response.data)
+        self.assertEqual(self.book.images.count(), 3)
+        self.assertTrue(Image.objects.filter(pk=image.pk, book=other).exists())
+
+    def test_image_ids_are_checked_during_validation(self):
+        first = self.images[0]
+        serializer = BookPostSerializer(self.book, data={'images': [{'id': first.pk}, {'id': first.pk}]}, partial=True)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['images'], [f'Image {first.pk} is listed more than once.'])
+
+        serializer = BookPostSerializer(data={'title': 'New', 'price': 1.0, 'images': [{'id': first.pk}]})
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['images'], [f'Image {first.pk} does not belong to this book.'])
+
+
+class BookStatusTransitionTestCase(APITestCase):
+    def setUp(self):
+        self.account = Account.objects.create_user(username='seller', password='testpassword123')
+        self.other = Account.objects.create_user(username='other', password='testpassword123')
+        self.client.force_authenticate(self.account)
+        self.book = Book.objects.create(title='Python', price=5.0, account=self.account)
+
+    def test_second_reservation_conflicts(self):
+        first, second = Book.objects.get(pk=self.book.pk), Book.objects.get(pk=self.book.pk)
+        first.mark_as_reserved()
+        with self.assertRaises(StatusConflict) as raised:
+            second.mark_as_reserved()
+        self.assertEqual((raised.exception.status, raised.exception.current), ('reserved', 'reserved'))
+        self.assertEqual(second.status, 'available')
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.status, 'reserved')
+
+    def test_queryset_transition(self):
+        books = [self.book, *(Book.objects.create(title=f'Book {n}', price=1.0, account=self.account,
+                                                  status=status) for n, status in enumerate(['sold', 'reserved']))]
+        with self.assertNumQueries(1):
+            changed = Book.objects.filter(account=self.account).transition('sold', ['available', 'reserved'])
+        self.assertEqual(changed, sorted([books[0].pk, books[2].pk]))
+        self.assertEqual(Book.objects.transition('sold'), [])
+        with self.assertRaises(ValueError):
+            Book.objects.transition('lost')
+
+    def test_status_endpoint(self):
+        url = f'/books/{self.book.pk}/status/'
+        response = self.client.patch(url, {'status': 'reserved', 'expected_status': 'available'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['data']['status'], 'reserved')
+
+        response = self.client.patch(url, {'status': 'reserved', 'expected_status': 'available'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['data'], {'id': self.book.pk, 'status': 'reserved'})
+        self.assertEqual(self.client.patch(url, {'status': 'lost'}, format='json').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.patch(url, {'status': 'sold'}, format='json').status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_mark_sold_twice_conflicts(self):
+        url = f'/books/{self.book.pk}/mark-sold/'
+        self.assertEqual(self.client.patch(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.patch(url).status_code, status.HTTP_409_CONFLICT)
+
+    def test_bulk_status(self):
+        reserved = Book.objects.create(title='Reserved', price=1.0, account=self.account, status='reserved')
+        foreign = Book.objects.create(title='Foreign', price=1.0, account=self.other)
+        deleted = Book.objects.create(title='Deleted', price=1.0, account=self.account)
+        deleted.soft_delete()
+        more = Book.objects.bulk_create([Book(title=f'Book {n}', price=1.0, account=self.account) for n in range(20)])
+        book_ids = [self.book.pk, reserved.pk, foreign.pk, deleted.pk, 999999, *(book.pk for book in more)]
+
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+            response = self.client.post('/books/mine/status/', {'book_ids': book_ids, 'status': 'reserved',
+                                                                'expected_status': 'available'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['data']['changed'], sorted([self.book.pk, *(book.pk for book in more)]))
+        self.assertEqual(response.data['data']['conflicts'], {reserved.pk: 'reserved'})
+        self.assertEqual(response.data['data']['unknown'], sorted([foreign.pk, deleted.pk, 999999]))
+        self.assertEqual(sum(query['sql'].lstrip().startswith('UPDATE') for query in queries), 1)
+        self.assertEqual(Book.objects.get(pk=foreign.pk).status, 'available')
+
+        response = self.client.post('/books/mine/status/', {'book_ids': [self.book.pk], 'status': 'reserved'},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.client.post('/books/mine/status/', {'book_ids': [self.book.pk, reserved.pk],
+                                                            'status': 'sold'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_transition_invalidates_cached_responses(self):
+        self.client.force_authenticate(None)
+        url = f'/books/{self.book.pk}/'
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        Book.objects.filter(pk=self.book.pk).transition('sold')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['status'], 'sold')
@@ -0,0 +1,169 @@
+"""
+Request throttling with token buckets.
+
+Every throttle is a token bucket holding up to ``N`` requests and refilled
+at ``N`` per period, from rates written like DRF's (``'30/min'``) in
+``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']``. A bucket is stored as one
+number, the time at which it will be full again (the "theoretical arrival
+time" of GCRA), so a check is a single cache read and, when the request is
+let through, a single write. DRF's own throttles keep and rewrite the list
+of every recent request's timestamp instead.
+
+Buckets live in the ``THROTTLE_CACHE_ALIAS`` cache: per process with
+locmem, shared by every worker with Redis. Concurrent requests for the same
+bucket may race between the read and the write and let a request or two
+more through; limits are meant to stop floods, not to count exactly.
+
+A rejected key is also remembered in the process until its bucket has room
+again, so a client that keeps hammering is turned away without touching
+the cache at all.
+
+- ``IPRateThrottle`` (``ip``): every request, per client address.
+- ``AccountRateThrottle`` (``account``): every authenticated request, per account.
+- ``SearchRateThrottle`` (``search``): requests with a ``?search=`` term.
+- ``WriteRateThrottle`` (``write``): unsafe methods, on views without a scope.
+- ``ScopedRateThrottle``: the view's ``throttle_scope`` (``register``, ``token``).
+
+The last three count per account for authenticated requests and per
+address otherwise. The address is ``REMOTE_ADDR`` unless
+``REST_FRAMEWORK['NUM_PROXIES']`` says how many ``X-Forwarded-For`` hops
+to trust.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+# Keys rejected by this process -> time their bucket has room again
+_blocked = {}
+_blocked_lock = threading.Lock()
+BLOCKED_MAX_ENTRIES = 10000
+
+
+def parse_rate(rate):
+    """'30/min' -> (30, 60.0); None -> None (not throttled)"""
+    if rate is None:
+        return None
+    count, period = rate.split('/')
+    return int(count), float(PERIODS[period[0]])
+
+
+def remember_blocked(key, until):
+    with _blocked_lock:
+        if len(_blocked) >= BLOCKED_MAX_ENTRIES:
+            now = time.time()
+            for stale in [stale for stale, expires in _blocked.items() if expires <= now]:
+                del _blocked[stale]
+            if len(_blocked) >= BLOCKED_MAX_ENTRIES:
+                _blocked.clear()
+        _blocked[key] = until
+
+
+def reset_throttles():
+    """Forget the remembered rejections and empty the throttle cache (tests)"""
+    with _blocked_lock:
+        _blocked.clear()
+    caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')].clear()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+    cache_prefix = 'throttle'
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_rate(self, view):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.get_scope(view))
+
+    def get_scope(self, view):
+        return self.scope
+
+    def applies(self, request, view):
+        return True
+
+    def get_ident_key(self, request):
+        """The account for authenticated requests, the client address otherwise"""
+        user = request.user
+        if user is not None and user.is_authenticated:
+            return f'account:{user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        if not self.applies(request, view):
+            return True
+        rate = parse_rate(self.get_rate(view))
+        if rate is None:
+            return True
+        count, period = rate
+        key = f'{self.cache_prefix}:{self.get_scope(view)}:{self.get_ident_key(request)}'
+
+        now = time.time()
+        blocked_until = _blocked.get(key)
+        if blocked_until is not None:
+            if blocked_until > now:
+                self.retry_after = blocked_until - now
+                return False
+            _blocked.pop(key, None)
+
+        interval = period / count
+        cache = caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+        full_at = max(cache.get(key) or now, now)
+        # The bucket is empty when it would take a whole period to refill it
+        if full_at + interval - now > period:
+            self.retry_after = full_at + interval - now - period
+            remember_blocked(key, now + self.retry_after)
+            return False
+        cache.set(key, full_at + interval, math.ceil(full_at + interval - now))
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class IPRateThrottle(TokenBucketThrottle):
+    scope = 'ip'
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+
+class AccountRateThrottle(TokenBucketThrottle):
+    scope = 'account'
+
+    def applies(self, request, view):
+        return request.user is not None and request.user.is_authenticated
+
+    def get_ident_key(self, request):
+        return str(request.user.pk)
+
+
+class SearchRateThrottle(TokenBucketThrottle):
+    scope = 'search'
+
+    def applies(self, request, view):
+        return bool(getattr(view, 'search_fields', None)) and bool(request.query_params.get(api_settings.SEARCH_PARAM))
+
+
+class WriteRateThrottle(TokenBucketThrottle):
+    scope = 'write'
+
+    def applies(self, request, view):
+        return request.method not in SAFE_METHODS and getattr(view, 'throttle_scope', None) is None
+
+
+class ScopedRateThrottle(TokenBucketThrottle):
+    """The limit named by the view's ``throttle_scope``, if it has one"""
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scope', None)
+
+    def applies(self, request, view):
+        return self.get_scope(view) is not None
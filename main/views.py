@@ -1,28 +1,37 @@
 from drf_yasg import openapi
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.views import APIView
 from rest_framework.status import *
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 
 from .serializers import *
+from .cache import CachedResponseMixin, response_cache
+from .conditional import ConditionalGetMixin, latest
+from .db import SerializedWritesMixin
+from .export import EXPORT_FORMATS, aiterate, export_rows
+from .facets import FacetMixin
+from .filters import BookFilter
+from .pagination import BookPagination
+from .query_planner import QueryPlanMixin
+from .routers import ReplicaReadMixin, current_replica
+from .search import FullTextSearchFilter
 from rest_framework.generics import *
 from rest_framework.permissions import IsAuthenticated, SAFE_METHODS, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
-
-
-class BookPagination(PageNumberPagination):
-    page_size = 12
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+from rest_framework_simplejwt.views import TokenObtainPairView
 
 
 class RegisterAPIView(CreateAPIView):
     queryset = Account.objects.all()
     serializer_class = AccountPostSerializer
+    throttle_scope = 'register'
 
     @swagger_auto_schema(
         operation_description="Register a new user account",
@@ -35,9 +44,10 @@ class RegisterAPIView(CreateAPIView):
     def post(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
 
-    def perform_create(self, serializer):
-        account = serializer.save()
-        WishList.objects.create(account=account)
+
+class AccountTokenObtainPairView(TokenObtainPairView):
+    # Every attempt hashes a password: limit guessing and CPU burn
+    throttle_scope = 'token'
 
 
 class UpdateAccountRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
@@ -67,13 +77,17 @@ class UpdateAccountRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
         return super().put(request, *args, **kwargs)
 
     def get_object(self):
+        # Users from stateless JWT authentication only carry their token claims
+        if self.request.user.get_deferred_fields():
+            return Account.objects.get(pk=self.request.user.pk)
         return self.request.user
 
 
-class BookListCreateAPIView(ListCreateAPIView):
-    queryset = Book.objects.filter(is_deleted=False)
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['status', 'account']
+class BookListCreateAPIView(SerializedWritesMixin, ReplicaReadMixin, CachedResponseMixin, ConditionalGetMixin,
+                            QueryPlanMixin, FacetMixin, ListCreateAPIView):
+    queryset = Book.objects.all()
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, OrderingFilter]
+    filterset_class = BookFilter
     search_fields = ['title', 'details']
     ordering_fields = ['price', 'created_at']
     pagination_class = BookPagination
@@ -98,13 +112,32 @@ class BookListCreateAPIView(ListCreateAPIView):
                 name='search',
                 in_=openapi.IN_QUERY,
                 type=openapi.TYPE_STRING,
-                description='Search in title and details'
+                description='Full-text search in title and details, ranked by relevance'
             ),
             openapi.Parameter(
                 name='ordering',
                 in_=openapi.IN_QUERY,
                 type=openapi.TYPE_STRING,
                 description='Order by field (e.g., price, created_at)'
+            ),
+            openapi.Parameter(
+                name='pagination',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description='Use "cursor" for keyset pagination (next/previous links, no count)',
+                enum=['page', 'cursor']
+            ),
+            openapi.Parameter(
+                name='facets',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description='Comma-separated facets (status, price) to count over the filtered set, or "true" for all'
+            ),
+            openapi.Parameter(
+                name='price_buckets',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description='Comma-separated price bucket boundaries for the price facet (e.g. 0,10,50)'
             )
         ],
         responses={
@@ -141,8 +174,73 @@ class BookListCreateAPIView(ListCreateAPIView):
         serializer.save(account=self.request.user)
 
 
-class BookRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
-    queryset = Book.objects.filter(is_deleted=False)
+class BookBulkCreateAPIView(SerializedWritesMixin, APIView):
+    permission_classes = [IsAuthenticated]
+    max_books = 500
+
+    @swagger_auto_schema(
+        operation_description="Create many books (with their images) in one request. "
+                              "Each item is validated on its own; valid items are written "
+                              "in a single transaction and the response reports every item.",
+        request_body=BookPostSerializer(many=True),
+        responses={
+            201: "All books created",
+            207: "Some books created, see per-item results",
+            400: "Bad Request - No valid books",
+            401: "Unauthorized"
+        }
+    )
+    def post(self, request):
+        items = request.data.get('books') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            response = {
+                "success": False,
+                'message': 'Expected a non-empty list of books.',
+            }
+            return Response(response, status=HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_books:
+            response = {
+                "success": False,
+                'message': f'At most {self.max_books} books can be created per request.',
+            }
+            return Response(response, status=HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            serializer = BookPostSerializer(data=item, context={'request': request})
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'index': index, 'success': False, 'errors': serializer.errors}
+
+        if valid:
+            with transaction.atomic():
+                books = BookPostSerializer.bulk_create(
+                    [validated_data for _, validated_data in valid],
+                    account=request.user
+                )
+                transaction.on_commit(lambda: response_cache.invalidate_books())
+            for (index, _), book in zip(valid, books):
+                results[index] = {'index': index, 'success': True, 'id': book.id}
+
+        if len(valid) == len(items):
+            status_code = HTTP_201_CREATED
+        elif valid:
+            status_code = HTTP_207_MULTI_STATUS
+        else:
+            status_code = HTTP_400_BAD_REQUEST
+        response = {
+            "success": len(valid) == len(items),
+            'message': f'Created {len(valid)} of {len(items)} books.',
+            'data': results
+        }
+        return Response(response, status=status_code)
+
+
+class BookRetrieveUpdateDestroyAPIView(SerializedWritesMixin, ReplicaReadMixin, CachedResponseMixin, ConditionalGetMixin,
+                                       QueryPlanMixin, RetrieveUpdateDestroyAPIView):
+    queryset = Book.objects.all()
     serializer_class = BookSerializer
 
     @swagger_auto_schema(
@@ -202,10 +300,10 @@ class BookRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
         instance.soft_delete()
 
 
-class MyBookListAPIView(ListAPIView):
+class MyBookListAPIView(ReplicaReadMixin, ConditionalGetMixin, QueryPlanMixin, ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = BookSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, OrderingFilter]
     filterset_fields = ['status']
     search_fields = ['title', 'details']
     ordering_fields = ['title', 'price', 'created_at']
@@ -231,10 +329,90 @@ class MyBookListAPIView(ListAPIView):
         return self.list(request, *args, **kwargs)
 
     def get_queryset(self):
-        return Book.objects.filter(account=self.request.user, is_deleted=False)
+        return Book.objects.filter(account=self.request.user)
+
+
+class BookExportAPIView(ReplicaReadMixin, GenericAPIView):
+    """
+    Streams the whole filtered catalog as CSV or NDJSON. Accepts the same
+    status/account/search/ordering parameters as the book list, but rows are
+    read with a chunked iterator and written out as they arrive, so memory
+    stays flat however many books match.
+    """
+    permission_classes = [IsAuthenticated]
+    queryset = Book.objects.all()
+    filter_backends = BookListCreateAPIView.filter_backends
+    filterset_class = BookListCreateAPIView.filterset_class
+    search_fields = BookListCreateAPIView.search_fields
+    ordering_fields = BookListCreateAPIView.ordering_fields
+    filename = 'books'
+
+    @swagger_auto_schema(
+        operation_description="Export books as CSV or NDJSON (export_format: csv or ndjson)",
+        responses={
+            200: "Streamed file",
+            401: "Unauthorized",
+            404: "Unknown export format"
+        }
+    )
+    def get(self, request, export_format):
+        if export_format not in EXPORT_FORMATS:
+            raise NotFound(f"Unknown export format '{export_format}'")
+        stream, content_type = EXPORT_FORMATS[export_format]
+        queryset = self.filter_queryset(self.get_queryset())
+        # The body is read after the middleware has ended the request's
+        # routing, so the replica has to be fixed on the queryset now
+        replica = current_replica()
+        if replica is not None:
+            queryset = queryset.using(replica)
+        chunks = stream(export_rows(queryset, request))
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiterate(chunks)
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{self.filename}.{export_format}"'
+        return response
+
+    def perform_content_negotiation(self, request, force=False):
+        # The body is written by the stream, not a renderer; never answer 406
+        return super().perform_content_negotiation(request, force=True)
+
+
+class MyBookExportAPIView(BookExportAPIView):
+    """Seller inventory export: the current user's books only"""
+    filterset_class = None
+    filterset_fields = MyBookListAPIView.filterset_fields
+    ordering_fields = MyBookListAPIView.ordering_fields
+    filename = 'my-books'
+
+    def get_queryset(self):
+        return Book.objects.filter(account=self.request.user)
+
 
+class BookStatusMixin:
+    """Compare-and-set status changes on the requester's own books"""
 
-class BookMarkSoldAPIview(APIView):
+    def change_status(self, request, pk, new_status, expected=None):
+        books = Book.objects.filter(id=pk, account=request.user)
+        expected = None if expected is None else [expected]
+        if not books.transition(new_status, expected):
+            current = books.values_list('status', flat=True).first()
+            if current is None:
+                raise NotFound()
+            response = {
+                "success": False,
+                'message': f'Book is {current}, it cannot be marked {new_status}.',
+                'data': {'id': pk, 'status': current}
+            }
+            return Response(response, status=HTTP_409_CONFLICT)
+        response = {
+            "success": True,
+            'message': f'Book marked as {new_status}.',
+            'data': BookSerializer(books.select_related('account').prefetch_related('images').get()).data
+        }
+        return Response(response, status=HTTP_200_OK)
+
+
+class BookMarkSoldAPIview(SerializedWritesMixin, BookStatusMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
@@ -243,21 +421,86 @@ class BookMarkSoldAPIview(APIView):
             200: BookSerializer,
             401: "Unauthorized",
             403: "Permission denied",
-            404: "Book not found"
+            404: "Book not found",
+            409: "Book is already sold"
+        }
+    )
+    def patch(self, request, pk):
+        return self.change_status(request, pk, 'sold')
+
+
+class BookStatusAPIView(SerializedWritesMixin, BookStatusMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Change a book's status. With expected_status the change only "
+                              "happens if the book is still in that status (e.g. two buyers "
+                              "reserving the same available book: one gets 409).",
+        request_body=BookStatusSerializer,
+        responses={
+            200: BookSerializer,
+            400: "Bad Request - Invalid data",
+            401: "Unauthorized",
+            404: "Book not found",
+            409: "Book is not in the expected status"
         }
     )
     def patch(self, request, pk):
-        book = get_object_or_404(Book, id=pk, account=request.user, is_deleted=False)
-        book.mark_as_sold()
+        serializer = BookStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self.change_status(
+            request, pk, serializer.validated_data['status'], serializer.validated_data.get('expected_status')
+        )
+
+
+class BookBulkStatusAPIView(SerializedWritesMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Change the status of many of your books with one UPDATE. Reports "
+                              "changed ids, conflicts (id -> current status: already in the new "
+                              "status, or not in expected_status) and unknown (missing, deleted "
+                              "or not yours) ids.",
+        request_body=BookBulkStatusSerializer,
+        responses={
+            200: "All books changed",
+            207: "Some books changed, see conflicts and unknown",
+            400: "Bad Request - Invalid data",
+            401: "Unauthorized",
+            409: "No book changed"
+        }
+    )
+    def post(self, request):
+        serializer = BookBulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        book_ids = set(serializer.validated_data['book_ids'])
+        new_status = serializer.validated_data['status']
+        expected = serializer.validated_data.get('expected_status')
+
+        books = Book.objects.filter(id__in=book_ids, account=request.user)
+        changed = books.transition(new_status, None if expected is None else [expected])
+        conflicts = dict(books.exclude(id__in=changed).values_list('id', 'status'))
+        unknown = book_ids - set(changed) - conflicts.keys()
+
+        if len(changed) == len(book_ids):
+            status_code = HTTP_200_OK
+        elif changed:
+            status_code = HTTP_207_MULTI_STATUS
+        else:
+            status_code = HTTP_409_CONFLICT
         response = {
-            "success": True,
-            'message': 'Book marked as sold.',
-            'data': BookSerializer(book).data
+            "success": len(changed) == len(book_ids),
+            'message': f'Marked {len(changed)} of {len(book_ids)} books as {new_status}.',
+            'data': {
+                'changed': changed,
+                'conflicts': {book_id: conflicts[book_id] for book_id in sorted(conflicts)},
+                'unknown': sorted(unknown),
+            }
         }
-        return Response(response, status=HTTP_200_OK)
+        return Response(response, status=status_code)
 
 
-class WishListAPIVIew(ListAPIView):
+class WishListAPIVIew(ReplicaReadMixin, ConditionalGetMixin, QueryPlanMixin, ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = BookSerializer
     pagination_class = BookPagination
@@ -274,10 +517,26 @@ class WishListAPIVIew(ListAPIView):
 
     def get_queryset(self):
         wishlist = get_object_or_404(WishList, account=self.request.user)
-        return wishlist.books.filter(is_deleted=False).order_by('title')
-
-
-class WishListAddBookAPIView(APIView):
+        return wishlist.books.order_by('title')
+
+    def get_list_validators(self):
+        # Membership changes touch WishList.updated_at (see signals)
+        live = Q(books__is_deleted=False)
+        aggregate = WishList.objects.filter(account=self.request.user).aggregate(
+            wishlist_updated_at=Max('updated_at'),
+            count=Count('books', filter=live),
+            updated_at=Max('books__updated_at', filter=live),
+            account_updated_at=Max('books__account__updated_at', filter=live),
+        )
+        if aggregate['wishlist_updated_at'] is None:
+            return None
+        last_modified = latest(
+            aggregate['wishlist_updated_at'], aggregate['updated_at'], aggregate['account_updated_at']
+        )
+        return tuple(aggregate.values()), last_modified
+
+
+class WishListAddBookAPIView(SerializedWritesMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
@@ -290,16 +549,16 @@ class WishListAddBookAPIView(APIView):
         }
     )
     def post(self, request, pk):
-        book = get_object_or_404(Book, id=pk, is_deleted=False)
-        wishlist = get_object_or_404(WishList, account=request.user)
-
-        if wishlist.add_book(book):
+        if WishList.objects.add_book(request.user, pk):
             response = {
                 "success": True,
                 'message': 'Book added to wishlist!',
             }
             return Response(response, status=HTTP_201_CREATED)
 
+        # Nothing was inserted: work out why only on this slow path
+        get_object_or_404(Book, id=pk)
+        get_object_or_404(WishList, account=request.user)
         response = {
             "success": False,
             'message': 'Book is already in wishlist.',
@@ -307,7 +566,7 @@ class WishListAddBookAPIView(APIView):
         return Response(response, status=HTTP_400_BAD_REQUEST)
 
 
-class WishListRemoveBookAPIView(APIView):
+class WishListRemoveBookAPIView(SerializedWritesMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
@@ -320,19 +579,91 @@ class WishListRemoveBookAPIView(APIView):
         }
     )
     def delete(self, request, pk):
-        book = get_object_or_404(Book, id=pk, is_deleted=False)
-        wishlist = get_object_or_404(WishList, account=request.user)
-
-        if wishlist.remove_book(book):
+        if WishList.objects.remove_book(request.user, pk):
             response = {
                 "success": True,
                 'message': "Book removed from wishlist."
             }
             return Response(response, status=HTTP_204_NO_CONTENT)
 
+        get_object_or_404(Book, id=pk)
+        get_object_or_404(WishList, account=request.user)
         response = {
             "success": False,
             'message': "Book is not in wishlist."
         }
         return Response(response, status=HTTP_400_BAD_REQUEST)
 
+
+class WishListBooksAPIView(SerializedWritesMixin, APIView):
+    """Base view for the set-based wishlist endpoints"""
+    permission_classes = [IsAuthenticated]
+    operation = None
+    message = None
+
+    def post(self, request):
+        serializer = WishListBooksSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            wishlist = get_object_or_404(WishList.objects.only('id'), account=request.user)
+            changes = getattr(wishlist, self.operation)(serializer.validated_data['book_ids'])
+        response = {
+            "success": True,
+            'message': self.message,
+            'data': changes
+        }
+        return Response(response, status=HTTP_200_OK)
+
+
+class WishListAddBooksAPIView(WishListBooksAPIView):
+    operation = 'add_books'
+    message = 'Books added to wishlist.'
+
+    @swagger_auto_schema(
+        operation_description="Add many books to wishlist. Reports added, unchanged "
+                              "(already in wishlist) and unknown (missing or deleted) ids.",
+        request_body=WishListBooksSerializer,
+        responses={
+            200: "Per-id result",
+            400: "Bad Request - Invalid data",
+            401: "Unauthorized"
+        }
+    )
+    def post(self, request):
+        return super().post(request)
+
+
+class WishListRemoveBooksAPIView(WishListBooksAPIView):
+    operation = 'remove_books'
+    message = 'Books removed from wishlist.'
+
+    @swagger_auto_schema(
+        operation_description="Remove many books from wishlist. Reports removed, unchanged "
+                              "(not in wishlist) and unknown (missing or deleted) ids.",
+        request_body=WishListBooksSerializer,
+        responses={
+            200: "Per-id result",
+            400: "Bad Request - Invalid data",
+            401: "Unauthorized"
+        }
+    )
+    def post(self, request):
+        return super().post(request)
+
+
+class WishListReplaceBooksAPIView(WishListBooksAPIView):
+    operation = 'replace_books'
+    message = 'Wishlist replaced.'
+
+    @swagger_auto_schema(
+        operation_description="Replace the wishlist with the given books. Reports added, "
+                              "removed and unknown (missing or deleted) ids.",
+        request_body=WishListBooksSerializer,
+        responses={
+            200: "Per-id result",
+            400: "Bad Request - Invalid data",
+            401: "Unauthorized"
+        }
+    )
+    def post(self, request):
+        return super().post(request)